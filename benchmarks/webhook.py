@@ -0,0 +1,116 @@
+"""Benchmark for the GitHub webhook body handling.
+
+Compares, on large push payloads, the original handler (read the body for the
+HMAC-SHA1 check, then read and decode it again through bottle.request.json)
+with webserver.gh_hook, which verifies the HMAC-SHA256 and HMAC-SHA1 signatures
+while reading the body once and decodes the JSON from the same buffer. Reports
+the time and the peak memory used to handle a request.
+
+Usage: uv run python -m benchmarks.webhook
+"""
+
+from central import config, webserver
+
+import bottle
+import hashlib
+import hmac
+import io
+import json
+import timeit
+import tracemalloc
+
+SECRET = b"benchmark"
+
+
+def push_payload(commits):
+    return json.dumps(
+        {
+            "ref": "refs/heads/master",
+            "before": "0" * 40,
+            "after": "1" * 40,
+            "repository": {"full_name": "dolphin-emu/dolphin"},
+            "pusher": {"name": "dolphin"},
+            "commits": [
+                {
+                    "id": "%040x" % i,
+                    "message": "Commit message %d\n\n%s" % (i, "x" * 400),
+                    "author": {"name": "Author", "email": "author@example.com"},
+                    "url": "https://github.com/dolphin-emu/dolphin/commit/%040x" % i,
+                    "added": ["Source/Core/File%d.cpp" % i],
+                    "removed": [],
+                    "modified": ["Source/Core/Core.cpp", "Source/Core/Core.h"],
+                }
+                for i in range(commits)
+            ],
+        }
+    ).encode("utf-8")
+
+
+def environ(payload):
+    return {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/gh/hook/",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(payload)),
+        "HTTP_X_GITHUB_EVENT": "push",
+        "HTTP_X_HUB_SIGNATURE": "sha1="
+        + hmac.new(SECRET, payload, hashlib.sha1).hexdigest(),
+        "HTTP_X_HUB_SIGNATURE_256": "sha256="
+        + hmac.new(SECRET, payload, hashlib.sha256).hexdigest(),
+        "wsgi.input": io.BytesIO(payload),
+    }
+
+
+def legacy_gh_hook():
+    """The handler before single-pass body handling, minus dispatching."""
+    payload = bottle.request.body.read()
+    received_sig = bottle.request.headers["X-Hub-Signature"].split("=", 1)[1]
+    computed_sig = hmac.new(SECRET, payload, hashlib.sha1).hexdigest()
+    if received_sig != computed_sig:
+        raise bottle.HTTPError(403, "Signature mismatch")
+    return bottle.request.json
+
+
+def bench(handler, payload, number):
+    def run():
+        bottle.request.bind(environ(payload))
+        handler()
+
+    return min(timeit.repeat(run, number=number, repeat=5)) / number
+
+
+def peak_memory(handler, payload):
+    """Returns the peak memory allocated while handling a request, minus the
+    payload itself."""
+    env = environ(payload)
+    tracemalloc.start()
+    bottle.request.bind(env)
+    handler()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    config.load(io.StringIO("github:\n    hook_hmac_secret: %s\n" % SECRET.decode()))
+    # The original handler needs the body to fit in MEMFILE_MAX.
+    bottle.BaseRequest.MEMFILE_MAX = 64 * 1024 * 1024
+    for commits in (100, 1000, 10000):
+        payload = push_payload(commits)
+        number = max(1, 2000 // commits)
+        legacy = bench(legacy_gh_hook, payload, number)
+        single = bench(webserver.gh_hook, payload, number)
+        print(
+            "%6.2f MB payload: legacy %8.2f ms, single pass %8.2f ms (%.1fx)"
+            % (len(payload) / 1e6, legacy * 1e3, single * 1e3, legacy / single)
+        )
+        legacy = peak_memory(legacy_gh_hook, payload)
+        single = peak_memory(webserver.gh_hook, payload)
+        print(
+            "%6.2f MB payload: legacy %8.2f MB, single pass %8.2f MB peak memory"
+            % (len(payload) / 1e6, legacy / 1e6, single / 1e6)
+        )
+
+
+if __name__ == "__main__":
+    main()
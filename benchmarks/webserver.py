@@ -0,0 +1,140 @@
+"""Load benchmark for the web server.
+
+Serves the webserver module routes with a given bottle server, then sends
+concurrent signed /gh/hook/ POSTs while another client slowly uploads a large
+Buildbot batch, and reports the webhook latencies. With the single-threaded
+wsgiref server, webhooks wait for the upload to complete.
+
+Usage: uv run python -m benchmarks.webserver [--clients N] [--requests N]
+"""
+
+from central import config, httpserver, utils, webserver
+
+import argparse
+import bottle
+import hashlib
+import hmac
+import http.client
+import io
+import json
+import socket
+import threading
+import time
+
+SECRET = "benchmark"
+CONFIG = """
+github:
+    hook_hmac_secret: %s
+""" % (
+    SECRET
+)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, port):
+    if name == "threadpool":
+        server = httpserver.ThreadPoolServer(host="127.0.0.1", port=port)
+    else:
+        server = bottle.server_names[name](host="127.0.0.1", port=port)
+    server.quiet = True
+    utils.DaemonThread(target=server.run, args=(bottle.default_app(),)).start()
+    for _ in range(500):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            return
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError("%s server did not start" % name)
+
+
+def slow_upload(port, size, duration):
+    """POSTs size bytes to /buildbot over duration seconds."""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    conn.putrequest("POST", "/buildbot")
+    conn.putheader("Content-Type", "application/json")
+    conn.putheader("Content-Length", str(size))
+    conn.endheaders()
+    chunk = 64 * 1024
+    chunks = size // chunk
+    body = b"[" + b" " * (size - 2) + b"]"
+    for i in range(chunks):
+        conn.send(body[i * chunk : (i + 1) * chunk])
+        time.sleep(duration / chunks)
+    conn.send(body[chunks * chunk :])
+    conn.getresponse().read()
+
+
+def hook_client(port, count, latencies):
+    payload = json.dumps({"zen": "Keep it logically awesome."}).encode("utf-8")
+    sig = hmac.new(SECRET.encode("ascii"), payload, hashlib.sha1).hexdigest()
+    headers = {
+        "Content-Type": "application/json",
+        "X-Hub-Signature": "sha1=" + sig,
+        "X-Github-Event": "ping",
+    }
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for _ in range(count):
+        start = time.perf_counter()
+        conn.request("POST", "/gh/hook/", payload, headers)
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - start)
+
+
+def bench(name, clients, requests, upload_size, upload_duration):
+    port = free_port()
+    start_server(name, port)
+
+    uploader = threading.Thread(
+        target=slow_upload, args=(port, upload_size, upload_duration)
+    )
+    uploader.start()
+    time.sleep(0.1)  # Let the upload get in first.
+
+    latencies = []
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=hook_client, args=(port, requests, latencies))
+        for _ in range(clients)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    uploader.join()
+
+    latencies.sort()
+    print(
+        "%-10s %6d req  %8.1f req/s  p50 %7.2f ms  p99 %7.2f ms  max %7.2f ms"
+        % (
+            name,
+            len(latencies),
+            len(latencies) / elapsed,
+            latencies[len(latencies) // 2] * 1e3,
+            latencies[int(len(latencies) * 0.99)] * 1e3,
+            latencies[-1] * 1e3,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", default="wsgiref,threadpool")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--upload-size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--upload-duration", type=float, default=2.0)
+    args = parser.parse_args()
+
+    config.load(io.StringIO(CONFIG))
+    for name in args.servers.split(","):
+        bench(name, args.clients, args.requests, args.upload_size, args.upload_duration)
+
+
+if __name__ == "__main__":
+    main()
@@ -109,6 +109,10 @@ def main():
 
     logging.info("Configuration loaded, starting modules initialization.")
 
+    # Configure event dispatching first: it applies to the targets registered
+    # by the modules when they start.
+    events.start()
+
     # Start the modules.
     for mod in [
         admin,
@@ -124,6 +128,10 @@ def main():
     ]:
         mod.start()
 
+    # Now that all targets are registered, redeliver the events left unhandled
+    # by the previous run.
+    events.dispatcher.replay_journal()
+
     logging.info("Modules started, waiting for events.")
 
     # Loop to wait for signals/exceptions.
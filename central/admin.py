@@ -10,13 +10,13 @@ import time
 
 
 class RebootListener(events.EventTarget):
-    def accept_event(self, evt):
-        return evt.type == events.CommandMessage.TYPE
-
     def push_event(self, evt):
         if not evt.what.endswith("reboot"):
             return
 
+        # Not to be replayed after the reboot.
+        events.dispatcher.defer_ack(evt)(durable=True)
+
         main_file = os.path.join(os.path.dirname(__file__), "central.py")
         argv = [sys.executable, main_file] + sys.argv[1:]
         if os.fork():
@@ -28,4 +28,4 @@ class RebootListener(events.EventTarget):
 
 def start():
     """Starts all the Admin related services."""
-    events.dispatcher.register_target(RebootListener())
+    events.dispatcher.register_target(RebootListener(), [events.CommandMessage.TYPE])
@@ -1,18 +1,14 @@
 """Buildbot module that handles communications between the Buildbot and
 GitHub."""
 
-from . import events, utils
+from . import events, github, utils
 from .config import cfg
 
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-
 import collections
 import json
 import logging
 import os
 import os.path
-import queue
 import re
 import requests
 
@@ -91,56 +87,91 @@ def send_build_request(build_request):
 
 class PullRequestBuilder:
     def __init__(self):
-        self.queue = queue.Queue()
+        # Builds of different PRs can run in parallel, but requests for the same
+        # PR are handled in order.
+        self.executor = events.dispatcher.make_executor(
+            "buildbot.PullRequestBuilder", self.handle, lambda item: item[1]()
+        )
 
-        retry = Retry(total=3, backoff_factor=2)
-        adapter = HTTPAdapter(max_retries=retry)
+    def push(self, on_behalf_of, trusted, repo, pr_id, ack, head_sha=None):
+        """Queues a build of a PR. ack is called once it has been handled.
+        head_sha, if known, is where errors are reported when the PR cannot be
+        fetched."""
+        self.executor.put(
+            (repo, pr_id), ((on_behalf_of, trusted, repo, pr_id, head_sha), ack)
+        )
 
-        session = requests.Session()
-        session.mount("http://", adapter)
-        session.mount("https://", adapter)
-        self.session = session
+    def handle(self, item):
+        request, ack = item
+        try:
+            self.build(request)
+        finally:
+            ack()
 
-    def push(self, on_behalf_of, trusted, repo, pr_id):
-        self.queue.put((on_behalf_of, trusted, repo, pr_id))
+    def build(self, item):
+        on_behalf_of, trusted, repo, pr_id, head_sha = item
 
-    def run(self):
-        while True:
-            on_behalf_of, trusted, repo, pr_id = self.queue.get()
+        try:
+            # To check if a PR is mergeable, we need to request it directly.
+            owner, name = repo.split("/")
+            pr = github.get_pull_request(owner, name, pr_id)
+        except Exception as e:
+            logging.exception("Could not fetch PR %s#%d", repo, pr_id)
+            # Statuses are set on a commit, which is unknown for rebuilds
+            # requested from comments or IRC.
+            if head_sha is None:
+                return
+            status_evt = events.BuildStatus(
+                repo,
+                head_sha,
+                head_sha[:6],
+                "default",
+                pr_id,
+                False,
+                False,
+                "",
+                "An error occurred while checking mergeability, please try again.",
+            )
+            events.dispatcher.dispatch("prbuilder", status_evt)
+            return
 
-            try:
-                # To check if a PR is mergeable, we need to request it directly.
-                pr = self.session.get(
-                    "https://api.github.com/repos/%s/pulls/%d" % (repo, pr_id)
-                ).json()
-            except Exception as e:
-                status_evt = events.BuildStatus(
-                    repo,
-                    head_sha,
-                    shortrev,
-                    "default",
-                    pr_id,
-                    False,
-                    False,
-                    "",
-                    "An error occurred while checking mergeability, please try again.",
-                )
-                events.dispatcher.dispatch("prbuilder", status_evt)
-                continue
+        logging.info(
+            "PR %s mergeable: %s (%s)",
+            pr_id,
+            pr["mergeable"],
+            pr["mergeable_state"],
+        )
 
-            logging.info(
-                "PR %s mergeable: %s (%s)",
+        base_sha = pr["base"]["sha"]
+        head_sha = pr["head"]["sha"]
+
+        shortrev = head_sha[:6]
+
+        if not trusted:
+            status_evt = events.BuildStatus(
+                repo,
+                head_sha,
+                shortrev,
+                "default",
                 pr_id,
-                pr["mergeable"],
-                pr["mergeable_state"],
+                False,
+                False,
+                "",
+                "PR not built because %s is not auto-trusted." % on_behalf_of,
             )
+            events.dispatcher.dispatch("prbuilder", status_evt)
+            return
 
-            base_sha = pr["base"]["sha"]
-            head_sha = pr["head"]["sha"]
-
-            shortrev = head_sha[:6]
+        if cfg.github.required_commits and repo in cfg.github.required_commits:
+            required_commit = getattr(cfg.github.required_commits, repo)
 
-            if not trusted:
+            try:
+                compare_url = pr["head"]["repo"]["compare_url"]
+                compare_result = github.client.get(
+                    compare_url.format(base=required_commit, head=pr["head"]["ref"]),
+                    org=owner,
+                ).json()
+            except Exception as e:
                 status_evt = events.BuildStatus(
                     repo,
                     head_sha,
@@ -150,51 +181,12 @@ class PullRequestBuilder:
                     False,
                     False,
                     "",
-                    "PR not built because %s is not auto-trusted." % on_behalf_of,
+                    "An error occurred while checking if the PR was up to date, please try again.",
                 )
                 events.dispatcher.dispatch("prbuilder", status_evt)
-                continue
-
-            if cfg.github.required_commits and repo in cfg.github.required_commits:
-                required_commit = getattr(cfg.github.required_commits, repo)
-
-                try:
-                    compare_url = pr["head"]["repo"]["compare_url"]
-                    compare_result = self.session.get(
-                        compare_url.format(base=required_commit, head=pr["head"]["ref"])
-                    ).json()
-                except Exception as e:
-                    status_evt = events.BuildStatus(
-                        repo,
-                        head_sha,
-                        shortrev,
-                        "default",
-                        pr_id,
-                        False,
-                        False,
-                        "",
-                        "An error occurred while checking if the PR was up to date, please try again.",
-                    )
-                    events.dispatcher.dispatch("prbuilder", status_evt)
-                    continue
-
-                if not compare_result["status"] in ["ahead", "identical"]:
-                    status_evt = events.BuildStatus(
-                        repo,
-                        head_sha,
-                        shortrev,
-                        "default",
-                        pr_id,
-                        False,
-                        False,
-                        "",
-                        "PR branch is too out-of-date, please rebase.",
-                    )
-                    events.dispatcher.dispatch("prbuilder", status_evt)
-                    continue
-
-            # mergeable can be None!
-            if pr["mergeable"] is False:
+                return
+
+            if not compare_result["status"] in ["ahead", "identical"]:
                 status_evt = events.BuildStatus(
                     repo,
                     head_sha,
@@ -204,47 +196,63 @@ class PullRequestBuilder:
                     False,
                     False,
                     "",
-                    "PR cannot be merged, please rebase.",
+                    "PR branch is too out-of-date, please rebase.",
                 )
                 events.dispatcher.dispatch("prbuilder", status_evt)
-                continue
+                return
 
+        # mergeable can be None!
+        if pr["mergeable"] is False:
             status_evt = events.BuildStatus(
                 repo,
                 head_sha,
                 shortrev,
                 "default",
                 pr_id,
-                True,
+                False,
                 False,
                 "",
-                "Very basic checks passed, handed off to Buildbot.",
+                "PR cannot be merged, please rebase.",
             )
             events.dispatcher.dispatch("prbuilder", status_evt)
+            return
 
-            for builder in cfg.buildbot.pr_builders or []:
-                status_evt = events.BuildStatus(
-                    repo,
-                    head_sha,
-                    shortrev,
-                    builder,
-                    pr_id,
-                    False,
-                    True,
-                    cfg.buildbot.url,
-                    "Auto build pending",
-                )
-                events.dispatcher.dispatch("prbuilder", status_evt)
+        status_evt = events.BuildStatus(
+            repo,
+            head_sha,
+            shortrev,
+            "default",
+            pr_id,
+            True,
+            False,
+            "",
+            "Very basic checks passed, handed off to Buildbot.",
+        )
+        events.dispatcher.dispatch("prbuilder", status_evt)
 
-            req = make_pr_build_request(
+        for builder in cfg.buildbot.pr_builders or []:
+            status_evt = events.BuildStatus(
                 repo,
-                pr_id,
-                base_sha,
                 head_sha,
-                "Central (on behalf of: %s)" % on_behalf_of,
-                "Auto build for PR #%d (%s)." % (pr_id, head_sha),
+                shortrev,
+                builder,
+                pr_id,
+                False,
+                True,
+                cfg.buildbot.url,
+                "Auto build pending",
             )
-            send_build_request(req)
+            events.dispatcher.dispatch("prbuilder", status_evt)
+
+        req = make_pr_build_request(
+            repo,
+            pr_id,
+            base_sha,
+            head_sha,
+            "Central (on behalf of: %s)" % on_behalf_of,
+            "Auto build for PR #%d (%s)." % (pr_id, head_sha),
+        )
+        send_build_request(req)
 
 
 class PullRequestListener(events.EventTarget):
@@ -254,13 +262,17 @@ class PullRequestListener(events.EventTarget):
         super(PullRequestListener, self).__init__()
         self.builder = builder
 
-    def accept_event(self, evt):
-        return evt.type == events.GHPullRequest.TYPE
-
     def push_event(self, evt):
         if evt.action == "opened" or evt.action == "synchronize":
             if evt.repo in cfg.github.maintain:
-                self.builder.push(evt.author, evt.safe_author, evt.repo, evt.id)
+                self.builder.push(
+                    evt.author,
+                    evt.safe_author,
+                    evt.repo,
+                    evt.id,
+                    events.dispatcher.defer_ack(evt),
+                    evt.head_sha,
+                )
 
 
 class ManualPullRequestListener(events.EventTarget):
@@ -271,9 +283,6 @@ class ManualPullRequestListener(events.EventTarget):
         super(ManualPullRequestListener, self).__init__()
         self.builder = builder
 
-    def accept_event(self, evt):
-        return evt.type == events.GHIssueComment.TYPE
-
     def push_event(self, evt):
         if not evt.safe_author:
             return
@@ -283,7 +292,13 @@ class ManualPullRequestListener(events.EventTarget):
             return
         if evt.action != "created":
             return
-        self.builder.push(evt.author, evt.safe_author, evt.repo, evt.id)
+        self.builder.push(
+            evt.author,
+            evt.safe_author,
+            evt.repo,
+            evt.id,
+            events.dispatcher.defer_ack(evt),
+        )
 
 
 class IRCRebuildListener(events.EventTarget):
@@ -293,9 +308,6 @@ class IRCRebuildListener(events.EventTarget):
         super(IRCRebuildListener, self).__init__()
         self.builder = builder
 
-    def accept_event(self, evt):
-        return evt.type == events.CommandMessage.TYPE
-
     def push_event(self, evt):
         matches = re.search(r"\brebuild (pr ?)?(?P<pr_id>\d+)\b", evt.what, re.I)
         if not matches:
@@ -305,58 +317,73 @@ class IRCRebuildListener(events.EventTarget):
             pr_id = int(pr_id)
         except ValueError:
             return
-        self.builder.push(evt.who, True, cfg.irc.rebuild_repo, pr_id)
+        self.builder.push(
+            evt.who, True, cfg.irc.rebuild_repo, pr_id, events.dispatcher.defer_ack(evt)
+        )
 
 
 class BuildStatusCollector:
     def __init__(self):
-        self.queue = queue.Queue()
-
-    def push(self, evt):
-        self.queue.put(evt)
-
-    def run(self):
-        while True:
-            evt = self.queue.get()
-            builder = evt.builder.name
-            props = utils.ObjectLike({k: v[0] for k, v in evt.properties.items()})
-            has_all_required = True
-            for required in ("headrev", "repo", "shortrev"):
-                if required not in props:
-                    has_all_required = False
-                    break
-            if not has_all_required:
-                continue
-            headrev = props.headrev
-            repo = props.repo
-            pr_id = props.pr_id
-            shortrev = props.shortrev
-            pending = not evt.complete
-            success = evt.results in (0, 1)  # SUCCESS/WARNING
-
-            if builder in cfg.buildbot.pr_builders:
-                if pending:
-                    description = "Auto build in progress on builder %s" % builder
-                elif success:
-                    description = "Build succeeded on builder %s" % builder
-                else:
-                    description = "Build failed on builder %s" % builder
-
-                evt = events.BuildStatus(
-                    repo,
-                    headrev,
-                    shortrev,
-                    builder,
-                    pr_id,
-                    success,
-                    pending,
-                    evt.url,
-                    description,
-                )
-                events.dispatcher.dispatch("buildbot", evt)
-            elif pr_id and builder in cfg.buildbot.fifoci_builders and success:
-                evt = events.PullRequestFifoCIStatus(repo, headrev, builder, pr_id)
-                events.dispatcher.dispatch("buildbot", evt)
+        self.executor = events.dispatcher.make_executor(
+            "buildbot.BuildStatusCollector", self.handle, lambda item: item[1]()
+        )
+
+    def push(self, evt, ack):
+        """Queues a Buildbot build update. ack is called once it has been
+        handled."""
+        # Keep updates for the same commit in order (e.g. a build starting then
+        # completing), and handle other commits in parallel.
+        props = evt.properties or {}
+        key = tuple(props[k][0] if k in props else None for k in ("repo", "headrev"))
+        self.executor.put(key, (evt, ack))
+
+    def handle(self, item):
+        evt, ack = item
+        try:
+            self.collect(evt)
+        finally:
+            ack()
+
+    def collect(self, evt):
+        builder = evt.builder.name
+        props = utils.ObjectLike({k: v[0] for k, v in evt.properties.items()})
+        has_all_required = True
+        for required in ("headrev", "repo", "shortrev"):
+            if required not in props:
+                has_all_required = False
+                break
+        if not has_all_required:
+            return
+        headrev = props.headrev
+        repo = props.repo
+        pr_id = props.pr_id
+        shortrev = props.shortrev
+        pending = not evt.complete
+        success = evt.results in (0, 1)  # SUCCESS/WARNING
+
+        if builder in cfg.buildbot.pr_builders:
+            if pending:
+                description = "Auto build in progress on builder %s" % builder
+            elif success:
+                description = "Build succeeded on builder %s" % builder
+            else:
+                description = "Build failed on builder %s" % builder
+
+            evt = events.BuildStatus(
+                repo,
+                headrev,
+                shortrev,
+                builder,
+                pr_id,
+                success,
+                pending,
+                evt.url,
+                description,
+            )
+            events.dispatcher.dispatch("buildbot", evt)
+        elif pr_id and builder in cfg.buildbot.fifoci_builders and success:
+            evt = events.PullRequestFifoCIStatus(repo, headrev, builder, pr_id)
+            events.dispatcher.dispatch("buildbot", evt)
 
 
 class BBHookListener(events.EventTarget):
@@ -364,20 +391,14 @@ class BBHookListener(events.EventTarget):
         super(BBHookListener, self).__init__()
         self.collector = collector
 
-    def accept_event(self, evt):
-        return evt.type == events.RawBBHook.TYPE
-
     def push_event(self, evt):
-        self.collector.push(evt.raw)
+        self.collector.push(evt.raw, events.dispatcher.defer_ack(evt))
 
 
 class NewDevVersionListener(events.EventTarget):
     def __init__(self):
         super().__init__()
 
-    def accept_event(self, evt):
-        return evt.type == events.NewDevVersion.TYPE
-
     def push_event(self, evt):
         req = make_dev_build_request(
             evt.branch, evt.hash, evt.shortrev, evt.author, evt.message
@@ -389,9 +410,6 @@ class NewReleaseVersionListener(events.EventTarget):
     def __init__(self):
         super().__init__()
 
-    def accept_event(self, evt):
-        return evt.type == events.NewReleaseVersion.TYPE
-
     def push_event(self, evt):
         req = make_release_build_request(evt.tag, evt.hash, evt.author)
         send_build_request(req)
@@ -401,14 +419,24 @@ def start():
     """Starts all the Buildbot related services."""
 
     pr_builder = PullRequestBuilder()
-    events.dispatcher.register_target(PullRequestListener(pr_builder))
-    events.dispatcher.register_target(ManualPullRequestListener(pr_builder))
-    events.dispatcher.register_target(IRCRebuildListener(pr_builder))
-    utils.DaemonThread(target=pr_builder.run).start()
+    events.dispatcher.register_target(
+        PullRequestListener(pr_builder), [events.GHPullRequest.TYPE]
+    )
+    events.dispatcher.register_target(
+        ManualPullRequestListener(pr_builder), [events.GHIssueComment.TYPE]
+    )
+    events.dispatcher.register_target(
+        IRCRebuildListener(pr_builder), [events.CommandMessage.TYPE]
+    )
 
     collector = BuildStatusCollector()
-    events.dispatcher.register_target(BBHookListener(collector))
-    utils.DaemonThread(target=collector.run).start()
+    events.dispatcher.register_target(
+        BBHookListener(collector), [events.RawBBHook.TYPE]
+    )
 
-    events.dispatcher.register_target(NewDevVersionListener())
-    events.dispatcher.register_target(NewReleaseVersionListener())
+    events.dispatcher.register_target(
+        NewDevVersionListener(), [events.NewDevVersion.TYPE]
+    )
+    events.dispatcher.register_target(
+        NewReleaseVersionListener(), [events.NewReleaseVersion.TYPE]
+    )
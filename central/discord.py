@@ -1,6 +1,6 @@
 """Discord client module that sends notifications to a Discord channel."""
 
-from . import events, utils
+from . import events, stats, utils
 from .config import cfg
 
 from pypeul import Tags
@@ -62,26 +62,26 @@ class EventTarget(events.EventTarget):
     def __init__(self, bot):
         self.bot = bot
         self.queue = queue.Queue()
+        stats.watch_queue("discord.EventTarget", self.queue)
 
     def push_event(self, evt):
-        self.queue.put(evt)
-
-    def accept_event(self, evt):
-        accepted_types = [
-            events.Notification.TYPE,
-            events.DevWark.TYPE,
-        ]
-        return evt.type in accepted_types
+        self.queue.put((evt, events.dispatcher.defer_ack(evt)))
 
     def run(self):
         while True:
-            evt = self.queue.get()
-            if evt.type == events.Notification.TYPE:
-                self.bot.send_notification(evt.msg)
-            elif evt.type == events.DevWark.TYPE:
-                self.bot.send_dev_wark(evt.accepted)
-            else:
-                logging.error("Got unknown event for discord: %r" % evt.type)
+            evt, ack = self.queue.get()
+            try:
+                self.handle(evt)
+            finally:
+                ack()
+
+    def handle(self, evt):
+        if evt.type == events.Notification.TYPE:
+            self.bot.send_notification(evt.msg)
+        elif evt.type == events.DevWark.TYPE:
+            self.bot.send_dev_wark(evt.accepted)
+        else:
+            logging.error("Got unknown event for discord: %r" % evt.type)
 
 
 def start():
@@ -100,5 +100,7 @@ def start():
     utils.DaemonThread(target=bot.run, kwargs={"token": cfg.discord.token}).start()
 
     evt_target = EventTarget(bot)
-    events.dispatcher.register_target(evt_target)
+    events.dispatcher.register_target(
+        evt_target, [events.Notification.TYPE, events.DevWark.TYPE]
+    )
     utils.DaemonThread(target=evt_target.run).start()
@@ -0,0 +1,181 @@
+"""In-memory history of the recent events, queryable by type, repository, pull
+request and commit.
+
+Events are serialized to JSON once when they are added. The history is a ring
+buffer capped in number of events and in total size of their JSON, with
+secondary indexes so that queries only look at the events matching their most
+selective filter.
+"""
+
+from . import utils
+
+import bisect
+import datetime
+import json
+import threading
+
+# Event fields holding the pull request number and the commit hash, per type.
+PR_FIELDS = {
+    "gh_pull_request": "id",
+    "gh_pull_request_review": "pr_id",
+    "gh_pull_request_comment": "id",
+    "gh_issue_comment": "id",
+    "build_status": "pr",
+    "pull_request_fifoci_status": "pr",
+}
+SHA_FIELDS = {
+    "gh_push": "after_sha",
+    "gh_pull_request": "head_sha",
+    "gh_pull_request_comment": "hash",
+    "gh_commit_comment": "commit",
+    "build_status": "hash",
+    "pull_request_fifoci_status": "hash",
+    "new_dev_version": "hash",
+    "new_release_version": "hash",
+}
+
+# Not shown on the status page, in the history or in the event stream: these
+# raw payloads are noise next to the events parsed from them.
+HIDDEN_TYPES = ("raw_redmine_hook",)
+
+# Rough per-event overhead of the history structures, in bytes.
+_ENTRY_OVERHEAD = 256
+
+
+def _json_default(value):
+    # Fields built from webhook payloads can nest views of them, e.g. the
+    # authors of GHPush commits.
+    if isinstance(value, (utils.ObjectLike, utils.ListLike)):
+        return value.wrapped()
+    return str(value)
+
+
+def event_json(evt, max_size):
+    """Serializes an event to JSON. Events longer than max_size characters are
+    reduced to their type and source, flagged as truncated."""
+    data = json.dumps(evt.as_dict(), default=_json_default)
+    if len(data) > max_size:
+        summary = {"type": evt.type, "source": evt.source, "truncated": True}
+        data = json.dumps(summary)
+    return data
+
+
+def index_keys(evt):
+    """Returns the (filter, value) keys an event is indexed under."""
+    keys = [("type", evt.type)]
+    for filter, field in (
+        ("repo", "repo"),
+        ("pr", PR_FIELDS.get(evt.type)),
+        ("sha", SHA_FIELDS.get(evt.type)),
+    ):
+        value = getattr(evt, field) if field is not None else None
+        if isinstance(value, (str, int)):
+            keys.append((filter, value))
+    return keys
+
+
+class _Index:
+    """Ordered list of event ids, from which the oldest ids are removed."""
+
+    __slots__ = ("ids", "start")
+
+    def __init__(self):
+        self.ids = []
+        self.start = 0
+
+    def __len__(self):
+        return len(self.ids) - self.start
+
+    def append(self, id):
+        self.ids.append(id)
+
+    def first(self):
+        return self.ids[self.start]
+
+    def popleft(self):
+        self.start += 1
+        # Only compact once in a while, to keep removals O(1) amortized.
+        if self.start > 64 and self.start * 2 > len(self.ids):
+            del self.ids[: self.start]
+            self.start = 0
+
+    def after(self, id):
+        """Iterates over the ids greater than id."""
+        ids = self.ids
+        for i in range(bisect.bisect_right(ids, id, self.start), len(ids)):
+            yield ids[i]
+
+
+class EventLog:
+    def __init__(self, max_events=100000, max_bytes=64 * 1024 * 1024):
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        # Larger events are only kept as a summary.
+        self.max_event_bytes = max(1024, max_bytes // 64)
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.size = 0
+        # Event id -> (JSON, size, index keys).
+        self.entries = {}
+        self.all = _Index()
+        self.indexes = {}
+
+    def add(self, evt, ts=None):
+        """Adds an event to the history and returns its id."""
+        ts = (ts or datetime.datetime.now()).isoformat()
+        data = event_json(evt, self.max_event_bytes)
+        keys = index_keys(evt)
+
+        with self.lock:
+            # Ids are assigned in insertion order, which keeps indexes sorted.
+            id = self.next_id
+            self.next_id += 1
+            data = '{"id": %d, "ts": "%s", "event": %s}' % (id, ts, data)
+            size = len(data) + _ENTRY_OVERHEAD
+            self.entries[id] = (data, size, keys)
+            self.size += size
+            self.all.append(id)
+            for key in keys:
+                index = self.indexes.get(key)
+                if index is None:
+                    index = self.indexes[key] = _Index()
+                index.append(id)
+            while len(self.entries) > self.max_events or self.size > self.max_bytes:
+                self._evict()
+        return id
+
+    def _evict(self):
+        id = self.all.first()
+        self.all.popleft()
+        _, size, keys = self.entries.pop(id)
+        self.size -= size
+        # The oldest event is also the first of each of its indexes.
+        for key in keys:
+            index = self.indexes[key]
+            index.popleft()
+            if not len(index):
+                del self.indexes[key]
+
+    def query(self, since=0, limit=100, **filters):
+        """Returns the (id, JSON) of up to limit events with an id greater than
+        since which match all the given filters (type, repo, pr, sha), oldest
+        first."""
+        filters = {k: v for k, v in filters.items() if v is not None}
+        with self.lock:
+            # Walk the smallest index, checking the other filters on its events.
+            candidates, selected = self.all, None
+            for key in filters.items():
+                index = self.indexes.get(key)
+                if index is None:
+                    return []
+                if len(index) < len(candidates):
+                    candidates, selected = index, key
+            others = [key for key in filters.items() if key != selected]
+            results = []
+            for id in candidates.after(since):
+                data, _, keys = self.entries[id]
+                if all(key in keys for key in others):
+                    results.append((id, data))
+                    if len(results) >= limit:
+                        break
+            return results
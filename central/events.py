@@ -1,10 +1,19 @@
 """Events module, including all the supported event constructors and the global
 event dispatcher."""
 
-from . import utils
+from . import journal, stats, utils
+from .config import cfg
 
+import collections
 import functools
+import itertools
 import logging
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
 
 
 class EventTarget:
@@ -15,41 +24,620 @@ class EventTarget:
         return False
 
 
+class _Spool:
+    """FIFO of pickled items backed by an anonymous temporary file."""
+
+    def __init__(self, dir=None):
+        if dir is not None:
+            os.makedirs(dir, exist_ok=True)
+        self.fp = tempfile.TemporaryFile(dir=dir)
+        self.read_pos = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, item):
+        data = pickle.dumps(item)
+        self.fp.seek(0, os.SEEK_END)
+        self.fp.write(struct.pack("<I", len(data)) + data)
+        self.count += 1
+
+    def popleft(self):
+        self.fp.seek(self.read_pos)
+        (size,) = struct.unpack("<I", self.fp.read(4))
+        item = pickle.loads(self.fp.read(size))
+        self.read_pos += 4 + size
+        self.count -= 1
+        if not self.count:
+            self.fp.seek(0)
+            self.fp.truncate()
+            self.read_pos = 0
+        return item
+
+
+# Event priorities, served in this order by the dispatching queues.
+HIGH = 0
+NORMAL = 1
+LOW = 2
+PRIORITIES = (HIGH, NORMAL, LOW)
+
+
+class BoundedQueue:
+    """Bounded queue with priority lanes and a configurable overflow policy.
+
+    get() returns items from the highest priority lane first, in FIFO order
+    within a lane. To avoid starvation, a lane which was passed over
+    starvation_limit times in a row while holding items gets served next.
+
+    When the queue is full, put() either blocks until an item is consumed
+    ("block"), discards the oldest item of the lowest priority lane, or the
+    new item if everything queued has a higher priority ("drop_oldest"), or
+    appends the item to a temporary file in spill_dir which is read back as
+    the queue drains ("spill"). Each lane spills to its own file, so that
+    spilled high priority items are still served first. Ordering within a
+    lane is preserved in all cases. Dropped items are passed to on_drop.
+    """
+
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+    def __init__(
+        self,
+        maxsize,
+        overflow="block",
+        spill_dir=None,
+        starvation_limit=8,
+        on_drop=None,
+    ):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError("Unknown queue overflow policy %r" % overflow)
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.starvation_limit = starvation_limit
+        self.on_drop = on_drop
+        self.lanes = [collections.deque() for _ in PRIORITIES]
+        self.skipped = [0 for _ in PRIORITIES]
+        self.size = 0
+        self.spools = [None for _ in PRIORITIES]
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    def qsize(self):
+        return self.size + sum(len(spool) for spool in self.spools if spool)
+
+    def put(self, item, priority=NORMAL):
+        # Note: this must not log (or call on_drop) while holding the lock,
+        # since log messages are themselves dispatched as events and could end
+        # up in this queue.
+        dropped = []
+        with self.lock:
+            spool = self.spools[priority]
+            if spool:
+                # Keep FIFO ordering until everything the lane spilled has
+                # been read back.
+                spool.append(item)
+                return
+            while self.size >= self.maxsize:
+                if self.overflow == "drop_oldest":
+                    lowest = max(p for p, lane in enumerate(self.lanes) if lane)
+                    if priority > lowest:
+                        # Everything queued is more important than the new
+                        # item.
+                        dropped.append(item)
+                        self.dropped += 1
+                        break
+                    dropped.append(self.lanes[lowest].popleft())
+                    self.size -= 1
+                    self.dropped += 1
+                elif self.overflow == "spill":
+                    if spool is None:
+                        spool = self.spools[priority] = _Spool(self.spill_dir)
+                    spool.append(item)
+                    return
+                else:
+                    self.not_full.wait()
+            else:
+                self.lanes[priority].append(item)
+                self.size += 1
+                self.not_empty.notify()
+        if self.on_drop is not None:
+            for item in dropped:
+                self.on_drop(item)
+
+    def _next_lane(self):
+        lanes, skipped = self.lanes, self.skipped
+        chosen = None
+        for priority, lane in enumerate(lanes):
+            if lane and skipped[priority] >= self.starvation_limit:
+                chosen = priority
+                break
+            if lane and chosen is None:
+                chosen = priority
+        for priority, lane in enumerate(lanes):
+            if priority == chosen or not lane:
+                skipped[priority] = 0
+            else:
+                skipped[priority] += 1
+        return lanes[chosen]
+
+    def get(self):
+        with self.lock:
+            while not self.size:
+                self.not_empty.wait()
+            # Items spilled while their lane was empty go before lower
+            # priority ones.
+            for lane, spool in zip(self.lanes, self.spools):
+                if spool and not lane:
+                    lane.append(spool.popleft())
+                    self.size += 1
+            item = self._next_lane().popleft()
+            self.size -= 1
+            # Read spilled items back, highest priority first.
+            for lane, spool in zip(self.lanes, self.spools):
+                while spool and self.size < self.maxsize:
+                    lane.append(spool.popleft())
+                    self.size += 1
+            if self.size < self.maxsize:
+                self.not_full.notify()
+            return item
+
+
+class QueueWorker(utils.DaemonThread):
+    """Thread passing every item of a BoundedQueue to a handler function."""
+
+    def __init__(self, handler, queue, name=None):
+        super().__init__(name=name)
+        self.handler = handler
+        self.queue = queue
+
+    def run_daemonized(self):
+        while True:
+            item = self.queue.get()
+            try:
+                self.handler(item)
+            except Exception:
+                logging.exception("%s failed to handle %r", self.name, item)
+
+
+class ShardedExecutor:
+    """Passes items to a handler from a number of worker threads, each with its
+    own BoundedQueue. Items with the same key always go to the same worker, so
+    they are handled in order, while items with different keys are handled in
+    parallel.
+
+    While items with a given key are queued, new items with that key go to the
+    same priority lane as them, whatever their own priority, so that they
+    cannot overtake them. Items with a None key are not ordered.
+    """
+
+    def __init__(
+        self,
+        handler,
+        name,
+        shards=1,
+        queue_size=1000,
+        overflow="block",
+        spill_dir=None,
+        starvation_limit=8,
+        on_drop=None,
+    ):
+        self.handler = handler
+        self.on_drop = on_drop
+        self.lock = threading.Lock()
+        # Key -> [priority lane, number of queued items] for keys with queued
+        # items.
+        self.pinned = {}
+        self.queues = []
+        for i in range(shards):
+            queue = BoundedQueue(
+                queue_size, overflow, spill_dir, starvation_limit, self._dropped
+            )
+            queue_name = name if shards == 1 else "%s:%d" % (name, i)
+            QueueWorker(self._handle, queue, name=queue_name).start()
+            stats.watch_queue(queue_name, queue)
+            self.queues.append(queue)
+
+    def _unpin(self, key):
+        if key is None:
+            return
+        with self.lock:
+            pinned = self.pinned[key]
+            pinned[1] -= 1
+            if not pinned[1]:
+                del self.pinned[key]
+
+    def _handle(self, entry):
+        key, item = entry
+        self._unpin(key)
+        self.handler(item)
+
+    def _dropped(self, entry):
+        key, item = entry
+        self._unpin(key)
+        if self.on_drop is not None:
+            self.on_drop(item)
+
+    def put(self, key, item, priority=NORMAL):
+        if key is not None:
+            with self.lock:
+                pinned = self.pinned.get(key)
+                if pinned is None:
+                    self.pinned[key] = [priority, 1]
+                else:
+                    priority = pinned[0]
+                    pinned[1] += 1
+        queues = self.queues
+        if len(queues) == 1:
+            queues[0].put((key, item), priority)
+        else:
+            queues[hash(key) % len(queues)].put((key, item), priority)
+
+    def qsize(self):
+        return sum(queue.qsize() for queue in self.queues)
+
+
+def _no_ack(durable=False):
+    pass
+
+
+def target_name(target):
+    """Returns the name used to refer to a target in the configuration, e.g.
+    "github.build_status.GHPRStatusUpdater"."""
+    module = type(target).__module__.removeprefix(__package__ + ".")
+    return "%s.%s" % (module, type(target).__qualname__)
+
+
 class Dispatcher:
-    def __init__(self, targets=None):
-        self.targets = targets or []
+    # accept_event calls are usually cheaper than timing them, so their latency
+    # is only measured on one dispatch out of this many.
+    ACCEPT_SAMPLING = 16
+    # Same for push_event calls, which mostly queue work for later.
+    PUSH_SAMPLING = 16
 
-    def register_target(self, target):
-        self.targets.append(target)
+    def __init__(self, targets=None):
+        self.targets = []
+        self.routes = {}
+        self.settings = utils.ObjectLike({})
+        self.journal = None
+        self.journal_skip_types = frozenset()
+        self.stats = stats.Recorder()
+        self.dispatch_counter = itertools.count()
+        self.push_counter = itertools.count()
+        # [event, seq, target name, deferred] of the journaled event being
+        # pushed to a target by the current thread.
+        self.local = threading.local()
+        for tgt in targets or []:
+            self.register_target(tgt)
+
+    def configure(self, settings):
+        """Sets the dispatching settings (the "events" configuration section).
+
+        Only applies to targets registered afterwards.
+        """
+        self.settings = settings
+        if settings.journal:
+            self.journal = journal.Journal(
+                settings.journal.path,
+                settings.journal.segment_size or 16 * 1024 * 1024,
+            )
+            skip_types = settings.journal.skip_types
+            if skip_types is None:
+                skip_types = [InternalLog.TYPE]
+            self.journal_skip_types = frozenset(skip_types)
+
+    def target_setting(self, name, key, default=None):
+        """Looks up a dispatching setting, preferring per-target overrides."""
+        overrides = self.settings.targets
+        if overrides is not None and name in overrides:
+            per_target = getattr(overrides, name)
+            if key in per_target:
+                return getattr(per_target, key)
+        if key in self.settings:
+            return getattr(self.settings, key)
+        return default
+
+    def make_executor(self, name, handler, on_drop=None, queue_name=None):
+        """Creates a ShardedExecutor for handler, sized by the dispatching
+        settings for name (shards, queue_size, overflow, spill_path and
+        starvation_limit). Items dropped on overflow are passed to on_drop.
+        Its queues are reported under queue_name, which defaults to name."""
+        return ShardedExecutor(
+            handler,
+            queue_name or name,
+            self.target_setting(name, "shards", 1),
+            self.target_setting(name, "queue_size", 1000),
+            self.target_setting(name, "overflow", "block"),
+            self.target_setting(name, "spill_path"),
+            self.target_setting(name, "starvation_limit", 8),
+            on_drop,
+        )
+
+    def register_target(self, target, types=None):
+        """Registers a target to receive dispatched events.
+
+        When types is given, the target receives every event of these types
+        and its accept_event method is never called. Otherwise accept_event is
+        consulted for every dispatched event, which allows targets to filter
+        dynamically.
+
+        With async_dispatch enabled, the target gets its own bounded queue and
+        worker thread calling push_event, and dispatching only enqueues. The
+        target can be given several workers (shards), in which case events are
+        spread across them by their shard_key.
+        """
+        if types is not None:
+            types = frozenset(types)
+
+        name = target_name(target)
+        queue = None
+        if self.target_setting(name, "async_dispatch", False):
+            handler = lambda item: self.push_to_target(target, name, *item)
+            on_drop = lambda item: self.dropped(name, *item)
+            # Not reported under the target name, which targets with their own
+            # queues use for them.
+            queue = self.make_executor(name, handler, on_drop, "dispatch:" + name)
+
+        self.targets.append((target, name, types, queue))
+        self.routes = {}
+
+    def route(self, type):
+        """Returns the (target, name, dynamic, queue) tuples an event type is
+        routed to, in registration order. Routes are computed once per type and
+        cached until the next target registration."""
+        routes = self.routes
+        route = routes.get(type)
+        if route is None:
+            route = [
+                (tgt, name, types is None, queue)
+                for tgt, name, types, queue in self.targets
+                if types is None or type in types
+            ]
+            routes[type] = route
+        return route
+
+    def defer_ack(self, evt):
+        """Called by a target from push_event when it hands evt over to its own
+        queue or thread: the event then only gets acknowledged in the journal
+        when the returned function is called, once actually handled, rather
+        than when push_event returns. The function can be pickled."""
+        delivery = getattr(self.local, "delivery", None)
+        if delivery is None or delivery[0] is not evt:
+            return _no_ack
+        delivery[3] = True
+        return journal.Ack(self.journal, delivery[1], delivery[2])
+
+    def push_to_target(self, tgt, name, evt, seq=None):
+        if seq is not None:
+            outer = getattr(self.local, "delivery", None)
+            delivery = self.local.delivery = [evt, seq, name, False]
+        sampled = next(self.push_counter) % self.PUSH_SAMPLING == 0
+        start = time.perf_counter() if sampled else None
+        failed = False
+        try:
+            tgt.push_event(evt)
+        except Exception:
+            failed = True
+            self.stats.increment((name, evt.type, "errors"))
+            logging.exception("Failed to pass event to %r" % tgt)
+        finally:
+            if sampled:
+                elapsed = time.perf_counter() - start
+                self.stats.observe((name, evt.type, "push"), elapsed)
+            # Failed events are acknowledged too: replaying them would most
+            # likely fail again.
+            if seq is not None:
+                self.local.delivery = outer
+                if failed or not delivery[3]:
+                    self.journal.ack(seq, name)
+
+    def dropped(self, name, evt, seq=None):
+        # Dropped events will not be handled any better after a restart.
+        self.stats.increment((name, evt.type, "dropped"))
+        if seq is not None:
+            self.journal.ack(seq, name)
+
+    def deliver(self, tgt, name, queue, evt, seq=None):
+        if queue is None:
+            self.push_to_target(tgt, name, evt, seq)
+        else:
+            queue.put(evt.shard_key(), (evt, seq), evt.PRIORITY)
 
     def dispatch(self, source, evt):
-        transmitted = {"source": source}
-        transmitted.update(evt)
-        transmitted = utils.ObjectLike(transmitted)
-        for tgt in self.targets:
+        evt.source = source
+        sampled = next(self.dispatch_counter) % self.ACCEPT_SAMPLING == 0
+        targets = []
+        for entry in self.route(evt.type):
+            tgt, name, dynamic, _ = entry
+            if dynamic:
+                start = time.perf_counter() if sampled else None
+                try:
+                    accepted = tgt.accept_event(evt)
+                except Exception:
+                    self.stats.increment((name, evt.type, "errors"))
+                    logging.exception("Failed to pass event to %r" % tgt)
+                    continue
+                finally:
+                    if sampled:
+                        elapsed = time.perf_counter() - start
+                        self.stats.observe((name, evt.type, "accept"), elapsed)
+                if not accepted:
+                    continue
+            targets.append(entry)
+
+        seq = None
+        if (
+            self.journal is not None
+            and targets
+            and evt.type not in self.journal_skip_types
+        ):
+            try:
+                seq = self.journal.append(evt, [name for _, name, _, _ in targets])
+            except Exception:
+                logging.exception("Failed to journal %s event" % evt.type)
+
+        for tgt, name, _, queue in targets:
             try:
-                if tgt.accept_event(transmitted):
-                    tgt.push_event(transmitted)
+                self.deliver(tgt, name, queue, evt, seq)
             except Exception:
+                self.stats.increment((name, evt.type, "errors"))
                 logging.exception("Failed to pass event to %r" % tgt)
-                continue
+
+    def statistics(self):
+        """Returns {target name: {event type: stats}}, where stats has the
+        "accept" and "push" latency histograms (sampled) and the "errors"
+        count, plus the "dropped" count for targets which dropped events."""
+        per_target = collections.defaultdict(
+            lambda: collections.defaultdict(lambda: {"errors": 0})
+        )
+        for (name, type, kind), hist in self.stats.histograms().items():
+            per_target[name][type][kind] = hist
+        for (name, type, kind), count in self.stats.counters().items():
+            per_target[name][type][kind] = count
+        return {name: dict(types) for name, types in per_target.items()}
+
+    def replay_journal(self):
+        """Redelivers the journaled events which were not acknowledged by all
+        the targets they were routed to, e.g. because of a restart. Must run
+        once all the targets are registered."""
+        if self.journal is None:
+            return
+        replay = self.journal.take_unacknowledged()
+        if replay:
+            logging.info("Replaying %d journaled events", len(replay))
+        for seq, evt, names in replay:
+            for tgt, name, _, queue in self.route(evt.type):
+                if name in names:
+                    names.discard(name)
+                    try:
+                        self.deliver(tgt, name, queue, evt, seq)
+                    except Exception:
+                        logging.exception("Failed to pass event to %r" % tgt)
+            # Targets which no longer exist will never acknowledge.
+            for name in names:
+                self.journal.ack(seq, name)
 
 
 dispatcher = Dispatcher()
 
-# Event constructors. Events are dictionaries, with the following keys being
-# mandatory:
-#   - type: The event type (string).
-#   - source: The event source (string).
+
+def start():
+    """Applies the dispatching configuration. Runs before the other modules
+    are started so that it covers all their targets."""
+    if cfg.events:
+        dispatcher.configure(cfg.events)
 
 
-def event(type):
+# Event constructors. Constructors decorated with @event return a dictionary of
+# the event fields, which is turned into an instance of the event class for
+# that type. All events have the following attributes:
+#   - type: The event type (string).
+#   - source: The event source (string), set when the event is dispatched.
+
+
+class Event:
+    """Base class of the per-type event classes created by @event.
+
+    Fields are stored in slots, and dictionaries are wrapped into ObjectLike
+    once at construction. Like with ObjectLike, missing fields read as None.
+    """
+
+    __slots__ = ("source",)
+    type = None
+    FIELDS = ()
+    KEY = None
+    PRIORITY = NORMAL
+
+    def __init__(self, **fields):
+        self.source = None
+        for name, value in fields.items():
+            if isinstance(value, dict):
+                value = utils.ObjectLike(value)
+            setattr(self, name, value)
+
+    def __getattr__(self, name):
+        # Only called for unset fields and unknown attributes.
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return None
+
+    def __contains__(self, name):
+        return name in ("type", "source") or name in self.FIELDS
+
+    def shard_key(self):
+        """Returns the values of the KEY fields, which identify the object
+        (repository, pull request, commit...) an event is about. Events with
+        the same key are handled in order by sharded targets."""
+        if self.KEY is None:
+            return None
+        return tuple(getattr(self, name) for name in self.KEY)
+
+    def as_dict(self):
+        d = {"source": self.source}
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, (utils.ObjectLike, utils.ListLike)):
+                value = value.wrapped()
+            d[name] = value
+        d["type"] = self.type
+        return d
+
+    def __repr__(self):
+        return repr(self.as_dict())
+
+    def __reduce__(self):
+        return (_restore_event, (type(self).__name__, self.type, self.as_dict()))
+
+
+_EVENT_CLASSES = {}
+_EVENT_CLASSES_LOCK = threading.Lock()
+# Event type -> class attributes given to the @event decorator.
+_EVENT_OPTIONS = {}
+
+
+def event_class(name, evt_type, fields):
+    """Returns the class for events of a given type. It is created when the
+    first event of that type is constructed, with a slot for each field."""
+    cls = _EVENT_CLASSES.get(evt_type)
+    if cls is None:
+        with _EVENT_CLASSES_LOCK:
+            cls = _EVENT_CLASSES.get(evt_type)
+            if cls is None:
+                fields = tuple(fields)
+                ns = {
+                    "__slots__": fields,
+                    "__module__": __name__,
+                    "type": evt_type,
+                    "FIELDS": fields,
+                }
+                ns.update(_EVENT_OPTIONS.get(evt_type, {}))
+                cls = type(name, (Event,), ns)
+                _EVENT_CLASSES[evt_type] = cls
+    return cls
+
+
+def _restore_event(name, evt_type, d):
+    d = dict(d)
+    source = d.pop("source")
+    del d["type"]
+    evt = event_class(name, evt_type, d)(**d)
+    evt.source = source
+    return evt
+
+
+def event(type, key=None, priority=NORMAL):
+    """Decorates an event constructor. key is a tuple of field names, used as
+    the shard key of the events. priority (HIGH, NORMAL or LOW) decides which
+    lane of the dispatching queues the events go through."""
+    _EVENT_OPTIONS[type] = {"KEY": key, "PRIORITY": priority}
+
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            evt = f(*args, **kwargs)
-            evt["type"] = type
-            return evt
+            fields = f(*args, **kwargs)
+            return event_class(f.__name__, type, fields)(**fields)
 
         wrapper.TYPE = type
         return wrapper
@@ -57,7 +645,7 @@ def event(type):
     return decorator
 
 
-@event("internal_log")
+@event("internal_log", priority=LOW)
 def InternalLog(level: str, pathname: str, lineno: int, msg: str, args: str):
     return {
         "level": level,
@@ -73,12 +661,12 @@ def ConfigReload():
     return {}
 
 
-@event("notification")
+@event("notification", priority=LOW)
 def Notification(msg: str):
     return {"msg": msg}
 
 
-@event("command_message")
+@event("command_message", priority=LOW)
 def CommandMessage(who: str, what: str):
     return {"who": who, "what": what}
 
@@ -88,7 +676,7 @@ def DevWark(accepted: bool):
     return {"accepted": accepted}
 
 
-@event("issue")
+@event("issue", key=("issue",), priority=LOW)
 def Issue(new: bool, update: int, issue: int, title: str, author: str):
     return {
         "new": new,
@@ -99,12 +687,12 @@ def Issue(new: bool, update: int, issue: int, title: str, author: str):
     }
 
 
-@event("raw_gh_hook")
+@event("raw_gh_hook", priority=HIGH)
 def RawGHHook(gh_type: str, raw: dict):
     return {"gh_type": gh_type, "raw": raw}
 
 
-@event("gh_push")
+@event("gh_push", key=("repo", "ref_name"))
 def GHPush(
     repo: str,
     pusher: str,
@@ -133,7 +721,7 @@ def GHPush(
     }
 
 
-@event("gh_pull_request")
+@event("gh_pull_request", key=("repo", "id"), priority=HIGH)
 def GHPullRequest(
     repo: str,
     author: str,
@@ -166,7 +754,7 @@ def GHPullRequest(
     }
 
 
-@event("gh_pull_request_review")
+@event("gh_pull_request_review", key=("repo", "pr_id"))
 def GHPullRequestReview(
     repo: str,
     author: str,
@@ -190,7 +778,7 @@ def GHPullRequestReview(
     }
 
 
-@event("gh_pull_request_comment")
+@event("gh_pull_request_comment", key=("repo", "id"))
 def GHPullRequestComment(
     repo: str,
     author: str,
@@ -211,7 +799,7 @@ def GHPullRequestComment(
     }
 
 
-@event("gh_issue_comment")
+@event("gh_issue_comment", key=("repo", "id"))
 def GHIssueComment(
     repo: str,
     author: str,
@@ -236,12 +824,17 @@ def GHIssueComment(
     }
 
 
-@event("gh_commit_comment")
+@event("gh_commit_comment", key=("repo", "commit"))
 def GHCommitComment(repo: str, author: str, commit: str, url: str):
     return {"repo": repo, "author": author, "commit": commit, "url": url}
 
 
-@event("build_status")
+@event("gh_team", key=("team",))
+def GHTeam(team: str, action: str, member: str):
+    return {"team": team, "action": action, "member": member}
+
+
+@event("build_status", key=("repo", "hash"), priority=HIGH)
 def BuildStatus(
     repo: str,
     hash: str,
@@ -266,22 +859,22 @@ def BuildStatus(
     }
 
 
-@event("pull_request_fifoci_status")
+@event("pull_request_fifoci_status", key=("repo", "pr"), priority=HIGH)
 def PullRequestFifoCIStatus(repo: str, hash: str, service: str, pr: int):
     return {"repo": repo, "hash": hash, "service": service, "pr": pr}
 
 
-@event("raw_bb_hook")
+@event("raw_bb_hook", priority=HIGH)
 def RawBBHook(raw: dict):
     return {"raw": raw}
 
 
-@event("raw_redmine_hook")
+@event("raw_redmine_hook", priority=LOW)
 def RawRedmineHook(rm_type: str, raw: dict):
     return {"rm_type": rm_type, "raw": raw}
 
 
-@event("new_dev_version")
+@event("new_dev_version", key=("hash",))
 def NewDevVersion(
     hash: str, branch: str, shortrev: str, author: str, message: str, url: str
 ):
@@ -295,7 +888,7 @@ def NewDevVersion(
     }
 
 
-@event("new_release_version")
+@event("new_release_version", key=("tag",))
 def NewReleaseVersion(hash: str, tag: str, author: str):
     return {
         "hash": hash,
@@ -1,7 +1,7 @@
 """Library to maintain a local Git repository clone in order to extract metadata and enrich
 information received from GitHub."""
 
-from . import events, utils
+from . import events, stats, utils
 from .config import cfg
 
 import logging
@@ -74,9 +74,11 @@ class RepoManager:
         self.repo = GitRepository(self.path)
 
         self.queue = queue.Queue()
+        stats.watch_queue("git.RepoManager:" + repo_name, self.queue)
 
-    def handle_push(self, push_evt):
-        self.queue.put(push_evt)
+    def handle_push(self, push_evt, ack):
+        """Queues a push event. ack is called once it has been handled."""
+        self.queue.put((push_evt, ack))
 
     def reset_repo(self):
         logging.info("[%s] cloning from %s", self.repo_name, self.repo_url)
@@ -101,67 +103,68 @@ class RepoManager:
         self.reset_repo()
 
         while True:
-            evt = self.queue.get()
+            evt, ack = self.queue.get()
+            try:
+                self.process_push(evt)
+            finally:
+                ack()
+
+    def process_push(self, evt):
+        self.repo.fetch()
+
+        if evt.ref_type == "tags" and evt.created:
+            commit_hash = self.repo.commit_log("refs/tags/%s" % evt.ref_name, "%H")
+
+            logging.info(
+                "[%s] tag %s created by %s",
+                self.repo_name,
+                evt.ref_name,
+                evt.pusher,
+            )
 
-            self.repo.fetch()
+            release_ver_evt = events.NewReleaseVersion(
+                commit_hash, evt.ref_name, evt.pusher
+            )
+            events.dispatcher.dispatch("repomanager", release_ver_evt)
+        else:
+            commits = [utils.ObjectLike(c) for c in evt.commits]
+            distinct_commits = [c for c in commits if c.distinct and c.message.strip()]
+            logging.info(
+                "[%s] push received with %d commits",
+                self.repo_name,
+                len(distinct_commits),
+            )
 
-            if evt.ref_type == "tags" and evt.created:
-                commit_hash = self.repo.commit_log("refs/tags/%s" % evt.ref_name, "%H")
+            for commit in distinct_commits:
+                branch = self.determine_branch(commit)
+                if branch is None:
+                    logging.info(
+                        "[%s] skipping commit %s, not on a named branch",
+                        self.repo_name,
+                        commit.hash,
+                    )
+                    continue
 
-                logging.info(
-                    "[%s] tag %s created by %s",
-                    self.repo_name,
-                    evt.ref_name,
-                    evt.pusher,
-                )
+                desc = self.repo.git_cli("describe", "--always", "--long", commit.hash)
+                shortrev = desc.rsplit("-", 1)[0]
+
+                author = self.repo.commit_log(commit.hash, "%an")
+                comment = self.repo.commit_log(commit.hash, "%s\n\n%b")
+                url = f"https://github.com/{self.repo_name}/commit/{commit.hash}"
 
-                release_ver_evt = events.NewReleaseVersion(
-                    commit_hash, evt.ref_name, evt.pusher
-                )
-                events.dispatcher.dispatch("repomanager", release_ver_evt)
-            else:
-                commits = [utils.ObjectLike(c) for c in evt.commits]
-                distinct_commits = [
-                    c for c in commits if c.distinct and c.message.strip()
-                ]
                 logging.info(
-                    "[%s] push received with %d commits",
+                    "[%s] commit %s: (%s) %s from %s",
                     self.repo_name,
-                    len(distinct_commits),
+                    commit.hash[:8],
+                    branch,
+                    shortrev,
+                    author,
                 )
 
-                for commit in distinct_commits:
-                    branch = self.determine_branch(commit)
-                    if branch is None:
-                        logging.info(
-                            "[%s] skipping commit %s, not on a named branch",
-                            self.repo_name,
-                            commit.hash,
-                        )
-                        continue
-
-                    desc = self.repo.git_cli(
-                        "describe", "--always", "--long", commit.hash
-                    )
-                    shortrev = desc.rsplit("-", 1)[0]
-
-                    author = self.repo.commit_log(commit.hash, "%an")
-                    comment = self.repo.commit_log(commit.hash, "%s\n\n%b")
-                    url = f"https://github.com/{self.repo_name}/commit/{commit.hash}"
-
-                    logging.info(
-                        "[%s] commit %s: (%s) %s from %s",
-                        self.repo_name,
-                        commit.hash[:8],
-                        branch,
-                        shortrev,
-                        author,
-                    )
-
-                    dev_ver_evt = events.NewDevVersion(
-                        commit.hash, branch, shortrev, author, comment, url
-                    )
-                    events.dispatcher.dispatch("repomanager", dev_ver_evt)
+                dev_ver_evt = events.NewDevVersion(
+                    commit.hash, branch, shortrev, author, comment, url
+                )
+                events.dispatcher.dispatch("repomanager", dev_ver_evt)
 
 
 class PushListener(events.EventTarget):
@@ -169,12 +172,9 @@ class PushListener(events.EventTarget):
         super().__init__()
         self.repos = repos
 
-    def accept_event(self, evt):
-        return evt.type == events.GHPush.TYPE
-
     def push_event(self, evt):
         if evt.repo in self.repos:
-            self.repos[evt.repo].handle_push(evt)
+            self.repos[evt.repo].handle_push(evt, events.dispatcher.defer_ack(evt))
 
 
 def start():
@@ -189,4 +189,4 @@ def start():
     for manager in repos.values():
         utils.DaemonThread(target=manager.run).start()
 
-    events.dispatcher.register_target(PushListener(repos))
+    events.dispatcher.register_target(PushListener(repos), [events.GHPush.TYPE])
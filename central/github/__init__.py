@@ -1,76 +1,100 @@
-from . import app, authz, build_status, fifoci_reporter, webhooks
+from . import app, authz, build_status, client, fifoci_reporter, webhooks
 
-from .. import utils
+from .. import events, utils
 from ..config import cfg
 
-import json
-import requests
-
 
 def get_pull_request(owner, repo, pr_id):
-    return requests.get(
-        "https://api.github.com/repos/%s/%s/pulls/%s" % (owner, repo, pr_id)
-    ).json()
-
-
-def get_pull_request_comments(pr):
+    return client.get("/repos/%s/%s/pulls/%s" % (owner, repo, pr_id), org=owner).json()
+
+
+_PULL_REQUEST_CONTEXT_QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $before: String) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      headRefOid
+      comments(last: 100, before: $before) {
+        nodes { databaseId body viewerDidAuthor }
+        pageInfo { hasPreviousPage startCursor }
+      }
+    }
+  }
+}
+"""
+
+
+def get_pull_request_context(owner, repo, pr_id):
+    """Returns the head commit of a PR and the comments posted on it by the
+    app, oldest first, in a single GraphQL request for most PRs."""
+    variables = {"owner": owner, "name": repo, "number": pr_id, "before": None}
     comments = []
-    url = pr["_links"]["comments"]["href"]
     while True:
-        r = requests.get(url)
-        comments.extend(r.json())
-        if "link" in r.headers and "next" in r.links:
-            url = r.links["next"]["url"]
-        else:
+        data = client.graphql(
+            _PULL_REQUEST_CONTEXT_QUERY, variables, org=owner, priority=events.LOW
+        )
+        pr = data["repository"]["pullRequest"]
+        page = pr["comments"]
+        # The app is the viewer: its comments are the ones it authored.
+        comments[:0] = [
+            {"id": c["databaseId"], "body": c["body"]}
+            for c in page["nodes"]
+            if c["viewerDidAuthor"]
+        ]
+        if not page["pageInfo"]["hasPreviousPage"]:
             break
-    return comments
+        variables["before"] = page["pageInfo"]["startCursor"]
+    return {"head_sha": pr["headRefOid"], "comments": comments}
 
 
 def delete_comment(owner, repo, cmt_id):
-    requests.delete(
-        "https://api.github.com/repos/%s/%s/issues/comments/%d" % (owner, repo, cmt_id),
-        auth=app.OrgAuth(owner),
+    client.delete(
+        "/repos/%s/%s/issues/comments/%d" % (owner, repo, cmt_id),
+        org=owner,
+        priority=events.LOW,
+    )
+
+
+def edit_comment(owner, repo, cmt_id, body):
+    r = client.patch(
+        "/repos/%s/%s/issues/comments/%d" % (owner, repo, cmt_id),
+        json={"body": body},
+        org=owner,
+        priority=events.LOW,
     )
+    r.raise_for_status()
 
 
 def post_comment(owner, repo, pr_id, body):
-    requests.post(
-        "https://api.github.com/repos/%s/%s/issues/%s/comments" % (owner, repo, pr_id),
-        data=json.dumps({"body": body}),
-        headers={"Content-Type": "application/json"},
-        auth=app.OrgAuth(owner),
+    """Posts a comment on an issue or PR and returns its id."""
+    r = client.post(
+        "/repos/%s/%s/issues/%s/comments" % (owner, repo, pr_id),
+        json={"body": body},
+        org=owner,
+        priority=events.LOW,
     )
+    r.raise_for_status()
+    return r.json()["id"]
 
 
 def get_pr_review_comments(owner, repo, pr_id, review_id):
-    json = requests.get(
-        "https://api.github.com/repos/%s/%s/pulls/%d/reviews/%d/comments"
-        % (owner, repo, pr_id, review_id),
+    json = client.get(
+        "/repos/%s/%s/pulls/%d/reviews/%d/comments" % (owner, repo, pr_id, review_id),
         headers={
-            "Content-Type": "application/json",
             # This API is currently in preview so we need to specify this,
             # but it will continue to work after the preview period ends.
             "Accept": "application/vnd.github.black-cat-preview+json",
         },
-        auth=app.OrgAuth(owner),
+        org=owner,
     ).json()
     return [utils.ObjectLike(c) for c in json]
 
 
-def request_get_all(url, **kwargs):
-    """Github uses Link header for pagination, this loops through all pages."""
-    data = []
-    r = requests.get(url, **kwargs)
-    data += r.json()
-    while "next" in r.links:
-        r = requests.get(r.links["next"]["url"], **kwargs)
-        data += r.json()
-    return data
-
-
 def start():
     """Starts all the GitHub related services."""
 
+    if cfg.github.client:
+        client.configure(cfg.github.client)
+
     # Start first to ensure app-based authorization is available to all other
     # modules.
     app.start()
@@ -1,16 +1,27 @@
-from .. import utils
+from . import client
+from .. import events, utils
 from ..config import cfg
 
-import json
+import datetime
 import jwt
 import logging
 import requests
+import threading
 import time
 
 _AUTH_MANAGER = None
 _JWT_EXPIRY_SECS = 600
 _INSTALL_TOKEN_EXPIRY_SECS = 3600
 
+# Tokens are renewed in the background once they have less than *_REFRESH_SECS
+# of validity left, and on the request path below *_MIN_VALIDITY_SECS.
+_REFRESH_INTERVAL_SECS = 60
+_APP_JWT_REFRESH_SECS = 300
+_APP_JWT_MIN_VALIDITY_SECS = 60
+_INSTALL_TOKEN_REFRESH_SECS = 900
+_INSTALL_TOKEN_MIN_VALIDITY_SECS = 120
+_INSTALLATIONS_REFRESH_SECS = 3600
+
 _EXPECTED_PERMS = {
     "checks": "write",
     "contents": "read",
@@ -25,23 +36,46 @@ _EXPECTED_WEBHOOK_EVENTS = [
     "check_run",
     "commit_comment",
     "issue_comment",
+    "membership",
     "pull_request",
     "pull_request_review",
     "pull_request_review_comment",
     "push",
+    "team",
 ]
 
 
+class _Token:
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+
+
 class AuthManager:
+    """Mints and caches the app JWT and the installation access tokens.
+
+    Tokens are renewed by a background thread well before they expire, so that
+    requests do not wait for them. A token only gets minted on the request path
+    when it is missing or about to expire, and then by a single thread.
+    """
+
     def __init__(self, app_id, app_priv_key_path):
         self.app_id = str(app_id)
         with open(app_priv_key_path, "rb") as fp:
             self.app_pkey = jwt.jwk_from_pem(fp.read())
 
+        self.lock = threading.Lock()
+        self.jwt_lock = threading.Lock()
+        self.installs_lock = threading.Lock()
+        self.org_locks = {}
+
         self.cached_app_jwt = None
         self.cached_app_jwt_deadline = 0
 
         self.org_installs = {}
+        self.installs_updated = 0
         self.org_tokens = {}
 
         self._update_installations()
@@ -49,52 +83,104 @@ class AuthManager:
     def _update_installations(self):
         new_org_installs = {}
 
-        installs = requests.get(
-            "https://api.github.com/app/installations", auth=AppAuth(auth_manager=self)
-        ).json()
+        installs = client.get_all(
+            "/app/installations",
+            auth=AppAuth(auth_manager=self),
+            priority=events.HIGH,
+        )
         for install in installs:
             if install["target_type"].lower() == "organization":
                 new_org_installs[install["account"]["login"]] = install["id"]
 
         self.org_installs = new_org_installs
+        self.installs_updated = time.time()
 
     @property
     def app_jwt(self):
-        t = int(time.time())
-        if t < self.cached_app_jwt_deadline:
+        if time.time() < self.cached_app_jwt_deadline - _APP_JWT_MIN_VALIDITY_SECS:
             return self.cached_app_jwt
-
-        payload = {
-            "iat": t,
-            "exp": t + _JWT_EXPIRY_SECS,
-            "iss": self.app_id,
-        }
-        self.cached_app_jwt = jwt.JWT().encode(payload, self.app_pkey, alg="RS256")
-        self.cached_app_jwt_deadline = t + int(_JWT_EXPIRY_SECS * 0.8)
-        return self.cached_app_jwt
-
-    def org_token(self, org):
+        return self._mint_app_jwt(_APP_JWT_MIN_VALIDITY_SECS)
+
+    def _mint_app_jwt(self, min_validity):
+        with self.jwt_lock:
+            t = int(time.time())
+            # Minted by another thread in the meantime.
+            if t < self.cached_app_jwt_deadline - min_validity:
+                return self.cached_app_jwt
+
+            payload = {
+                "iat": t,
+                "exp": t + _JWT_EXPIRY_SECS,
+                "iss": self.app_id,
+            }
+            app_jwt = jwt.JWT().encode(payload, self.app_pkey, alg="RS256")
+            self.cached_app_jwt, self.cached_app_jwt_deadline = (
+                app_jwt,
+                t + _JWT_EXPIRY_SECS,
+            )
+            return app_jwt
+
+    def _installation_id(self, org):
         if org not in self.org_installs:
-            self._update_installations()
+            with self.installs_lock:
+                if org not in self.org_installs:
+                    self._update_installations()
             if org not in self.org_installs:
                 raise RuntimeError(f"App is not installed for org {org}")
-        iid = self.org_installs[org]
+        return self.org_installs[org]
 
-        t = time.time()
-        if org in self.org_tokens:
-            tok, deadline = self.org_tokens[org]
-            if t < deadline:
-                return tok
-
-        res = requests.post(
-            f"https://api.github.com/app/installations/{iid}/access_tokens",
-            auth=AppAuth(auth_manager=self),
-            data="{}",
-        ).json()
-        tok = res["token"]
-        deadline = t + _INSTALL_TOKEN_EXPIRY_SECS * 0.8
-        self.org_tokens[org] = (tok, deadline)
-        return tok
+    def org_token(self, org):
+        token = self.org_tokens.get(org)
+        if token is not None and time.time() < (
+            token.expires_at - _INSTALL_TOKEN_MIN_VALIDITY_SECS
+        ):
+            return token.value
+        return self._mint_org_token(org, _INSTALL_TOKEN_MIN_VALIDITY_SECS)
+
+    def _mint_org_token(self, org, min_validity):
+        """Mints a token for the installation of the app for org, unless the
+        current one is valid for at least min_validity seconds. Only one token
+        is minted at once for an org."""
+        with self.lock:
+            org_lock = self.org_locks.setdefault(org, threading.Lock())
+        with org_lock:
+            t = time.time()
+            token = self.org_tokens.get(org)
+            if token is not None and t < token.expires_at - min_validity:
+                return token.value
+
+            iid = self._installation_id(org)
+            r = client.post(
+                f"/app/installations/{iid}/access_tokens",
+                auth=AppAuth(auth_manager=self),
+                json={},
+                priority=events.HIGH,
+            )
+            r.raise_for_status()
+            res = r.json()
+            try:
+                expires_at = datetime.datetime.strptime(
+                    res["expires_at"], "%Y-%m-%dT%H:%M:%SZ"
+                )
+                expires_at = expires_at.replace(tzinfo=datetime.timezone.utc)
+                expires_at = expires_at.timestamp()
+            except (KeyError, TypeError, ValueError):
+                expires_at = t + _INSTALL_TOKEN_EXPIRY_SECS
+            self.org_tokens[org] = _Token(res["token"], expires_at)
+            return res["token"]
+
+    def refresh(self):
+        """Renews the app JWT and the installation tokens which are getting
+        close to their expiry, and the list of installations."""
+        self._mint_app_jwt(_APP_JWT_REFRESH_SECS)
+        if time.time() - self.installs_updated >= _INSTALLATIONS_REFRESH_SECS:
+            with self.installs_lock:
+                self._update_installations()
+        for org in list(self.org_installs):
+            try:
+                self._mint_org_token(org, _INSTALL_TOKEN_REFRESH_SECS)
+            except Exception:
+                logging.exception("Could not refresh the GH token for %s", org)
 
 
 class AppAuth(requests.auth.AuthBase):
@@ -123,7 +209,7 @@ class OrgAuth(requests.auth.AuthBase):
 
 
 def check_app_configuration():
-    app = requests.get("https://api.github.com/app", auth=AppAuth()).json()
+    app = client.get("/app", auth=AppAuth(), priority=events.LOW).json()
 
     for (perm, val) in sorted(_EXPECTED_PERMS.items()):
         if perm not in app["permissions"]:
@@ -141,15 +227,14 @@ def check_app_configuration():
         "secret": cfg.github.hook_hmac_secret,
         "insecure_ssl": "0",
     }
-    requests.patch(
-        "https://api.github.com/app/hook/config",
-        auth=AppAuth(),
-        data=json.dumps(hook_data),
+    client.patch(
+        "/app/hook/config", auth=AppAuth(), json=hook_data, priority=events.LOW
     )
 
 
 def start():
     global _AUTH_MANAGER
     _AUTH_MANAGER = AuthManager(cfg.github.app.id, cfg.github.app.priv_key_path)
+    utils.spawn_periodic_task(_REFRESH_INTERVAL_SECS, _AUTH_MANAGER.refresh)
 
     utils.spawn_periodic_task(600, check_app_configuration)
@@ -1,44 +1,124 @@
-from . import app
+from . import client
 
-from .. import github, utils
+from .. import events, utils
 from ..config import cfg
 
 import logging
+import threading
 
 
-_TRUSTED_USERS = set()
-_CORE_USERS = set()
+class TeamMembers:
+    """Logins of the members of a GitHub team ("org/team").
+
+    Kept up to date incrementally from membership webhooks, and reconciled
+    with the full member list once in a while. The set of members is never
+    modified in place: updates swap in a new one, so that lookups never see a
+    partially filled list.
+    """
+
+    def __init__(self, group_name):
+        self.name = group_name
+        self.members = frozenset()
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+        # Changes received while a sync is in progress, to apply on top of
+        # the fetched list, which may predate them.
+        self.pending = None
+
+    def __contains__(self, login):
+        return login in self.members
+
+    def update(self, login, added):
+        with self.lock:
+            if added:
+                self.members = self.members | {login}
+            else:
+                self.members = self.members - {login}
+            if self.pending is not None:
+                self.pending.append((login, added))
+
+    def replace(self, members):
+        with self.lock:
+            self.members = frozenset(members)
+
+    def sync(self):
+        """Refetches the list of members of the team."""
+        org, team = self.name.split("/")
+        logging.info("Refreshing list of GH %s members", self.name)
+
+        with self.sync_lock:
+            with self.lock:
+                self.pending = []
+            try:
+                team_info = client.get_all(
+                    "/orgs/%s/teams/%s/members" % (org, team),
+                    org=org,
+                    priority=events.LOW,
+                )
+                members = {member["login"] for member in team_info}
+            finally:
+                with self.lock:
+                    pending, self.pending = self.pending, None
+            for login, added in pending:
+                if added:
+                    members.add(login)
+                else:
+                    members.discard(login)
+
+            with self.lock:
+                previous, self.members = self.members, frozenset(members)
+
+        if previous != self.members:
+            logging.info(
+                "GH %s members changed: added %s, removed %s",
+                self.name,
+                ",".join(sorted(self.members - previous)) or "none",
+                ",".join(sorted(previous - self.members)) or "none",
+            )
+
+
+_TRUSTED_USERS = TeamMembers("")
+_CORE_USERS = TeamMembers("")
 
 
 def is_safe_author(login):
     return login in _TRUSTED_USERS
 
 
-def sync_github_group(group, group_name):
-    """Synchronizes the list of trusted users by querying a given group."""
-    org = group_name.split("/")[0]
-    team = group_name.split("/")[1]
-    logging.info("Refreshing list of trusted users (from %s/%s)", org, team)
+class TeamMembershipTracker(events.EventTarget):
+    """Applies team membership changes reported by webhooks to the trusted
+    and core users."""
 
-    team_info = github.request_get_all(
-        "https://api.github.com/orgs/%s/teams/%s/members" % (org, team),
-        auth=app.OrgAuth(org),
-    )
-    group.clear()
-    for member in team_info:
-        group.add(member["login"])
-    logging.info("New GH %s: %s", group_name, ",".join(group))
+    def push_event(self, evt):
+        for group in (_TRUSTED_USERS, _CORE_USERS):
+            if group.name != evt.team:
+                continue
+            if evt.action in ("added", "removed") and evt.member is not None:
+                logging.info("GH %s member %s: %s", group.name, evt.action, evt.member)
+                group.update(evt.member, evt.action == "added")
+            elif evt.action == "deleted":
+                logging.warning("GH team %s was deleted", group.name)
+                group.replace(())
+            else:
+                group.sync()
 
 
 def sync_trusted_users():
-    sync_github_group(_TRUSTED_USERS, cfg.github.trusted_users.group)
+    _TRUSTED_USERS.sync()
 
 
 def sync_core_users():
-    sync_github_group(_CORE_USERS, cfg.github.core_users.group)
+    _CORE_USERS.sync()
 
 
 def start():
+    global _TRUSTED_USERS, _CORE_USERS
+    _TRUSTED_USERS = TeamMembers(cfg.github.trusted_users.group)
+    _CORE_USERS = TeamMembers(cfg.github.core_users.group)
+
+    events.dispatcher.register_target(TeamMembershipTracker(), [events.GHTeam.TYPE])
+
+    # Webhooks keep the lists up to date, this only catches missed updates.
     utils.spawn_periodic_task(
         cfg.github.trusted_users.refresh_interval, sync_trusted_users
     )
@@ -1,13 +1,107 @@
-from . import app
-from .. import events
+from . import client
+from .. import events, stats, utils
+from ..config import cfg
 
-import json
-import requests
+import collections
+import logging
+import threading
+
+
+class StatusOutbox:
+    """Commit statuses waiting to be published, keyed by (repo, sha, context).
+
+    Only the latest state of each key is kept: an update replaces the one
+    queued before it if that one was not sent yet, e.g. a pending status
+    followed by the build result. Statuses are published by a pool of worker
+    threads, never more than one at once for a given key so that they cannot
+    be reordered.
+    """
+
+    def __init__(self, workers=4):
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        # Key -> (org, url, data, acks), oldest first. acks acknowledge the
+        # status and the ones it superseded, once published.
+        self.pending = collections.OrderedDict()
+        self.in_flight = set()
+        self.sent = 0
+        self.superseded = 0
+
+    def start(self):
+        for i in range(self.workers):
+            utils.DaemonThread(target=self.run, name="statuses:%d" % i).start()
+
+    def put(self, key, org, url, data, ack):
+        with self.lock:
+            acks = [ack]
+            if key in self.pending:
+                self.superseded += 1
+                acks = self.pending[key][3] + acks
+            # Replacing an update keeps its place in the queue.
+            self.pending[key] = (org, url, data, acks)
+            self.cond.notify()
+
+    def take(self):
+        """Waits for a status which can be published, and returns it with its
+        key, now in flight."""
+        with self.lock:
+            while True:
+                for key in self.pending:
+                    if key not in self.in_flight:
+                        self.in_flight.add(key)
+                        return key, self.pending.pop(key)
+                self.cond.wait()
+
+    def done(self, key):
+        with self.lock:
+            self.in_flight.discard(key)
+            self.sent += 1
+            # A newer update for this key may have been held back.
+            if key in self.pending:
+                self.cond.notify()
+
+    def run(self):
+        while True:
+            key, (org, url, data, acks) = self.take()
+            try:
+                self.publish(key, org, url, data)
+            except Exception:
+                logging.exception("Could not publish status %s", key)
+            finally:
+                self.done(key)
+                for ack in acks:
+                    ack()
+
+    def publish(self, key, org, url, data):
+        # Statuses gate merging: they go before other requests when the rate
+        # limit budget runs low.
+        r = client.post(url, json=data, org=org, priority=events.HIGH)
+        if not r.ok:
+            repo, sha, context = key
+            logging.error(
+                "Could not set %s status of %s@%s: %d %s",
+                context,
+                repo,
+                sha,
+                r.status_code,
+                r.text[:200],
+            )
+
+    def stats(self):
+        with self.lock:
+            return {
+                "pending": len(self.pending),
+                "in_flight": len(self.in_flight),
+                "sent": self.sent,
+                "superseded": self.superseded,
+            }
 
 
 class GHPRStatusUpdater(events.EventTarget):
-    def accept_event(self, evt):
-        return evt.type == events.BuildStatus.TYPE
+    def __init__(self, outbox):
+        super().__init__()
+        self.outbox = outbox
 
     def push_event(self, evt):
         if evt.pr is None:
@@ -20,20 +114,27 @@ class GHPRStatusUpdater(events.EventTarget):
         else:
             state = "failure"
 
-        url = "https://api.github.com/repos/" + evt.repo + "/statuses/" + evt.hash
+        url = "/repos/" + evt.repo + "/statuses/" + evt.hash
         data = {
             "state": state,
             "target_url": evt.url,
             "description": evt.description,
             "context": evt.service,
         }
-        requests.post(
+        self.outbox.put(
+            (evt.repo, evt.hash, evt.service),
+            evt.repo.split("/")[0],
             url,
-            headers={"Content-Type": "application/json"},
-            data=json.dumps(data),
-            auth=app.OrgAuth(evt.repo.split("/")[0]),
+            data,
+            events.dispatcher.defer_ack(evt),
         )
 
 
 def start():
-    events.dispatcher.register_target(GHPRStatusUpdater())
+    settings = cfg.github.statuses or utils.ObjectLike({})
+    outbox = StatusOutbox(settings.workers or 4)
+    outbox.start()
+    stats.watch_component("github.statuses", outbox.stats)
+    events.dispatcher.register_target(
+        GHPRStatusUpdater(outbox), [events.BuildStatus.TYPE]
+    )
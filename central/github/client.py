@@ -0,0 +1,361 @@
+"""Shared HTTP client for the GitHub API.
+
+All GitHub API calls go through a single requests session, which keeps a pool
+of connections alive, applies default timeouts, and retries failed requests
+with exponential backoff. Requests can be authenticated as the installation of
+the app for an organization by passing org. GET responses are cached and
+revalidated with conditional requests. Requests are scheduled by priority
+within the rate limits of their identity (see ratelimit).
+
+Use the module level functions, which go through the client configured from
+the github.client settings.
+"""
+
+from . import app, ratelimit
+from .. import events, stats, utils
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import collections
+import concurrent.futures
+import logging
+import requests
+import threading
+import urllib.parse
+
+API_URL = "https://api.github.com"
+# Largest page size allowed by most listing endpoints.
+PER_PAGE = 100
+
+
+class _Retry(Retry):
+    """Leaves requests rejected by rate limits (403 or 429) to the client,
+    which retries them whatever their method once the limit allows it."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code in (403, 429):
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _page_urls(last_url):
+    """Returns the URLs of the pages following the first one, from the URL of
+    the last page, or None if pages are not numbered."""
+    parts = urllib.parse.urlsplit(last_url)
+    query = urllib.parse.parse_qsl(parts.query)
+    last = dict(query).get("page")
+    if last is None or not last.isdigit():
+        return None
+    return [
+        urllib.parse.urlunsplit(
+            parts._replace(
+                query=urllib.parse.urlencode(
+                    [(k, str(page) if k == "page" else v) for k, v in query]
+                )
+            )
+        )
+        for page in range(2, int(last) + 1)
+    ]
+
+
+class _CachedResponse:
+    __slots__ = ("validators", "headers", "content", "encoding", "size")
+
+    def __init__(self, r):
+        self.validators = {}
+        if "ETag" in r.headers:
+            self.validators["If-None-Match"] = r.headers["ETag"]
+        if "Last-Modified" in r.headers:
+            self.validators["If-Modified-Since"] = r.headers["Last-Modified"]
+        self.headers = dict(r.headers)
+        self.content = r.content
+        self.encoding = r.encoding
+        self.size = len(self.content) + 1024
+
+    def response(self, not_modified):
+        """Builds the response to return for a 304 Not Modified response."""
+        r = requests.Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r.headers = requests.structures.CaseInsensitiveDict(self.headers)
+        # The 304 carries up to date headers, e.g. rate limit information.
+        for k, v in not_modified.headers.items():
+            if k.lower() != "content-length":
+                r.headers[k] = v
+        r._content = self.content
+        r.encoding = self.encoding
+        r.url = not_modified.url
+        r.request = not_modified.request
+        r.elapsed = not_modified.elapsed
+        r.connection = not_modified.connection
+        return r
+
+
+class ResponseCache:
+    """LRU cache of GET response bodies with their validators (ETag and
+    Last-Modified), bounded in total body size.
+
+    GitHub does not count conditional requests answered with 304 Not Modified
+    against the rate limit.
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, r):
+        if "ETag" not in r.headers and "Last-Modified" not in r.headers:
+            return
+        entry = _CachedResponse(r)
+        if entry.size > self.max_size:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_size:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "size": self.size,
+            }
+
+
+class Client:
+    def __init__(
+        self,
+        pool_size=16,
+        timeout=(5, 30),
+        retries=3,
+        backoff_factor=1,
+        cache_size=32 * 1024 * 1024,
+        max_delay=900,
+        page_workers=4,
+    ):
+        self.timeout = timeout
+        self.retries = retries
+        # Shared by all paginated requests, which bounds their parallelism.
+        self.page_workers = page_workers
+        self.pages = concurrent.futures.ThreadPoolExecutor(
+            max_workers=page_workers, thread_name_prefix="github-pages"
+        )
+        self.cache = ResponseCache(cache_size) if cache_size else None
+        self.limiter = ratelimit.RateLimiter(max_delay)
+        # Only idempotent requests are retried on server errors: a POST could
+        # have been processed already, e.g. creating a comment.
+        retry = _Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=4, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        self.session.headers["User-Agent"] = "dolphin-emu-central"
+
+    def request(self, method, url, *, org=None, priority=events.NORMAL, **kwargs):
+        """Sends a request to the GitHub API. url can be relative to the API
+        root. When org is given, the request is authenticated as the app
+        installation for that organization.
+
+        When the rate limit budget runs low, requests are delayed according to
+        their priority (events.HIGH, NORMAL or LOW)."""
+        if url.startswith("/"):
+            url = API_URL + url
+        if org is not None:
+            kwargs["auth"] = app.OrgAuth(org)
+        kwargs.setdefault("timeout", self.timeout)
+        auth = kwargs.get("auth")
+        identity = org if org is not None else type(auth).__name__ if auth else None
+        resource = "graphql" if url.endswith("/graphql") else "core"
+        limit_key = (identity, resource)
+        if method != "GET" or self.cache is None:
+            return self._send(method, url, limit_key, priority, **kwargs)
+
+        # Responses depend on who is asking.
+        headers = kwargs.get("headers") or {}
+        key = (url, repr(kwargs.get("params")), identity, headers.get("Accept"))
+        cached = self.cache.get(key)
+        if cached is not None:
+            kwargs["headers"] = {**cached.validators, **headers}
+        r = self._send(method, url, limit_key, priority, **kwargs)
+        if r.status_code == 304 and cached is not None:
+            self.cache.count(hit=True)
+            return cached.response(r)
+        self.cache.count(hit=False)
+        if r.status_code == 200:
+            self.cache.put(key, r)
+        return r
+
+    def _send(self, method, url, limit_key, priority, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(limit_key, priority)
+            r = self.session.request(method, url, **kwargs)
+            if not self.limiter.update(limit_key, r):
+                return r
+        logging.error(
+            "GitHub %s %s still rate limited after %d attempts",
+            method,
+            url,
+            self.retries + 1,
+        )
+        return r
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def rate_limit_stats(self):
+        return self.limiter.stats()
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else {}
+
+    def graphql(self, query, variables=None, **kwargs):
+        """Runs a GraphQL query and returns its data."""
+        r = self.post(
+            "/graphql", json={"query": query, "variables": variables or {}}, **kwargs
+        )
+        r.raise_for_status()
+        result = r.json()
+        if result.get("errors"):
+            raise RuntimeError("GraphQL query failed: %s" % result["errors"])
+        return result["data"]
+
+    def iter_all(self, url, **kwargs):
+        """Iterates over the results of all pages of a paginated endpoint, in
+        order.
+
+        GitHub uses the Link header for pagination. Once the first page tells
+        how many there are, the following pages are fetched concurrently, a
+        few pages ahead of the iteration: stopping early avoids fetching the
+        rest."""
+        params = kwargs.pop("params", None) or {}
+        r = self.get(url, params={"per_page": PER_PAGE, **params}, **kwargs)
+        r.raise_for_status()
+        yield from r.json()
+
+        pages = _page_urls(r.links["last"]["url"]) if "last" in r.links else None
+        if pages is None:
+            while "next" in r.links:
+                r = self.get(r.links["next"]["url"], **kwargs)
+                r.raise_for_status()
+                yield from r.json()
+            return
+
+        pages = iter(pages)
+        pending = collections.deque()
+        try:
+            while True:
+                for page_url in pages:
+                    pending.append(self.pages.submit(self.get, page_url, **kwargs))
+                    if len(pending) >= self.page_workers:
+                        break
+                if not pending:
+                    return
+                r = pending.popleft().result()
+                r.raise_for_status()
+                yield from r.json()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def get_all(self, url, **kwargs):
+        """Returns the concatenated results of all pages of a paginated
+        endpoint."""
+        return list(self.iter_all(url, **kwargs))
+
+
+_CLIENT = Client()
+stats.watch_component("github.client.cache", lambda: _CLIENT.cache_stats())
+stats.watch_component("github.client.ratelimit", lambda: _CLIENT.rate_limit_stats())
+
+
+def configure(settings):
+    """Recreates the shared client from the github.client settings."""
+    global _CLIENT
+    _CLIENT.pages.shutdown(wait=False)
+    timeout = settings.timeout or utils.ObjectLike({})
+    _CLIENT = Client(
+        pool_size=settings.pool_size or 16,
+        timeout=(timeout.connect or 5, timeout.read or 30),
+        retries=settings.retries if settings.retries is not None else 3,
+        backoff_factor=settings.backoff_factor or 1,
+        cache_size=(
+            settings.cache_size if settings.cache_size is not None else 32 * 1024 * 1024
+        ),
+        max_delay=settings.max_delay or 900,
+        page_workers=settings.page_workers or 4,
+    )
+
+
+def request(method, url, **kwargs):
+    return _CLIENT.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return _CLIENT.get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return _CLIENT.post(url, **kwargs)
+
+
+def patch(url, **kwargs):
+    return _CLIENT.patch(url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return _CLIENT.delete(url, **kwargs)
+
+
+def graphql(query, variables=None, **kwargs):
+    return _CLIENT.graphql(query, variables, **kwargs)
+
+
+def iter_all(url, **kwargs):
+    return _CLIENT.iter_all(url, **kwargs)
+
+
+def get_all(url, **kwargs):
+    return _CLIENT.get_all(url, **kwargs)
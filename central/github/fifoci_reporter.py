@@ -1,27 +1,81 @@
-from .. import events, github
+from .. import events, github, utils
 from ..config import cfg
 
 import collections
+import logging
 import requests
 import textwrap
+import threading
 
 
 class GHFifoCIEditer(events.EventTarget):
     MAGIC_WORDS = "automated-fifoci-reporter"
 
-    def accept_event(self, evt):
-        return evt.type == events.PullRequestFifoCIStatus.TYPE
+    def __init__(self, index=None, builders=(), settle_timeout=600):
+        # (repo, PR) -> id of the comment holding the report.
+        self.index = index if index is not None else utils.PersistentMap()
+        # Each FifoCI builder reports separately: wait for all of them, or at
+        # most settle_timeout seconds (failed builds never report), before
+        # updating the comment once.
+        self.builders = frozenset(builders)
+        self.settle_timeout = settle_timeout
+        self.lock = threading.Lock()
+        # (repo, PR, hash) -> (builders which reported, timeout timer, acks of
+        # the events).
+        self.pending = {}
+        self.report_lock = threading.Lock()
 
     def push_event(self, evt):
+        key = (evt.repo, evt.pr, evt.hash)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is None:
+                timer = threading.Timer(self.settle_timeout, self.settle, (key, evt))
+                timer.daemon = True
+                entry = self.pending[key] = (set(), timer, [])
+                timer.start()
+            reported, timer, acks = entry
+            reported.add(evt.service)
+            acks.append(events.dispatcher.defer_ack(evt))
+            if not self.builders <= reported:
+                return
+            del self.pending[key]
+            timer.cancel()
+        self.report(evt, acks)
+
+    def settle(self, key, evt):
+        with self.lock:
+            entry = self.pending.pop(key, None)
+        if entry is None:
+            return
+        try:
+            self.report(evt, entry[2])
+        except Exception:
+            logging.exception("Could not report FifoCI results for %s", evt.hash)
+
+    def report(self, evt, acks):
+        try:
+            with self.report_lock:
+                self._report(evt)
+        finally:
+            for ack in acks:
+                ack()
+
+    def _report(self, evt):
         # Get FifoCI side status
         url = cfg.fifoci.url + "/version/%s/json/" % evt.hash
         diff_data = requests.get(url).json()
         owner, repo = evt.repo.split("/")
-        pr = github.get_pull_request(owner, repo, evt.pr)
-        comments = github.get_pull_request_comments(pr)
-        comments = [
-            c for c in comments if c["user"]["login"] == cfg.github.app.username
-        ]
+        pr = github.get_pull_request_context(owner, repo, evt.pr)
+        if pr["head_sha"] != evt.hash:
+            logging.info(
+                "Skipping FifoCI report for %s, no longer the head of %s#%d",
+                evt.hash,
+                evt.repo,
+                evt.pr,
+            )
+            return
+        comments = pr["comments"]
 
         body = textwrap.dedent(
             """\
@@ -75,18 +129,37 @@ class GHFifoCIEditer(events.EventTarget):
         body += "%s\n</details>" % "\n".join(table_rows)
         body += "\n<sub><sup>%s</sup></sub>" % self.MAGIC_WORDS
 
-        if comments and comments[-1]["body"] == body:
-            return
+        # The report is edited in place: pick the comment recorded in the
+        # index, or the latest report if the index does not know about it.
+        key = "%s#%d" % (evt.repo, evt.pr)
+        reports = [c for c in comments if self.MAGIC_WORDS in c["body"]]
+        current = None
+        if reports:
+            indexed = self.index.get(key)
+            current = next((c for c in reports if c["id"] == indexed), reports[-1])
+        if not diff_data:
+            current = None
 
-        for c in comments:
-            if self.MAGIC_WORDS in c["body"]:
+        for c in reports:
+            if c is not current:
                 github.delete_comment(owner, repo, c["id"])
 
         if not diff_data:
-            return
-
-        github.post_comment(owner, repo, evt.pr, body)
+            self.index.set(key, None)
+        elif current is None:
+            self.index.set(key, github.post_comment(owner, repo, evt.pr, body))
+        else:
+            if current["body"] != body:
+                github.edit_comment(owner, repo, current["id"], body)
+            self.index.set(key, current["id"])
 
 
 def start():
-    events.dispatcher.register_target(GHFifoCIEditer())
+    settings = cfg.fifoci.comment_index or utils.ObjectLike({})
+    index = utils.PersistentMap(settings.size or 10000, settings.path)
+    editer = GHFifoCIEditer(
+        index,
+        cfg.buildbot.fifoci_builders or (),
+        cfg.fifoci.settle_timeout or 600,
+    )
+    events.dispatcher.register_target(editer, [events.PullRequestFifoCIStatus.TYPE])
@@ -0,0 +1,128 @@
+"""Rate limit aware scheduling of GitHub API requests.
+
+The budget of every identity (app installation for an organization, the app
+itself) is tracked from the X-RateLimit-* headers of the responses. Lower
+priority requests leave a share of the budget to higher priority ones: when
+the budget runs low, they wait for the rate limit window to reset instead of
+being sent and failing. After secondary rate limit or abuse detection
+responses (Retry-After), all requests for the identity wait.
+"""
+
+from .. import events
+
+import logging
+import threading
+import time
+
+# Share of the budget which requests of a given priority leave untouched.
+RESERVES = {events.HIGH: 0.0, events.NORMAL: 0.1, events.LOW: 0.25}
+
+
+class _Budget:
+    __slots__ = ("remaining", "limit", "reset", "paused_until")
+
+    def __init__(self):
+        self.remaining = None
+        self.limit = None
+        self.reset = None
+        self.paused_until = 0
+
+
+class RateLimiter:
+    def __init__(self, max_delay=900):
+        # Requests which would need to wait longer are sent right away.
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.budgets = {}
+        self.delayed = 0
+        self.limited = 0
+
+    def _delay(self, budget, priority, now):
+        """Returns how long a request must wait, or 0 if it can be sent now
+        (in which case it is deducted from the budget). Called with the lock
+        held."""
+        if budget.reset is not None and now >= budget.reset:
+            budget.remaining = budget.limit
+            budget.reset = None
+        if budget.paused_until > now:
+            return budget.paused_until - now
+        if budget.remaining is not None and budget.limit:
+            if budget.remaining <= budget.limit * RESERVES[priority]:
+                if budget.reset is not None:
+                    return budget.reset - now
+            else:
+                budget.remaining -= 1
+        return 0
+
+    def acquire(self, key, priority=events.NORMAL):
+        """Waits until a request for key (identity, resource) may be sent."""
+        logged = False
+        while True:
+            now = time.time()
+            with self.lock:
+                budget = self.budgets.get(key)
+                if budget is None:
+                    return
+                delay = self._delay(budget, priority, now)
+                if delay <= 0 or delay > self.max_delay:
+                    return
+                if not logged:
+                    self.delayed += 1
+            if not logged:
+                logging.info(
+                    "Delaying GitHub request for %s by %ds (%s remaining)",
+                    key,
+                    delay,
+                    budget.remaining,
+                )
+                logged = True
+            time.sleep(delay)
+
+    def update(self, key, r):
+        """Updates the budget for key from a response. Returns True if the
+        request was rejected by a rate limit and should be retried."""
+        headers = r.headers
+        now = time.time()
+        with self.lock:
+            budget = self.budgets.get(key)
+            if budget is None:
+                budget = self.budgets[key] = _Budget()
+            if "X-RateLimit-Remaining" in headers:
+                try:
+                    budget.remaining = int(headers["X-RateLimit-Remaining"])
+                    budget.limit = int(headers["X-RateLimit-Limit"])
+                    budget.reset = int(headers["X-RateLimit-Reset"])
+                except (KeyError, ValueError):
+                    pass
+            if r.status_code not in (403, 429):
+                return False
+            if "Retry-After" in headers:
+                try:
+                    retry_after = int(headers["Retry-After"])
+                except ValueError:
+                    retry_after = 60
+                budget.paused_until = max(budget.paused_until, now + retry_after)
+            elif budget.remaining == 0 and budget.reset is not None:
+                budget.paused_until = max(budget.paused_until, budget.reset)
+            else:
+                # Not a rate limit (e.g. missing permissions).
+                return False
+            self.limited += 1
+            return True
+
+    def stats(self):
+        with self.lock:
+            return {
+                "delayed": self.delayed,
+                "limited": self.limited,
+                "budgets": {
+                    "%s/%s"
+                    % key: {
+                        "remaining": budget.remaining,
+                        "limit": budget.limit,
+                        "reset": budget.reset,
+                        "paused_until": budget.paused_until or None,
+                    }
+                    for key, budget in self.budgets.items()
+                },
+            }
@@ -0,0 +1,99 @@
+from . import app, client
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import os
+import requests
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+def _response(data):
+    r = requests.Response()
+    r.status_code = 201
+    r.json = lambda: data
+    return r
+
+
+class TestAuthManager(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        fd, cls.key_path = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as fp:
+            fp.write(
+                key.private_bytes(
+                    serialization.Encoding.PEM,
+                    serialization.PrivateFormat.TraditionalOpenSSL,
+                    serialization.NoEncryption(),
+                )
+            )
+
+    @classmethod
+    def tearDownClass(cls):
+        os.unlink(cls.key_path)
+
+    def setUp(self):
+        installs = [
+            {"target_type": "Organization", "account": {"login": "org"}, "id": 1}
+        ]
+        self.minted = 0
+        patcher = mock.patch.object(client, "get_all", return_value=installs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(client, "post", self.post)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = app.AuthManager(1234, self.key_path)
+
+    def post(self, url, **kwargs):
+        self.assertEqual(url, "/app/installations/1/access_tokens")
+        time.sleep(0.05)
+        self.minted += 1
+        expires_at = time.strftime(
+            "%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + self.validity)
+        )
+        return _response({"token": "tok%d" % self.minted, "expires_at": expires_at})
+
+    validity = 3600
+
+    def test_single_flight(self):
+        tokens = []
+        threads = [
+            threading.Thread(
+                target=lambda: tokens.append(self.manager.org_token("org"))
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(tokens, ["tok1"] * 8)
+        self.assertEqual(self.minted, 1)
+
+    def test_refresh(self):
+        self.validity = 600
+        self.manager.refresh()
+        self.assertEqual(self.manager.org_token("org"), "tok1")
+        # Close to expiry: renewed in the background, not on the request path.
+        self.validity = 3600
+        self.manager.refresh()
+        self.assertEqual(self.minted, 2)
+        self.assertEqual(self.manager.org_token("org"), "tok2")
+        self.manager.refresh()
+        self.assertEqual(self.minted, 2)
+
+    def test_unknown_org(self):
+        with self.assertRaises(RuntimeError):
+            self.manager.org_token("other")
+
+    def test_app_jwt(self):
+        app_jwt = self.manager.app_jwt
+        self.assertIs(self.manager.app_jwt, app_jwt)
+        self.manager.cached_app_jwt_deadline = time.time() + 30
+        self.assertIsNot(self.manager.app_jwt, app_jwt)
@@ -0,0 +1,66 @@
+from . import authz, client, webhooks
+from .. import events, utils
+
+import threading
+import unittest
+from unittest import mock
+
+
+class TestTeamMembers(unittest.TestCase):
+    def setUp(self):
+        self.group = authz.TeamMembers("org/team")
+
+    def test_sync(self):
+        self.group.update("old", True)
+        members = [{"login": "a"}, {"login": "b"}]
+        with mock.patch.object(client, "get_all", return_value=members) as get_all:
+            self.group.sync()
+        self.assertEqual(get_all.call_args[0][0], "/orgs/org/teams/team/members")
+        self.assertEqual(self.group.members, {"a", "b"})
+
+    def test_updates_during_sync(self):
+        fetching, done = threading.Event(), threading.Event()
+
+        def get_all(url, **kwargs):
+            fetching.set()
+            done.wait()
+            return [{"login": "a"}, {"login": "b"}]
+
+        self.group.replace(["a", "b"])
+        with mock.patch.object(client, "get_all", get_all):
+            thread = threading.Thread(target=self.group.sync)
+            thread.start()
+            fetching.wait()
+            self.group.update("c", True)
+            self.group.update("a", False)
+            # Members stay available while the sync is in progress.
+            self.assertIn("b", self.group)
+            done.set()
+            thread.join()
+        self.assertEqual(self.group.members, {"b", "c"})
+
+    def test_tracker(self):
+        tracker = authz.TeamMembershipTracker()
+        with mock.patch.object(authz, "_TRUSTED_USERS", self.group):
+            tracker.push_event(events.GHTeam("org/team", "added", "a"))
+            tracker.push_event(events.GHTeam("org/other", "added", "b"))
+            self.assertTrue(authz.is_safe_author("a"))
+            self.assertFalse(authz.is_safe_author("b"))
+            tracker.push_event(events.GHTeam("org/team", "removed", "a"))
+            self.assertFalse(authz.is_safe_author("a"))
+
+
+class TestWebhooks(unittest.TestCase):
+    def test_membership(self):
+        raw = {
+            "action": "added",
+            "scope": "team",
+            "member": {"login": "a"},
+            "team": {"slug": "team"},
+            "organization": {"login": "org"},
+        }
+        parser = webhooks.GHHookEventParser()
+        evt = parser.convert_membership_event(utils.ObjectLike(raw))
+        self.assertEqual((evt.team, evt.action, evt.member), ("org/team", "added", "a"))
+        raw["team"] = {"id": 1, "name": "Team", "deleted": True}
+        self.assertIsNone(parser.convert_membership_event(utils.ObjectLike(raw)))
@@ -0,0 +1,77 @@
+from . import build_status
+from .. import events
+
+import threading
+import unittest
+
+
+class _Outbox(build_status.StatusOutbox):
+    def __init__(self, workers):
+        super().__init__(workers)
+        self.published = []
+        self.blocked = threading.Event()
+        self.unblock = threading.Event()
+        self.unblock.set()
+
+    def publish(self, key, org, url, data):
+        self.blocked.set()
+        self.unblock.wait()
+        with self.lock:
+            self.published.append((key, data["state"]))
+
+    def wait_idle(self):
+        with self.lock:
+            while self.pending or self.in_flight:
+                self.cond.wait(0.01)
+
+
+class TestStatusOutbox(unittest.TestCase):
+    def status(self, sha, context, pending, success=False):
+        return events.BuildStatus("o/r", sha, sha, context, 1, success, pending, "", "")
+
+    def test_superseded(self):
+        outbox = _Outbox(workers=1)
+        updater = build_status.GHPRStatusUpdater(outbox)
+        outbox.unblock.clear()
+        updater.push_event(self.status("a", "lint", True))
+        outbox.start()
+        outbox.blocked.wait()
+
+        # Sent while the first update is in flight: only the last one of each
+        # key gets published, in order.
+        updater.push_event(self.status("a", "lint", True))
+        updater.push_event(self.status("a", "build", True))
+        updater.push_event(self.status("a", "lint", False, success=True))
+        updater.push_event(self.status("a", "build", False))
+        outbox.unblock.set()
+        outbox.wait_idle()
+
+        self.assertEqual(
+            outbox.published,
+            [
+                (("o/r", "a", "lint"), "pending"),
+                (("o/r", "a", "lint"), "success"),
+                (("o/r", "a", "build"), "failure"),
+            ],
+        )
+        self.assertEqual(outbox.stats()["superseded"], 2)
+
+    def test_no_concurrent_updates_per_key(self):
+        outbox = _Outbox(workers=4)
+        outbox.unblock.clear()
+        outbox.start()
+        outbox.put(
+            ("o/r", "a", "lint"), "o", "/url", {"state": "pending"}, lambda: None
+        )
+        outbox.blocked.wait()
+        outbox.put(
+            ("o/r", "a", "lint"), "o", "/url", {"state": "success"}, lambda: None
+        )
+        with outbox.lock:
+            self.assertEqual(len(outbox.in_flight), 1)
+            self.assertEqual(len(outbox.pending), 1)
+        outbox.unblock.set()
+        outbox.wait_idle()
+        self.assertEqual(
+            [state for _, state in outbox.published], ["pending", "success"]
+        )
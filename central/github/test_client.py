@@ -0,0 +1,170 @@
+from . import client
+
+import http.server
+import json
+import threading
+import time
+import unittest
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        server.requests.append((self.command, self.path))
+        server.request_headers.append(self.headers)
+        if self.path in server.routes:
+            status, headers, body = server.routes[self.path]
+        else:
+            status, headers, body = server.responses.pop(0)
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        data = json.dumps(body).encode("utf-8") if status != 304 else b""
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = respond
+
+
+class TestClient(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self.server.requests = []
+        self.server.request_headers = []
+        self.server.responses = []
+        self.server.routes = {}
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        ).start()
+        self.url = "http://127.0.0.1:%d" % self.server.server_port
+        self.client = client.Client(retries=2, backoff_factor=0)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_server_errors(self):
+        self.server.responses = [(502, {}, {}), (200, {}, {"ok": True})]
+        r = self.client.get(self.url + "/a")
+        self.assertEqual(r.json(), {"ok": True})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_no_post_retry_on_server_errors(self):
+        self.server.responses = [(502, {}, {}), (200, {}, {})]
+        r = self.client.post(self.url + "/a", json={})
+        self.assertEqual(r.status_code, 502)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_retry_abuse_limits(self):
+        self.server.responses = [
+            (403, {"Retry-After": "0"}, {}),
+            (201, {}, {"ok": True}),
+        ]
+        r = self.client.post(self.url + "/a", json={})
+        self.assertEqual(r.status_code, 201)
+        self.server.responses = [(403, {}, {})]
+        r = self.client.post(self.url + "/a", json={})
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_rate_limit(self):
+        reset = str(int(time.time()))
+        self.server.responses = [
+            (
+                403,
+                {
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Limit": "5000",
+                    "X-RateLimit-Reset": reset,
+                },
+                {},
+            ),
+            (201, {}, {"ok": True}),
+        ]
+        r = self.client.post(self.url + "/a", json={})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(len(self.server.requests), 2)
+        stats = self.client.rate_limit_stats()
+        self.assertEqual(stats["limited"], 1)
+        self.assertEqual(stats["budgets"]["None/core"]["limit"], 5000)
+
+    def test_get_all(self):
+        self.server.responses = [
+            (200, {"Link": '<%s/p2>; rel="next"' % self.url}, [1, 2]),
+            (200, {}, [3]),
+        ]
+        self.assertEqual(self.client.get_all(self.url + "/p1"), [1, 2, 3])
+        self.assertEqual(
+            [path for _, path in self.server.requests], ["/p1?per_page=100", "/p2"]
+        )
+
+    def pages(self, count):
+        last = '<%s/a?per_page=100&page=%d>; rel="last"' % (self.url, count)
+        self.server.routes["/a?per_page=100"] = (200, {"Link": last}, [1])
+        for page in range(2, count + 1):
+            path = "/a?per_page=100&page=%d" % page
+            self.server.routes[path] = (200, {"Link": last}, [page])
+
+    def test_get_all_concurrent(self):
+        self.pages(10)
+        self.assertEqual(self.client.get_all(self.url + "/a"), list(range(1, 11)))
+        self.assertEqual(len(self.server.requests), 10)
+
+    def test_iter_all_stop_early(self):
+        self.pages(20)
+        for item in self.client.iter_all(self.url + "/a"):
+            if item == 2:
+                break
+        self.client.pages.shutdown(wait=True)
+        # Only a few pages ahead are fetched.
+        self.assertLessEqual(len(self.server.requests), 2 + self.client.page_workers)
+
+    def test_relative_url(self):
+        client.API_URL, api_url = self.url, client.API_URL
+        try:
+            self.server.responses = [(200, {}, {})]
+            self.client.get("/repos/a/b")
+        finally:
+            client.API_URL = api_url
+        self.assertEqual(self.server.requests, [("GET", "/repos/a/b")])
+
+    def test_cache(self):
+        url = self.url + "/a"
+        self.server.responses = [
+            (200, {"ETag": '"v1"', "Link": '<%s/b>; rel="next"' % self.url}, [1]),
+            (304, {"X-RateLimit-Remaining": "42"}, None),
+            (200, {"ETag": '"v2"'}, [2]),
+        ]
+        self.assertEqual(self.client.get(url).json(), [1])
+        self.assertNotIn("If-None-Match", self.server.request_headers[0])
+
+        r = self.client.get(url)
+        self.assertEqual(self.server.request_headers[1]["If-None-Match"], '"v1"')
+        self.assertEqual((r.status_code, r.json()), (200, [1]))
+        self.assertIn("next", r.links)
+        self.assertEqual(r.headers["X-RateLimit-Remaining"], "42")
+
+        self.assertEqual(self.client.get(url).json(), [2])
+        self.assertEqual(self.client.cache.hits, 1)
+        self.assertEqual(self.client.cache.misses, 2)
+
+    def test_cache_identity(self):
+        self.server.responses = [(200, {"ETag": '"v1"'}, [1])] * 2
+        self.client.get(self.url + "/a")
+        self.client.get(self.url + "/a", headers={"Accept": "text/plain"})
+        self.assertNotIn("If-None-Match", self.server.request_headers[1])
+
+    def test_cache_eviction(self):
+        cache = client.ResponseCache(max_size=3500)
+        self.client.cache = cache
+        self.server.responses = [(200, {"ETag": '"v"'}, "x" * 500)] * 3
+        for path in ("/a", "/b", "/c"):
+            self.client.get(self.url + path)
+        self.assertEqual([key[0][-2:] for key in cache.entries], ["/b", "/c"])
+        self.assertLessEqual(cache.size, 3500)
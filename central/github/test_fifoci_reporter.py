@@ -0,0 +1,175 @@
+from . import app, client, fifoci_reporter
+from .. import config, events, utils
+
+import http.server
+import io
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+
+class _GitHub(http.server.BaseHTTPRequestHandler):
+    """Stand-in for FifoCI and the parts of the GitHub REST and GraphQL APIs
+    used by the FifoCI reporter."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def respond(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.server.requests.append(("GET", self.path))
+        self.respond(200, self.server.diff)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(("POST", self.path))
+        if self.path == "/graphql":
+            self.respond(200, {"data": self.graphql(body["variables"])})
+        else:
+            self.server.comments.append((body["body"], True))
+            self.respond(201, {"id": len(self.server.comments)})
+
+    def do_PATCH(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append(("PATCH", self.path))
+        id = int(self.path.split("/")[-1])
+        self.server.comments[id - 1] = (body["body"], True)
+        self.respond(200, {})
+
+    def do_DELETE(self):
+        self.server.requests.append(("DELETE", self.path))
+        id = int(self.path.split("/")[-1])
+        del self.server.comments[id - 1]
+        self.server.comments.insert(id - 1, None)
+        self.respond(204, {})
+
+    def graphql(self, variables):
+        comments = [
+            {"databaseId": i + 1, "body": c[0], "viewerDidAuthor": c[1]}
+            for i, c in enumerate(self.server.comments)
+            if c is not None
+        ]
+        end = len(comments)
+        if variables["before"] is not None:
+            end = int(variables["before"])
+        start = max(0, end - self.server.page_size)
+        return {
+            "repository": {
+                "pullRequest": {
+                    "headRefOid": self.server.head,
+                    "comments": {
+                        "nodes": comments[start:end],
+                        "pageInfo": {
+                            "hasPreviousPage": start > 0,
+                            "startCursor": str(start),
+                        },
+                    },
+                }
+            }
+        }
+
+
+class TestFifoCIReporter(unittest.TestCase):
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _GitHub)
+        self.server.requests = []
+        self.server.comments = []
+        self.server.page_size = 100
+        self.server.head = "abc"
+        self.server.diff = [
+            {"type": "ogl", "dff": "mkdd", "failure": False, "url": "/dff/1/"}
+        ]
+        threading.Thread(
+            target=self.server.serve_forever, args=(0.01,), daemon=True
+        ).start()
+        url = "http://127.0.0.1:%d" % self.server.server_port
+        config.load(io.StringIO("fifoci:\n    url: %s\n" % url))
+        for patcher in (
+            mock.patch.object(client, "API_URL", url),
+            mock.patch.object(app, "_AUTH_MANAGER", mock.Mock()),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def report(self, index=None):
+        del self.server.requests[:]
+        evt = events.PullRequestFifoCIStatus("o/r", "abc", "fifoci", 42)
+        fifoci_reporter.GHFifoCIEditer(index).push_event(evt)
+        return [method for method, _ in self.server.requests]
+
+    def test_report(self):
+        self.server.comments = [("LGTM", False)]
+        self.assertEqual(self.report(), ["GET", "POST", "POST"])
+        self.assertIn("mkdd", self.server.comments[-1][0])
+
+        # Unchanged: only the FifoCI and GraphQL requests.
+        self.assertEqual(self.report(), ["GET", "POST"])
+
+        self.server.diff[0]["failure"] = True
+        self.assertEqual(self.report(), ["GET", "POST", "PATCH"])
+        self.assertEqual(self.server.comments[0], ("LGTM", False))
+        self.assertIn("fail", self.server.comments[1][0])
+
+        self.server.diff = []
+        self.assertEqual(self.report(), ["GET", "POST", "DELETE"])
+        self.assertIsNone(self.server.comments[1])
+
+    def test_duplicates(self):
+        magic = fifoci_reporter.GHFifoCIEditer.MAGIC_WORDS
+        self.server.comments = [(magic, True), (magic, True), (magic, True)]
+        index = utils.PersistentMap()
+        index.set("o/r#42", 2)
+        self.assertEqual(
+            self.report(index), ["GET", "POST", "DELETE", "DELETE", "PATCH"]
+        )
+        self.assertEqual(
+            [c is not None for c in self.server.comments], [False, True, False]
+        )
+        self.assertEqual(index.get("o/r#42"), 2)
+
+    def test_outdated(self):
+        self.server.head = "def"
+        self.assertEqual(self.report(), ["GET", "POST"])
+        self.assertEqual(self.server.comments, [])
+
+    def test_settle(self):
+        editer = fifoci_reporter.GHFifoCIEditer(builders=("ogl", "sw"))
+        for builder in ("ogl", "ogl", "sw"):
+            editer.push_event(events.PullRequestFifoCIStatus("o/r", "abc", builder, 42))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(editer.pending, {})
+
+    def test_settle_timeout(self):
+        editer = fifoci_reporter.GHFifoCIEditer(
+            builders=("ogl", "sw"), settle_timeout=0.05
+        )
+        evt = events.PullRequestFifoCIStatus("o/r", "abc", "ogl", 42)
+        editer.push_event(evt)
+        self.assertEqual(self.server.requests, [])
+        deadline = time.monotonic() + 5
+        while len(self.server.requests) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([m for m, _ in self.server.requests], ["GET", "POST", "POST"])
+        self.assertEqual(editer.pending, {})
+
+    def test_comment_pages(self):
+        self.server.page_size = 2
+        self.server.comments = [("old", True), ("a", False), ("b", False)]
+        self.server.comments.append(("c", False))
+        pr = fifoci_reporter.github.get_pull_request_context("o", "r", 42)
+        self.assertEqual(
+            pr, {"head_sha": "abc", "comments": [{"id": 1, "body": "old"}]}
+        )
+        self.assertEqual(len(self.server.requests), 2)
@@ -0,0 +1,67 @@
+from . import ratelimit
+from .. import events
+
+import requests
+import time
+import unittest
+
+KEY = ("org", "core")
+
+
+def _response(status=200, remaining=None, limit=100, reset=None, retry_after=None):
+    r = requests.Response()
+    r.status_code = status
+    if remaining is not None:
+        r.headers["X-RateLimit-Remaining"] = str(remaining)
+        r.headers["X-RateLimit-Limit"] = str(limit)
+        r.headers["X-RateLimit-Reset"] = str(int(reset or time.time() + 3600))
+    if retry_after is not None:
+        r.headers["Retry-After"] = str(retry_after)
+    return r
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.limiter = ratelimit.RateLimiter(max_delay=5)
+
+    def delay(self, priority):
+        with self.limiter.lock:
+            return self.limiter._delay(self.limiter.budgets[KEY], priority, time.time())
+
+    def test_unknown_budget(self):
+        start = time.monotonic()
+        self.limiter.acquire(KEY, events.LOW)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_priorities(self):
+        self.assertFalse(self.limiter.update(KEY, _response(remaining=20)))
+        self.assertGreater(self.delay(events.LOW), 0)
+        self.assertEqual(self.delay(events.NORMAL), 0)
+        self.assertEqual(self.delay(events.HIGH), 0)
+        # Requests let through are deducted from the budget.
+        self.assertEqual(self.limiter.budgets[KEY].remaining, 18)
+
+        self.limiter.update(KEY, _response(remaining=5))
+        self.assertGreater(self.delay(events.NORMAL), 0)
+        self.assertEqual(self.delay(events.HIGH), 0)
+
+    def test_wait_for_reset(self):
+        self.limiter.update(KEY, _response(remaining=0, reset=time.time() + 2))
+        start = time.monotonic()
+        self.limiter.acquire(KEY, events.LOW)
+        self.assertGreater(time.monotonic() - start, 0.1)
+        self.assertEqual(self.limiter.budgets[KEY].remaining, 99)
+        self.assertEqual(self.limiter.stats()["delayed"], 1)
+
+    def test_max_delay(self):
+        self.limiter.update(KEY, _response(remaining=0))
+        start = time.monotonic()
+        self.limiter.acquire(KEY, events.LOW)
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_rate_limited(self):
+        self.assertTrue(self.limiter.update(KEY, _response(403, retry_after=60)))
+        self.assertGreater(self.delay(events.HIGH), 50)
+        self.assertTrue(self.limiter.update(KEY, _response(429, remaining=0)))
+        self.assertFalse(self.limiter.update(("other", "core"), _response(403)))
+        self.assertEqual(self.limiter.stats()["limited"], 2)
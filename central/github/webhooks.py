@@ -1,4 +1,4 @@
-from .. import events, github, utils
+from .. import events, github
 from ..config import cfg
 
 import logging
@@ -9,11 +9,7 @@ def watched_repositories():
 
 
 class GHHookEventParser(events.EventTarget):
-    def accept_event(self, evt):
-        return evt.type == events.RawGHHook.TYPE
-
     def convert_commit(self, commit):
-        commit = utils.ObjectLike(commit)
         return {
             "author": commit.author,
             "distinct": commit.distinct,
@@ -136,6 +132,17 @@ class GHHookEventParser(events.EventTarget):
             repo, raw.sender.login, raw.comment.commit_id, raw.comment.html_url
         )
 
+    def convert_membership_event(self, raw):
+        # The team is only described by its id and name once deleted.
+        if raw.scope != "team" or raw.team.slug is None:
+            return None
+        team = raw.organization.login + "/" + raw.team.slug
+        return events.GHTeam(team, raw.action, raw.member.login)
+
+    def convert_team_event(self, raw):
+        team = raw.organization.login + "/" + raw.team.slug
+        return events.GHTeam(team, raw.action, None)
+
     def push_event(self, evt):
         if evt.raw.repository is not None:
             repo = evt.raw.repository.owner.login + "/" + evt.raw.repository.name
@@ -155,12 +162,17 @@ class GHHookEventParser(events.EventTarget):
             obj = self.convert_issue_comment_event(evt.raw)
         elif evt.gh_type == "commit_comment":
             obj = self.convert_commit_comment_event(evt.raw)
+        elif evt.gh_type == "membership":
+            obj = self.convert_membership_event(evt.raw)
+        elif evt.gh_type == "team":
+            obj = self.convert_team_event(evt.raw)
         else:
             logging.error("Unhandled event type %r in GH parser" % evt.gh_type)
             return
 
-        events.dispatcher.dispatch("ghhookparser", obj)
+        if obj is not None:
+            events.dispatcher.dispatch("ghhookparser", obj)
 
 
 def start():
-    events.dispatcher.register_target(GHHookEventParser())
+    events.dispatcher.register_target(GHHookEventParser(), [events.RawGHHook.TYPE])
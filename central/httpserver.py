@@ -0,0 +1,179 @@
+"""Thread pool WSGI server used by the web server module.
+
+The bottle default (wsgiref) handles one request at a time, so a slow upload
+delays every other request. This server accepts connections on one thread and
+handles them on a fixed pool of worker threads, keeping HTTP/1.1 connections
+alive between requests.
+
+Applications can take over a connection for long-lived responses by calling
+environ["central.detach"](), which returns the client socket and frees the
+worker thread.
+"""
+
+from . import events, stats
+
+import bottle
+import logging
+import queue
+import socket
+import wsgiref.simple_server
+
+
+class _RequestBody:
+    """wsgi.input limited to the request Content-Length, which keeps track of
+    the body bytes left unread by the application."""
+
+    def __init__(self, rfile, length):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size)
+        self.remaining -= len(data)
+        return data
+
+
+class _ServerHandler(wsgiref.simple_server.ServerHandler):
+    http_version = "1.1"
+
+    def finish_response(self):
+        if self.request_handler.detached:
+            # The application took over the connection and writes to it.
+            self.close()
+        else:
+            super().finish_response()
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        request_handler = self.request_handler
+        # The connection can only be reused if the client knows where the
+        # response ends and the request body was entirely consumed.
+        if (
+            "Content-Length" not in self.headers
+            or request_handler.body is None
+            or request_handler.body.remaining
+        ):
+            request_handler.close_connection = True
+        if request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+
+class _RequestHandler(wsgiref.simple_server.WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # Also bounds how long an idle keep-alive connection holds a worker.
+        self.timeout = self.server.keep_alive
+        super().setup()
+        # Headers and body are written separately: without this, Nagle's
+        # algorithm delays the body of responses on kept alive connections.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def detach(self):
+        """Hands the connection over to the application, which then owns the
+        socket: no response gets written, and the socket is not closed once
+        the request is handled."""
+        self.detached = True
+        self.close_connection = True
+        self.wfile.flush()
+        self.server.detached.add(self.connection)
+        return self.connection
+
+    def handle_one_request(self):
+        self.body = None
+        self.detached = False
+        try:
+            self.raw_requestline = self.rfile.readline(65537)
+        except (socket.timeout, ConnectionError):
+            self.close_connection = True
+            return
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            return
+
+        if "Transfer-Encoding" not in self.headers:
+            length = int(self.headers.get("Content-Length") or 0)
+            self.body = _RequestBody(self.rfile, length)
+        environ = self.get_environ()
+        environ["central.detach"] = self.detach
+        handler = _ServerHandler(
+            self.body or self.rfile,
+            self.wfile,
+            self.get_stderr(),
+            environ,
+            multithread=True,
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class _ThreadPoolWSGIServer(wsgiref.simple_server.WSGIServer):
+    def __init__(self, server_address, workers, keep_alive):
+        self.keep_alive = keep_alive
+        self.connections = queue.Queue()
+        # Connections taken over by the application.
+        self.detached = set()
+        stats.watch_queue("httpserver.connections", self.connections)
+        super().__init__(server_address, _RequestHandler)
+        for i in range(workers):
+            events.QueueWorker(
+                self.handle_connection, self.connections, name="httpserver:%d" % i
+            ).start()
+
+    def process_request(self, request, client_address):
+        self.connections.put((request, client_address))
+
+    def handle_connection(self, item):
+        request, client_address = item
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            if request in self.detached:
+                self.detached.discard(request)
+            else:
+                self.shutdown_request(request)
+
+
+class ThreadPoolServer(bottle.ServerAdapter):
+    """bottle server adapter for the thread pool WSGI server. Options: workers
+    (number of worker threads) and keep_alive (idle connection timeout, in
+    seconds)."""
+
+    def run(self, app):
+        server = _ThreadPoolWSGIServer(
+            (self.host, self.port),
+            self.options.get("workers", 16),
+            self.options.get("keep_alive", 5),
+        )
+        server.set_app(app)
+        self.port = server.server_port
+        server.serve_forever()
@@ -1,7 +1,7 @@
 """IRC client module that sends events to an IRC channel with nice,
 human-readable formatting. Also receives events from registered users."""
 
-from . import events, utils
+from . import events, stats, utils
 from .config import cfg
 
 from pypeul import IRC, Tags
@@ -69,26 +69,26 @@ class EventTarget(events.EventTarget):
     def __init__(self, bot):
         self.bot = bot
         self.queue = queue.Queue()
+        stats.watch_queue("ircclient.EventTarget", self.queue)
 
     def push_event(self, evt):
-        self.queue.put(evt)
-
-    def accept_event(self, evt):
-        accepted_types = [
-            events.Notification.TYPE,
-            events.DevWark.TYPE,
-        ]
-        return evt.type in accepted_types
+        self.queue.put((evt, events.dispatcher.defer_ack(evt)))
 
     def run(self):
         while True:
-            evt = self.queue.get()
-            if evt.type == events.Notification.TYPE:
-                self.bot.say(evt.msg)
-            elif evt.type == events.DevWark.TYPE:
-                self.bot.dev_wark(evt.accepted)
-            else:
-                logging.error("Got unknown event for irc: %r" % evt.type)
+            evt, ack = self.queue.get()
+            try:
+                self.handle(evt)
+            finally:
+                ack()
+
+    def handle(self, evt):
+        if evt.type == events.Notification.TYPE:
+            self.bot.say(evt.msg)
+        elif evt.type == events.DevWark.TYPE:
+            self.bot.dev_wark(evt.accepted)
+        else:
+            logging.error("Got unknown event for irc: %r" % evt.type)
 
 
 def start():
@@ -117,5 +117,7 @@ def start():
     utils.DaemonThread(target=bot.start).start()
 
     evt_target = EventTarget(bot)
-    events.dispatcher.register_target(evt_target)
+    events.dispatcher.register_target(
+        evt_target, [events.Notification.TYPE, events.DevWark.TYPE]
+    )
     utils.DaemonThread(target=evt_target.run).start()
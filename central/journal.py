@@ -0,0 +1,220 @@
+"""Durable append-only journal of dispatched events.
+
+Events are appended to segment files before being delivered, and every target
+acknowledges them once handled (see Dispatcher.defer_ack for targets handling
+them asynchronously). On startup, events which were not acknowledged
+by all the targets they were routed to get replayed, so that restarts do not
+lose in-flight work.
+
+Records are a header (kind, payload length, CRC32 of the payload, sequence
+number) followed by the payload: the pickled event and the names of the
+targets it was routed to for EVENT records, the name of the target which
+handled the event for ACK records.
+
+Appending an event only returns once the record is on disk. A single thread
+fsyncs on behalf of all writers, so concurrent appends share one fsync.
+"""
+
+from . import utils
+
+import logging
+import os
+import os.path
+import pickle
+import struct
+import threading
+import weakref
+import zlib
+
+_HEADER = struct.Struct("<BIIQ")
+_EVENT = 1
+_ACK = 2
+
+# Open journals by path, to restore pickled Acks.
+_JOURNALS = weakref.WeakValueDictionary()
+
+
+def _read_records(fp):
+    """Yields the (kind, seq, payload) records of a segment, stopping at the
+    first incomplete or corrupt record (e.g. torn by a crash)."""
+    while True:
+        header = fp.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            return
+        kind, size, crc, seq = _HEADER.unpack(header)
+        payload = fp.read(size)
+        if len(payload) < size or zlib.crc32(payload) != crc:
+            logging.warning("Truncated journal record in %s", fp.name)
+            return
+        yield kind, seq, payload
+
+
+class Ack:
+    """Acknowledges an event for a target when called. Can be pickled (e.g.
+    when queues spill to disk) and restored in the same process."""
+
+    __slots__ = ("journal", "seq", "name")
+
+    def __init__(self, journal, seq, name):
+        self.journal = journal
+        self.seq = seq
+        self.name = name
+
+    def __call__(self, durable=False):
+        self.journal.ack(self.seq, self.name, durable)
+
+    def __reduce__(self):
+        return (_restore_ack, (self.journal.path, self.seq, self.name))
+
+
+def _restore_ack(path, seq, name):
+    return Ack(_JOURNALS[path], seq, name)
+
+
+class Journal:
+    def __init__(self, path, segment_size=16 * 1024 * 1024):
+        self.path = path
+        self.segment_size = segment_size
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+
+        # Sequence number -> names of the targets yet to acknowledge it.
+        self.pending = {}
+        # Events read back from disk which still need to be replayed.
+        self.unacknowledged = {}
+        # (first sequence number, path) of each segment, oldest first.
+        self.segments = []
+
+        self.writes = 0
+        self.synced_writes = 0
+
+        os.makedirs(path, exist_ok=True)
+        self.next_seq = self._load() + 1
+        self.fp = self._open_segment(self.next_seq)
+        _JOURNALS[path] = self
+        utils.DaemonThread(target=self._commit, name="journal-commit").start()
+
+    def _load(self):
+        last_seq = 0
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".journal"):
+                continue
+            path = os.path.join(self.path, name)
+            self.segments.append((int(name.split(".")[0]), path))
+            with open(path, "rb") as fp:
+                for kind, seq, payload in _read_records(fp):
+                    last_seq = max(last_seq, seq)
+                    if kind == _EVENT:
+                        try:
+                            evt, names = pickle.loads(payload)
+                        except Exception:
+                            logging.exception("Skipping unreadable journal event")
+                            continue
+                        if names:
+                            self.pending[seq] = set(names)
+                            self.unacknowledged[seq] = evt
+                    elif kind == _ACK and seq in self.pending:
+                        self._acknowledge(seq, payload.decode("utf-8"))
+        return last_seq
+
+    def _open_segment(self, first_seq):
+        path = os.path.join(self.path, "%020d.journal" % first_seq)
+        if not self.segments or self.segments[-1][1] != path:
+            self.segments.append((first_seq, path))
+        fp = open(path, "ab")
+        # Make the new directory entry durable too.
+        dir_fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        return fp
+
+    def _write(self, kind, seq, payload):
+        self.fp.write(_HEADER.pack(kind, len(payload), zlib.crc32(payload), seq))
+        self.fp.write(payload)
+        self.writes += 1
+        self.cond.notify_all()
+
+    def _acknowledge(self, seq, name):
+        names = self.pending[seq]
+        names.discard(name)
+        if not names:
+            del self.pending[seq]
+            self.unacknowledged.pop(seq, None)
+
+    def append(self, evt, names):
+        """Durably records an event routed to the given target names and
+        returns its sequence number."""
+        payload = pickle.dumps((evt, tuple(names)), pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            self._write(_EVENT, seq, payload)
+            if names:
+                self.pending[seq] = set(names)
+            self._wait_synced()
+        return seq
+
+    def _wait_synced(self):
+        target = self.writes
+        while self.synced_writes < target:
+            self.cond.wait()
+
+    def ack(self, seq, name, durable=False):
+        """Records that a target has handled an event. Acknowledgements are not
+        waited on unless durable is set: losing one only causes the event to be
+        replayed."""
+        with self.lock:
+            if seq not in self.pending:
+                return
+            self._acknowledge(seq, name)
+            self._write(_ACK, seq, name.encode("utf-8"))
+            if durable:
+                self._wait_synced()
+
+    def take_unacknowledged(self):
+        """Returns the (seq, event, target names) of the events read from disk
+        which were not acknowledged by all their targets, oldest first."""
+        with self.lock:
+            replay = [
+                (seq, evt, set(self.pending[seq]))
+                for seq, evt in sorted(self.unacknowledged.items())
+            ]
+            self.unacknowledged = {}
+        return replay
+
+    def _commit(self):
+        with self.lock:
+            while self.synced_writes == self.writes:
+                self.cond.wait()
+            target = self.writes
+            fp = self.fp
+            fp.flush()
+
+        # Writers keep appending while this runs, and their records get
+        # committed together by the next fsync.
+        os.fsync(fp.fileno())
+
+        with self.lock:
+            self.synced_writes = max(self.synced_writes, target)
+            if fp.tell() >= self.segment_size:
+                self._rotate()
+            self._collect_segments()
+            self.cond.notify_all()
+
+    def _rotate(self):
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.fp.close()
+        self.synced_writes = self.writes
+        self.fp = self._open_segment(self.next_seq)
+
+    def _collect_segments(self):
+        """Deletes the oldest segments once all their events are handled."""
+        if len(self.segments) < 2:
+            return
+        oldest_pending = min(self.pending, default=self.next_seq)
+        while len(self.segments) > 1 and self.segments[1][0] <= oldest_pending:
+            _, path = self.segments.pop(0)
+            os.remove(path)
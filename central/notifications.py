@@ -1,6 +1,6 @@
 """Module that formats events into nice, human-readable text."""
 
-from . import events, utils
+from . import events, stats, utils
 from .config import cfg
 
 from pypeul import Tags
@@ -12,14 +12,16 @@ import queue
 class EventSettler(utils.DaemonThread):
     SETTLE_TIMEOUT_SECS = 30.0
 
-    def __init__(self, handler):
+    def __init__(self, handler, name):
         super(EventSettler, self).__init__()
         self.handler = handler
         self.queue = queue.Queue()
+        stats.watch_queue(name, self.queue)
         self.start()
 
-    def push(self, item):
-        self.queue.put(item)
+    def push(self, evt, ack):
+        """Queues an event, acknowledged by calling ack once handled."""
+        self.queue.put((evt, ack))
 
     def run_daemonized(self):
         l = []
@@ -29,51 +31,45 @@ class EventSettler(utils.DaemonThread):
                 while True:
                     l.append(self.queue.get(timeout=self.SETTLE_TIMEOUT_SECS))
             except queue.Empty:
-                self.handler(l)
+                try:
+                    self.handler([evt for evt, _ in l])
+                finally:
+                    for _, ack in l:
+                        ack()
 
 
 class EventTarget(events.EventTarget):
     def __init__(self):
-        self.build_status_settler = EventSettler(self.handle_build_status_settled)
-        self.queue = queue.Queue()
+        self.build_status_settler = EventSettler(
+            self.handle_build_status_settled, "notifications.build_status_settler"
+        )
 
+    # Events are handled inline: with async_dispatch, the dispatcher already
+    # spreads them across the workers configured for this target by key.
     def push_event(self, evt):
-        self.queue.put(evt)
-
-    def accept_event(self, evt):
-        accepted_types = [
-            events.Issue.TYPE,
-            events.GHPush.TYPE,
-            events.GHPullRequest.TYPE,
-            events.GHPullRequestReview.TYPE,
-            events.GHPullRequestComment.TYPE,
-            events.GHIssueComment.TYPE,
-            events.GHCommitComment.TYPE,
-            events.BuildStatus.TYPE,
-        ]
-        return evt.type in accepted_types
-
-    def run(self):
-        while True:
-            evt = self.queue.get()
-            if evt.type == events.Issue.TYPE:
-                self.handle_issue(evt)
-            elif evt.type == events.GHPush.TYPE:
-                self.handle_gh_push(evt)
-            elif evt.type == events.GHPullRequest.TYPE:
-                self.handle_gh_pull_request(evt)
-            elif evt.type == events.GHPullRequestReview.TYPE:
-                self.handle_gh_pull_request_review(evt)
-            elif evt.type == events.GHPullRequestComment.TYPE:
-                self.handle_gh_pull_request_comment(evt)
-            elif evt.type == events.GHIssueComment.TYPE:
-                self.handle_gh_issue_comment(evt)
-            elif evt.type == events.GHCommitComment.TYPE:
-                self.handle_gh_commit_comment(evt)
-            elif evt.type == events.BuildStatus.TYPE:
-                self.handle_build_status(evt)
-            else:
-                logging.error("Got unknown event for notifications: %r" % evt.type)
+        if evt.type == events.BuildStatus.TYPE:
+            # Acknowledged once settled.
+            self.handle_build_status(evt, events.dispatcher.defer_ack(evt))
+        else:
+            self.notify(evt)
+
+    def notify(self, evt):
+        if evt.type == events.Issue.TYPE:
+            self.handle_issue(evt)
+        elif evt.type == events.GHPush.TYPE:
+            self.handle_gh_push(evt)
+        elif evt.type == events.GHPullRequest.TYPE:
+            self.handle_gh_pull_request(evt)
+        elif evt.type == events.GHPullRequestReview.TYPE:
+            self.handle_gh_pull_request_review(evt)
+        elif evt.type == events.GHPullRequestComment.TYPE:
+            self.handle_gh_pull_request_comment(evt)
+        elif evt.type == events.GHIssueComment.TYPE:
+            self.handle_gh_issue_comment(evt)
+        elif evt.type == events.GHCommitComment.TYPE:
+            self.handle_gh_commit_comment(evt)
+        else:
+            logging.error("Got unknown event for notifications: %r" % evt.type)
 
     def format_nickname(self, nickname, avoid_hl=True):
         # Add a unicode zero-width space in the nickname to avoid highlights on IRC.
@@ -304,10 +300,11 @@ class EventTarget(events.EventTarget):
         )
         events.dispatcher.dispatch("notifications", msg_evt)
 
-    def handle_build_status(self, evt):
+    def handle_build_status(self, evt, ack):
         if evt.success or evt.pending:
+            ack()
             return
-        self.build_status_settler.push(evt)
+        self.build_status_settler.push(evt, ack)
 
     def handle_build_status_settled(self, evts):
         per_shortrev = {}
@@ -336,5 +333,16 @@ class EventTarget(events.EventTarget):
 
 def start():
     evt_target = EventTarget()
-    events.dispatcher.register_target(evt_target)
-    utils.DaemonThread(target=evt_target.run).start()
+    events.dispatcher.register_target(
+        evt_target,
+        [
+            events.Issue.TYPE,
+            events.GHPush.TYPE,
+            events.GHPullRequest.TYPE,
+            events.GHPullRequestReview.TYPE,
+            events.GHPullRequestComment.TYPE,
+            events.GHIssueComment.TYPE,
+            events.GHCommitComment.TYPE,
+            events.BuildStatus.TYPE,
+        ],
+    )
@@ -8,9 +8,6 @@ from .config import cfg
 
 
 class Reactor(events.EventTarget):
-    def accept_event(self, evt):
-        return evt.type == events.RawRedmineHook.TYPE
-
     def push_event(self, evt):
         if evt.rm_type not in ("opened", "updated"):
             pass  # Not handled yet.
@@ -32,4 +29,4 @@ class Reactor(events.EventTarget):
 
 def start():
     """Starts the Redmine events reactor."""
-    events.dispatcher.register_target(Reactor())
+    events.dispatcher.register_target(Reactor(), [events.RawRedmineHook.TYPE])
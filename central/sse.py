@@ -0,0 +1,204 @@
+"""Server-Sent Events stream of the dispatched events.
+
+EventStream is an event target fanning events out to the connected clients.
+Every client has a bounded output buffer: clients which do not keep up get
+disconnected rather than slowing down dispatching.
+
+Connections taken over from the thread pool HTTP server (see httpserver) are
+all written to by a single thread multiplexing them. With other servers, each
+client holds a request thread for as long as it stays connected.
+"""
+
+from . import eventlog, events, utils
+
+import logging
+import selectors
+import socket
+import threading
+import time
+
+_RESPONSE_HEADERS = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/event-stream\r\n"
+    b"Cache-Control: no-cache\r\n"
+    b"X-Accel-Buffering: no\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+_HEARTBEAT = b": ping\n\n"
+
+
+class _Client:
+    def __init__(self, types, repos, sock=None):
+        self.types = types
+        self.repos = repos
+        self.sock = sock
+        self.buffer = bytearray()
+        self.dropped = False
+        # Only used by clients without a socket, served by a request thread.
+        self.cond = None
+
+    def accepts(self, evt):
+        return (not self.types or evt.type in self.types) and (
+            not self.repos or evt.repo in self.repos
+        )
+
+
+class EventStream(events.EventTarget):
+    def __init__(self, max_buffer=256 * 1024, heartbeat=15):
+        self.max_buffer = max_buffer
+        self.heartbeat = heartbeat
+        self.lock = threading.Lock()
+        self.clients = []
+        self.next_id = 1
+        self.selector = None
+        self.wakeup_r = self.wakeup_w = None
+
+    def start(self):
+        """Starts the thread writing to the clients' sockets."""
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_r, self.wakeup_w = socket.socketpair()
+        self.wakeup_r.setblocking(False)
+        self.wakeup_w.setblocking(False)
+        self.selector.register(self.wakeup_r, selectors.EVENT_READ)
+        utils.DaemonThread(target=self.run, name="sse").start()
+
+    def accept_event(self, evt):
+        return bool(self.clients) and evt.type not in eventlog.HIDDEN_TYPES
+
+    def push_event(self, evt):
+        if evt.type in eventlog.HIDDEN_TYPES:
+            return
+        with self.lock:
+            clients = [c for c in self.clients if c.accepts(evt)]
+            if not clients:
+                return
+            id = self.next_id
+            self.next_id += 1
+        data = "id: %d\nevent: %s\ndata: %s\n\n" % (
+            id,
+            evt.type,
+            eventlog.event_json(evt, self.max_buffer // 4),
+        )
+        self._send(clients, data.encode("utf-8"))
+
+    def _send(self, clients, data):
+        dropped = 0
+        with self.lock:
+            for client in clients:
+                if client.dropped:
+                    continue
+                if len(client.buffer) + len(data) > self.max_buffer:
+                    client.dropped = True
+                    client.buffer.clear()
+                    dropped += 1
+                else:
+                    client.buffer += data
+                if client.cond is not None:
+                    client.cond.notify()
+        self._wakeup()
+        # Not logged with the lock held: log messages are dispatched as events
+        # too.
+        if dropped:
+            logging.info("Disconnecting %d slow event stream clients", dropped)
+
+    def _wakeup(self):
+        try:
+            self.wakeup_w.send(b"\0")
+        except (BlockingIOError, AttributeError):
+            pass  # A wakeup is already pending, or not started.
+
+    def add_socket(self, sock, types, repos):
+        """Streams the events to a connection taken over from the HTTP
+        server."""
+        sock.setblocking(False)
+        client = _Client(types, repos, sock)
+        client.buffer += _RESPONSE_HEADERS
+        with self.lock:
+            self.clients.append(client)
+        self._wakeup()
+
+    def iter_stream(self, types, repos):
+        """Returns an iterator over the stream data for a client served by a
+        request thread, which ends once the client is dropped."""
+        client = _Client(types, repos)
+        client.cond = threading.Condition(self.lock)
+        with self.lock:
+            self.clients.append(client)
+        return self._iter_client(client)
+
+    def _iter_client(self, client):
+        try:
+            while True:
+                with self.lock:
+                    if not client.buffer and not client.dropped:
+                        client.cond.wait(self.heartbeat)
+                    if client.dropped:
+                        return
+                    data = bytes(client.buffer) or _HEARTBEAT
+                    client.buffer.clear()
+                yield data
+        finally:
+            with self.lock:
+                self.clients.remove(client)
+
+    def run(self):
+        last_heartbeat = time.monotonic()
+        while True:
+            for key, mask in self.selector.select(self.heartbeat):
+                if key.fileobj is self.wakeup_r:
+                    try:
+                        while self.wakeup_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                client = key.data
+                if mask & selectors.EVENT_READ:
+                    # Clients are not expected to send anything: this is
+                    # either a disconnection or garbage.
+                    try:
+                        if not client.sock.recv(4096):
+                            client.dropped = True
+                    except BlockingIOError:
+                        pass
+                    except OSError:
+                        client.dropped = True
+
+            if time.monotonic() - last_heartbeat >= self.heartbeat:
+                last_heartbeat = time.monotonic()
+                with self.lock:
+                    clients = list(self.clients)
+                self._send(clients, _HEARTBEAT)
+
+            with self.lock:
+                for client in list(self.clients):
+                    if client.sock is not None:
+                        self._flush(client)
+
+    def _flush(self, client):
+        """Writes as much of a client's buffer as possible without blocking,
+        and updates what the selector waits for. Called with the lock held."""
+        if not client.dropped and client.buffer:
+            try:
+                sent = client.sock.send(client.buffer)
+                del client.buffer[:sent]
+            except BlockingIOError:
+                pass
+            except OSError:
+                client.dropped = True
+
+        registered = client.sock in self.selector.get_map()
+        if client.dropped:
+            if registered:
+                self.selector.unregister(client.sock)
+            client.sock.close()
+            self.clients.remove(client)
+            return
+        mask = selectors.EVENT_READ
+        if client.buffer:
+            mask |= selectors.EVENT_WRITE
+        if not registered:
+            self.selector.register(client.sock, mask, client)
+        elif self.selector.get_key(client.sock).events != mask:
+            self.selector.modify(client.sock, mask, client)
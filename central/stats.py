@@ -0,0 +1,124 @@
+"""Cheap runtime statistics: latency histograms, counters and queue depths.
+
+Recording never takes a lock: every thread records into its own dictionaries,
+which are only merged when statistics are read.
+"""
+
+import bisect
+import threading
+
+# Upper bounds (in seconds) of the latency histogram buckets. The last bucket
+# has no upper bound.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+_QUEUES = {}
+_QUEUES_LOCK = threading.Lock()
+_COMPONENTS = {}
+
+
+class Recorder:
+    def __init__(self):
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.Lock()  # Only taken when a new thread records.
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = ({}, {})
+            with self.lock:
+                self.shards.append(shard)
+            return shard
+
+    def observe(self, key, seconds):
+        """Records a duration in the histogram for key."""
+        histograms = self._shard()[0]
+        hist = histograms.get(key)
+        if hist is None:
+            # One count per bucket, then the total count and sum.
+            hist = histograms[key] = [0] * (len(BUCKETS) + 2) + [0.0]
+        hist[bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist[-2] += 1
+        hist[-1] += seconds
+
+    def increment(self, key, n=1):
+        counters = self._shard()[1]
+        counters[key] = counters.get(key, 0) + n
+
+    def histograms(self):
+        """Returns {key: {"count", "sum", "buckets"}}, merged across threads.
+        Buckets are [upper bound, count] pairs, the last bound being None."""
+        with self.lock:
+            shards = list(self.shards)
+        merged = {}
+        for histograms, _ in shards:
+            # dict.copy() and list() are atomic, unlike iterating directly over
+            # structures another thread is updating.
+            for key, hist in histograms.copy().items():
+                hist = list(hist)
+                total = merged.get(key)
+                if total is None:
+                    merged[key] = hist
+                else:
+                    for i, v in enumerate(hist):
+                        total[i] += v
+        return {
+            key: {
+                "count": hist[-2],
+                "sum": hist[-1],
+                "buckets": [
+                    [bound, count] for bound, count in zip(BUCKETS + (None,), hist[:-2])
+                ],
+            }
+            for key, hist in merged.items()
+        }
+
+    def counters(self):
+        with self.lock:
+            shards = list(self.shards)
+        merged = {}
+        for _, counters in shards:
+            for key, v in counters.copy().items():
+                merged[key] = merged.get(key, 0) + v
+        return merged
+
+
+def watch_queue(name, queue):
+    """Registers a queue (anything with a qsize method) for depth reporting.
+    Returns the name it is reported under, which gets a numeric suffix if
+    another queue already uses that name."""
+    with _QUEUES_LOCK:
+        unique = name
+        n = 1
+        while unique in _QUEUES:
+            n += 1
+            unique = "%s#%d" % (name, n)
+        _QUEUES[unique] = queue
+    return unique
+
+
+def queue_depths():
+    """Returns {name: {"depth": n}} for all watched queues, including the
+    number of dropped items for queues which count them."""
+    with _QUEUES_LOCK:
+        queues = dict(_QUEUES)
+    depths = {}
+    for name, queue in sorted(queues.items()):
+        depths[name] = {"depth": queue.qsize()}
+        if hasattr(queue, "dropped"):
+            depths[name]["dropped"] = queue.dropped
+    return depths
+
+
+def watch_component(name, get_stats):
+    """Registers a function returning a dict of statistics for a component
+    (e.g. hit and miss counters of a cache)."""
+    with _QUEUES_LOCK:
+        _COMPONENTS[name] = get_stats
+
+
+def component_stats():
+    with _QUEUES_LOCK:
+        components = dict(_COMPONENTS)
+    return {name: get_stats() for name, get_stats in sorted(components.items())}
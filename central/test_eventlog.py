@@ -0,0 +1,93 @@
+from . import eventlog, events, utils
+
+import json
+import unittest
+
+
+def build_status(pr, sha, repo="dolphin-emu/dolphin"):
+    return events.BuildStatus(repo, sha, sha[:6], "lint", pr, True, False, "", "")
+
+
+class TestEventLog(unittest.TestCase):
+    def test_query(self):
+        log = eventlog.EventLog()
+        for i in range(10):
+            log.add(build_status(i % 3, "%040x" % i))
+        log.add(events.Notification("hello"))
+
+        results = log.query(pr=1)
+        self.assertEqual([id for id, _ in results], [2, 5, 8])
+        data = json.loads(results[0][1])
+        self.assertEqual(data["id"], 2)
+        self.assertEqual(data["event"]["pr"], 1)
+        self.assertEqual(data["event"]["type"], "build_status")
+
+        self.assertEqual(len(log.query(type="build_status", pr=1, sha="%040x" % 4)), 1)
+        self.assertEqual(log.query(pr=1, repo="other/repo"), [])
+        self.assertEqual(log.query(sha="missing"), [])
+        self.assertEqual([id for id, _ in log.query(type="notification")], [11])
+        self.assertEqual(len(log.query()), 11)
+
+    def test_pagination(self):
+        log = eventlog.EventLog()
+        for i in range(10):
+            log.add(build_status(1, "%040x" % i))
+        ids = []
+        since = 0
+        while True:
+            page = log.query(since, limit=3, pr=1)
+            if not page:
+                break
+            ids.extend(id for id, _ in page)
+            since = page[-1][0]
+        self.assertEqual(ids, list(range(1, 11)))
+
+    def test_eviction(self):
+        log = eventlog.EventLog(max_events=100)
+        for i in range(1000):
+            log.add(build_status(i % 7, "%040x" % i))
+        self.assertEqual(len(log.entries), 100)
+        self.assertEqual(log.query(limit=1)[0][0], 901)
+        self.assertEqual(len(log.query(pr=3, limit=1000)), 14)
+        self.assertEqual(sum(len(index) for index in log.indexes.values()), 400)
+
+    def test_memory_cap(self):
+        log = eventlog.EventLog(max_bytes=64 * 1024)
+        for i in range(1000):
+            log.add(events.Notification("x" * 500))
+        self.assertLessEqual(log.size, 64 * 1024)
+        self.assertGreater(len(log.entries), 10)
+
+        log.add(events.Notification("x" * 10000))
+        data = json.loads(log.query(since=log.next_id - 2)[0][1])
+        self.assertTrue(data["event"]["truncated"])
+
+    def test_nested_payload(self):
+        raw = utils.ObjectLike(
+            {"author": {"name": "Pierre", "email": "p@dolphin"}, "added": ["a.cpp"]}
+        )
+        commit = {"author": raw.author, "added": raw.added, "hash": "abc"}
+        evt = events.GHPush(
+            "dolphin-emu/dolphin",
+            "p",
+            "0",
+            "abc",
+            [commit],
+            None,
+            "master",
+            "heads",
+            False,
+            False,
+            False,
+        )
+        data = json.loads(eventlog.event_json(evt, 10000))
+        self.assertEqual(
+            data["commits"],
+            [
+                {
+                    "author": {"name": "Pierre", "email": "p@dolphin"},
+                    "added": ["a.cpp"],
+                    "hash": "abc",
+                }
+            ],
+        )
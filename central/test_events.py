@@ -1,5 +1,8 @@
-from . import events
+from . import events, utils
 
+import pickle
+import tempfile
+import threading
 import unittest
 
 
@@ -88,3 +91,285 @@ class TestDispatcher(unittest.TestCase):
         dispatcher.register_target(FailsPush())
 
         dispatcher.dispatch("test_dispatch_error", TestEvent1(1))
+
+    def test_dispatch_typed(self):
+        class Target(events.EventTarget):
+            def __init__(self):
+                self.vals = []
+
+            def accept_event(self, evt):
+                raise RuntimeError("accept_event called for a typed target")
+
+            def push_event(self, evt):
+                self.vals.append((evt.type, evt.source))
+
+        class Dynamic(events.EventTarget):
+            def __init__(self):
+                self.vals = []
+
+            def accept_event(self, evt):
+                return evt.type == "test2"
+
+            def push_event(self, evt):
+                self.vals.append(evt.val2)
+
+        order = []
+
+        class Ordered(events.EventTarget):
+            def __init__(self, name):
+                self.name = name
+
+            def accept_event(self, evt):
+                return True
+
+            def push_event(self, evt):
+                order.append(self.name)
+
+        typed = Target()
+        dynamic = Dynamic()
+
+        dispatcher = events.Dispatcher()
+        dispatcher.register_target(Ordered("first"))
+        dispatcher.register_target(typed, [TestEvent1.TYPE])
+        dispatcher.register_target(dynamic)
+        dispatcher.register_target(Ordered("last"), [TestEvent1.TYPE])
+
+        dispatcher.dispatch("a", TestEvent1(1))
+        dispatcher.dispatch("b", TestEvent2(2))
+
+        self.assertSequenceEqual(typed.vals, [("test1", "a")])
+        self.assertSequenceEqual(dynamic.vals, [2])
+        self.assertSequenceEqual(order, ["first", "last", "first"])
+
+        # Registering a target after dispatching invalidates cached routes.
+        late = Target()
+        dispatcher.register_target(late, [TestEvent2.TYPE])
+        dispatcher.dispatch("c", TestEvent2(3))
+        self.assertSequenceEqual(late.vals, [("test2", "c")])
+
+    def test_dispatch_async(self):
+        release = threading.Event()
+        done = threading.Event()
+
+        class SlowTarget(events.EventTarget):
+            def __init__(self):
+                self.vals = []
+
+            def push_event(self, evt):
+                release.wait()
+                self.vals.append(evt.val1)
+                if len(self.vals) == 3:
+                    done.set()
+
+        class Fast(events.EventTarget):
+            def __init__(self):
+                self.vals = []
+
+            def push_event(self, evt):
+                self.vals.append(evt.val1)
+
+        slow = SlowTarget()
+        fast = Fast()
+
+        dispatcher = events.Dispatcher()
+        dispatcher.configure(
+            utils.ObjectLike(
+                {
+                    "async_dispatch": True,
+                    "targets": {events.target_name(fast): {"async_dispatch": False}},
+                }
+            )
+        )
+        dispatcher.register_target(slow, [TestEvent1.TYPE])
+        dispatcher.register_target(fast, [TestEvent1.TYPE])
+
+        for i in range(3):
+            dispatcher.dispatch("test_dispatch_async", TestEvent1(i))
+
+        # The synchronous target got its events while the slow one is blocked.
+        self.assertSequenceEqual(fast.vals, [0, 1, 2])
+        self.assertSequenceEqual(slow.vals, [])
+        release.set()
+        self.assertTrue(done.wait(5))
+        self.assertSequenceEqual(slow.vals, [0, 1, 2])
+
+
+class TestEvent(unittest.TestCase):
+    def test_attributes(self):
+        evt = events.RawGHHook("push", {"repository": {"name": "dolphin"}})
+        self.assertEqual(evt.type, "raw_gh_hook")
+        self.assertEqual(evt.gh_type, "push")
+        self.assertEqual(evt.raw.repository.name, "dolphin")
+        self.assertIsNone(evt.source)
+        self.assertIsNone(evt.missing)
+        self.assertIn("raw", evt)
+        self.assertNotIn("missing", evt)
+        self.assertIs(type(evt), type(events.RawGHHook("ping", {})))
+        with self.assertRaises(AttributeError):
+            evt.__dict__
+
+    def test_as_dict(self):
+        evt = TestEvent1(42)
+        evt.source = "test"
+        self.assertEqual(evt.as_dict(), {"source": "test", "val1": 42, "type": "test1"})
+        self.assertEqual(repr(evt), repr(evt.as_dict()))
+
+    def test_pickle(self):
+        evt = events.RawGHHook("push", {"ref": "refs/heads/master"})
+        evt.source = "test"
+        restored = pickle.loads(pickle.dumps(evt))
+        self.assertIs(type(restored), type(evt))
+        self.assertEqual(restored.as_dict(), evt.as_dict())
+        self.assertEqual(restored.raw.ref, "refs/heads/master")
+
+
+class TestShardedExecutor(unittest.TestCase):
+    def test_ordering_and_parallelism(self):
+        blocked = threading.Event()
+        done = threading.Event()
+        handled = []
+
+        def handler(item):
+            key, val = item
+            if key == "slow":
+                blocked.wait()
+            handled.append(item)
+            if len(handled) == 7:
+                done.set()
+
+        executor = events.ShardedExecutor(handler, "test_sharded", shards=4)
+        slow_shard = hash("slow") % 4
+        other = next(k for k in map(str, range(100)) if hash(k) % 4 != slow_shard)
+
+        executor.put("slow", ("slow", 0))
+        for i in range(3):
+            executor.put(other, (other, i))
+            executor.put("slow", ("slow", i + 1))
+
+        # Items for another key are not stuck behind the slow one.
+        for _ in range(100):
+            if len(handled) == 3:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(handled, [(other, 0), (other, 1), (other, 2)])
+
+        blocked.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual([val for key, val in handled if key == "slow"], [0, 1, 2, 3])
+
+    def test_ordering_across_priorities(self):
+        blocked = threading.Event()
+        done = threading.Event()
+        handled = []
+
+        def handler(item):
+            blocked.wait()
+            handled.append(item)
+            if len(handled) == 4:
+                done.set()
+
+        executor = events.ShardedExecutor(handler, "test_pinned")
+        executor.put("a", "a0", events.LOW)
+        executor.put("a", "a1", events.LOW)
+        executor.put("a", "a2", events.HIGH)
+        executor.put("b", "b0", events.HIGH)
+        blocked.set()
+        self.assertTrue(done.wait(5))
+        # a0 may have been taken before anything else was queued.
+        self.assertIn(handled, (["a0", "b0", "a1", "a2"], ["b0", "a0", "a1", "a2"]))
+        self.assertEqual(executor.pinned, {})
+
+    def test_shard_key(self):
+        evt = events.BuildStatus("o/r", "abc", "abc", "lint", 1, True, False, "", "")
+        self.assertEqual(evt.shard_key(), ("o/r", "abc"))
+        self.assertIsNone(events.Notification("hi").shard_key())
+
+
+class TestBoundedQueue(unittest.TestCase):
+    def test_block(self):
+        q = events.BoundedQueue(2)
+        q.put(1)
+        q.put(2)
+        t = threading.Thread(target=q.put, args=(3,))
+        t.start()
+        t.join(0.1)
+        self.assertTrue(t.is_alive())
+        self.assertEqual(q.get(), 1)
+        t.join(5)
+        self.assertFalse(t.is_alive())
+        self.assertEqual([q.get(), q.get()], [2, 3])
+
+    def test_drop_oldest(self):
+        q = events.BoundedQueue(2, "drop_oldest")
+        for i in range(5):
+            q.put(i)
+        self.assertEqual(q.dropped, 3)
+        self.assertEqual([q.get(), q.get()], [3, 4])
+
+    def test_spill(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            q = events.BoundedQueue(2, "spill", tmpdir)
+            for i in range(5):
+                q.put({"val": i})
+            self.assertEqual(q.qsize(), 5)
+            self.assertEqual([q.get()["val"] for _ in range(3)], [0, 1, 2])
+            # New items go after the spilled ones until the spool is drained.
+            q.put({"val": 5})
+            self.assertEqual([q.get()["val"] for _ in range(3)], [3, 4, 5])
+            self.assertEqual(q.qsize(), 0)
+
+    def test_spill_priority(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            q = events.BoundedQueue(2, "spill", tmpdir)
+            for i in range(8):
+                q.put(i, events.LOW)
+            q.put("high", events.HIGH)
+            self.assertEqual(q.qsize(), 9)
+            self.assertEqual([q.get() for _ in range(3)], ["high", 0, 1])
+            self.assertEqual([q.get() for _ in range(6)], [2, 3, 4, 5, 6, 7])
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            events.BoundedQueue(2, "explode")
+
+    def test_priority_lanes(self):
+        q = events.BoundedQueue(10)
+        q.put("low", events.LOW)
+        q.put("normal")
+        q.put("high1", events.HIGH)
+        q.put("high2", events.HIGH)
+        self.assertEqual(
+            [q.get() for _ in range(4)], ["high1", "high2", "normal", "low"]
+        )
+
+    def test_starvation(self):
+        q = events.BoundedQueue(100, starvation_limit=3)
+        q.put("low", events.LOW)
+        for i in range(10):
+            q.put(i, events.HIGH)
+        self.assertEqual([q.get() for _ in range(5)], [0, 1, 2, "low", 3])
+
+    def test_drop_oldest_low_priority_first(self):
+        q = events.BoundedQueue(2, "drop_oldest")
+        q.put("high", events.HIGH)
+        q.put("low1", events.LOW)
+        q.put("low2", events.LOW)
+        self.assertEqual(q.dropped, 1)
+        self.assertEqual([q.get(), q.get()], ["high", "low2"])
+
+    def test_drop_oldest_new_item_lowest(self):
+        dropped = []
+        q = events.BoundedQueue(2, "drop_oldest", on_drop=dropped.append)
+        q.put("h1", events.HIGH)
+        q.put("h2", events.HIGH)
+        q.put("low", events.LOW)
+        q.put("n", events.NORMAL)
+        self.assertEqual(q.dropped, 2)
+        self.assertEqual(dropped, ["low", "n"])
+        self.assertEqual([q.get(), q.get()], ["h1", "h2"])
+
+    def test_event_priority(self):
+        evt = events.BuildStatus("o/r", "abc", "abc", "lint", 1, True, False, "", "")
+        self.assertEqual(evt.PRIORITY, events.HIGH)
+        self.assertEqual(events.InternalLog("", "", 0, "", "").PRIORITY, events.LOW)
+        self.assertEqual(events.DevWark(True).PRIORITY, events.NORMAL)
@@ -0,0 +1,76 @@
+from . import httpserver, utils
+
+import bottle
+import http.client
+import threading
+import time
+import unittest
+
+
+def start_server(app, **options):
+    server = httpserver.ThreadPoolServer(host="127.0.0.1", port=0, **options)
+    utils.DaemonThread(target=server.run, args=(app,)).start()
+    for _ in range(500):
+        if server.port:
+            return server.port
+        time.sleep(0.01)
+    raise RuntimeError("server did not start")
+
+
+class TestThreadPoolServer(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+        app = bottle.Bottle()
+
+        @app.route("/")
+        def index():
+            return "index"
+
+        @app.route("/slow")
+        def slow():
+            self.release.wait(5)
+            return "slow"
+
+        @app.route("/echo", method="POST")
+        def echo():
+            return bottle.request.body.read()
+
+        @app.route("/ignore", method="POST")
+        def ignore():
+            return "ignored"
+
+        self.port = start_server(app, workers=4, keep_alive=1)
+
+    def tearDown(self):
+        self.release.set()
+
+    def connect(self):
+        return http.client.HTTPConnection("127.0.0.1", self.port, timeout=5)
+
+    def test_keep_alive(self):
+        conn = self.connect()
+        for body in (b"a", b"bb", b"ccc"):
+            conn.request("POST", "/echo", body)
+            resp = conn.getresponse()
+            self.assertEqual(resp.read(), body)
+            self.assertFalse(resp.will_close)
+        sock = conn.sock
+        conn.request("GET", "/")
+        self.assertEqual(conn.getresponse().read(), b"index")
+        self.assertIs(conn.sock, sock)
+
+    def test_unread_body_closes_connection(self):
+        conn = self.connect()
+        conn.request("POST", "/ignore", b"x" * 1000)
+        resp = conn.getresponse()
+        self.assertEqual(resp.read(), b"ignored")
+        self.assertTrue(resp.will_close)
+
+    def test_slow_request_does_not_block(self):
+        slow = self.connect()
+        slow.request("GET", "/slow")
+        conn = self.connect()
+        conn.request("GET", "/")
+        self.assertEqual(conn.getresponse().read(), b"index")
+        self.release.set()
+        self.assertEqual(slow.getresponse().read(), b"slow")
@@ -0,0 +1,162 @@
+from . import events, journal, utils
+
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+import unittest.mock
+
+
+@events.event("test_journal")
+def JournalTestEvent(val: int):
+    return {"val": val}
+
+
+class TestJournal(unittest.TestCase):
+    def test_replay_unacknowledged(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            j = journal.Journal(tmpdir)
+            seq1 = j.append(JournalTestEvent(1), ["a", "b"])
+            seq2 = j.append(JournalTestEvent(2), ["a"])
+            seq3 = j.append(JournalTestEvent(3), ["a"])
+            j.ack(seq1, "a")
+            j.ack(seq2, "a")
+            # Make sure acknowledgements hit the disk before reopening.
+            j.append(JournalTestEvent(4), [])
+
+            replay = journal.Journal(tmpdir).take_unacknowledged()
+            self.assertEqual(
+                [(seq, evt.val, names) for seq, evt, names in replay],
+                [(seq1, 1, {"b"}), (seq3, 3, {"a"})],
+            )
+
+    def test_truncated_record(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            j = journal.Journal(tmpdir)
+            j.append(JournalTestEvent(1), ["a"])
+            j.append(JournalTestEvent(2), ["a"])
+            (_, path) = j.segments[-1]
+            with open(path, "r+b") as fp:
+                fp.truncate(os.path.getsize(path) - 1)
+
+            replay = journal.Journal(tmpdir).take_unacknowledged()
+            self.assertEqual([evt.val for _, evt, _ in replay], [1])
+
+    def test_collect_segments(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            j = journal.Journal(tmpdir, segment_size=1)
+            for i in range(3):
+                j.ack(j.append(JournalTestEvent(i), ["a"]), "a")
+            # Segments only holding handled events get deleted.
+            j.append(JournalTestEvent(3), ["a"])
+            self.assertLessEqual(len(os.listdir(tmpdir)), 2)
+
+
+class TestDispatcherJournal(unittest.TestCase):
+    def test_replay(self):
+        class Target1(events.EventTarget):
+            def __init__(self):
+                self.vals = []
+
+            def push_event(self, evt):
+                self.vals.append(evt.val)
+
+        class Target2(Target1):
+            pass
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = utils.ObjectLike({"journal": {"path": tmpdir}})
+
+            dispatcher = events.Dispatcher()
+            dispatcher.configure(settings)
+            target1 = Target1()
+            dispatcher.register_target(target1, [JournalTestEvent.TYPE])
+            dispatcher.register_target(Target2(), [JournalTestEvent.TYPE])
+            dispatcher.dispatch("test", JournalTestEvent(1))
+            self.assertEqual(target1.vals, [1])
+            self.assertEqual(dispatcher.journal.pending, {})
+
+            # Simulate the process dying after only Target1 handled an event.
+            name1 = events.target_name(target1)
+            name2 = events.target_name(Target2())
+            seq = dispatcher.journal.append(JournalTestEvent(2), [name1, name2])
+            dispatcher.journal.ack(seq, name1)
+            dispatcher.journal.append(JournalTestEvent(3), [])
+
+            target1 = Target1()
+            target2 = Target2()
+            dispatcher = events.Dispatcher()
+            dispatcher.configure(settings)
+            dispatcher.register_target(target1, [JournalTestEvent.TYPE])
+            dispatcher.register_target(target2, [JournalTestEvent.TYPE])
+            dispatcher.replay_journal()
+            self.assertEqual(target1.vals, [])
+            self.assertEqual(target2.vals, [2])
+            self.assertEqual(dispatcher.journal.pending, {})
+
+    def test_dropped_events_acknowledged(self):
+        class Blocked(events.EventTarget):
+            def __init__(self):
+                self.unblock = threading.Event()
+                self.vals = []
+
+            def push_event(self, evt):
+                self.unblock.wait()
+                self.vals.append(evt.val)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = utils.ObjectLike(
+                {
+                    "async_dispatch": True,
+                    "queue_size": 2,
+                    "overflow": "drop_oldest",
+                    "journal": {"path": tmpdir, "segment_size": 1},
+                }
+            )
+            dispatcher = events.Dispatcher()
+            dispatcher.configure(settings)
+            target = Blocked()
+            dispatcher.register_target(target, [JournalTestEvent.TYPE])
+            for i in range(20):
+                dispatcher.dispatch("test", JournalTestEvent(i))
+            target.unblock.set()
+
+            deadline = time.monotonic() + 5
+            while dispatcher.journal.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(dispatcher.journal.pending, {})
+            self.assertEqual(target.vals[-2:], [18, 19])
+            # Segments of the dropped events are collected.
+            dispatcher.dispatch("test", JournalTestEvent(20))
+            self.assertLessEqual(len(os.listdir(tmpdir)), 3)
+
+    def test_deferred_ack(self):
+        class Deferring(events.EventTarget):
+            def __init__(self):
+                self.acks = []
+
+            def push_event(self, evt):
+                self.acks.append(events.dispatcher.defer_ack(evt))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            settings = utils.ObjectLike({"journal": {"path": tmpdir}})
+            dispatcher = events.Dispatcher()
+            dispatcher.configure(settings)
+            target = Deferring()
+            dispatcher.register_target(target, [JournalTestEvent.TYPE])
+            with unittest.mock.patch.object(events, "dispatcher", dispatcher):
+                dispatcher.dispatch("test", JournalTestEvent(1))
+            self.assertEqual(len(dispatcher.journal.pending), 1)
+
+            # Acks survive being spilled to disk.
+            ack = pickle.loads(pickle.dumps(target.acks[0]))
+            ack(durable=True)
+            self.assertEqual(dispatcher.journal.pending, {})
+            replay = journal.Journal(tmpdir).take_unacknowledged()
+            self.assertEqual(replay, [])
+
+    def test_no_deferred_ack_without_journal(self):
+        dispatcher = events.Dispatcher()
+        self.assertIs(dispatcher.defer_ack(JournalTestEvent(1)), events._no_ack)
@@ -0,0 +1,71 @@
+from . import events, sse, webserver
+from .test_httpserver import start_server
+
+import bottle
+import socket
+import unittest
+
+
+class TestEventStream(unittest.TestCase):
+    def setUp(self):
+        self.original = webserver.event_stream
+        self.stream = webserver.event_stream = sse.EventStream(max_buffer=4096)
+        self.stream.start()
+
+    def tearDown(self):
+        webserver.event_stream = self.original
+
+    def read_until(self, sock, marker):
+        data = b""
+        while marker not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def test_detached_stream(self):
+        port = start_server(bottle.default_app(), workers=1)
+        sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+        sock.sendall(b"GET /events/stream?type=notification HTTP/1.1\r\n\r\n")
+        headers = self.read_until(sock, b"\r\n\r\n")
+        self.assertIn(b"text/event-stream", headers)
+
+        # The only worker is free again.
+        conn = socket.create_connection(("127.0.0.1", port), timeout=5)
+        conn.sendall(b"GET /api/events HTTP/1.1\r\n\r\n")
+        self.assertIn(b"200 OK", self.read_until(conn, b"\r\n\r\n"))
+
+        self.assertTrue(self.stream.accept_event(events.Notification("x")))
+        self.stream.push_event(events.DevWark(True))
+        self.stream.push_event(events.Notification("hello"))
+        data = self.read_until(sock, b"\n\n")
+        self.assertIn(b"event: notification\n", data)
+        self.assertIn(b'"msg": "hello"', data)
+        self.assertNotIn(b"dev_wark", data)
+
+    def test_hidden_types(self):
+        stream = self.stream.iter_stream(frozenset(), frozenset())
+        hidden = events.RawRedmineHook("issue", {"secret": "x"})
+        self.assertFalse(self.stream.accept_event(hidden))
+        self.stream.push_event(hidden)
+        self.stream.push_event(events.Notification("hello"))
+        data = next(stream)
+        self.assertNotIn(b"raw_redmine_hook", data)
+        self.assertIn(b"event: notification", data)
+        stream.close()
+
+    def test_slow_client_dropped(self):
+        stream = self.stream.iter_stream(frozenset(), frozenset(["o/r"]))
+        self.stream.push_event(
+            events.BuildStatus("o/r", "abc", "abc", "lint", 1, True, False, "", "")
+        )
+        self.assertIn(b"event: build_status", next(stream))
+        for i in range(100):
+            self.stream.push_event(events.Notification("ignored"))
+            self.stream.push_event(
+                events.BuildStatus("o/r", "abc", "abc", "lint", i, True, False, "", "")
+            )
+        self.assertEqual(list(stream), [])
+        self.assertEqual(self.stream.clients, [])
+        self.assertFalse(self.stream.accept_event(events.Notification("x")))
@@ -0,0 +1,85 @@
+from . import events, stats, utils
+
+import threading
+import unittest
+
+
+class TestRecorder(unittest.TestCase):
+    def test_merge_threads(self):
+        recorder = stats.Recorder()
+
+        def record():
+            for _ in range(100):
+                recorder.observe("latency", 0.002)
+                recorder.increment("count")
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(recorder.counters(), {"count": 400})
+        hist = recorder.histograms()["latency"]
+        self.assertEqual(hist["count"], 400)
+        self.assertAlmostEqual(hist["sum"], 0.8)
+        self.assertIn([0.005, 400], hist["buckets"])
+
+    def test_queue_depths(self):
+        q = events.BoundedQueue(1, "drop_oldest")
+        q.put(1)
+        q.put(2)
+        stats.watch_queue("test_stats.queue", q)
+        self.assertEqual(
+            stats.queue_depths()["test_stats.queue"], {"depth": 1, "dropped": 1}
+        )
+
+    def test_queue_name_collision(self):
+        class QueueingTarget(events.EventTarget):
+            def __init__(self):
+                self.queue = events.BoundedQueue(10)
+                self.name = stats.watch_queue(events.target_name(self), self.queue)
+
+            def push_event(self, evt):
+                self.queue.put(evt)
+
+        dispatcher = events.Dispatcher()
+        dispatcher.configure(utils.ObjectLike({"async_dispatch": True}))
+        target = QueueingTarget()
+        dispatcher.register_target(target, [StatsTestEvent.TYPE])
+        with stats._QUEUES_LOCK:
+            queues = dict(stats._QUEUES)
+        self.assertIs(queues[target.name], target.queue)
+        self.assertIsNot(queues["dispatch:" + target.name], target.queue)
+
+        other = events.BoundedQueue(10)
+        self.assertEqual(stats.watch_queue(target.name, other), target.name + "#2")
+        self.assertIs(stats._QUEUES[target.name], target.queue)
+
+
+@events.event("test_stats")
+def StatsTestEvent():
+    return {}
+
+
+class TestDispatcherStatistics(unittest.TestCase):
+    def test_statistics(self):
+        class Target(events.EventTarget):
+            def accept_event(self, evt):
+                return True
+
+            def push_event(self, evt):
+                raise RuntimeError("fail")
+
+        dispatcher = events.Dispatcher()
+        target = Target()
+        dispatcher.register_target(target)
+        for _ in range(dispatcher.ACCEPT_SAMPLING + 1):
+            dispatcher.dispatch("test", StatsTestEvent())
+
+        per_type = dispatcher.statistics()[events.target_name(target)]
+        self.assertEqual(
+            per_type["test_stats"]["errors"], dispatcher.ACCEPT_SAMPLING + 1
+        )
+        self.assertEqual(per_type["test_stats"]["accept"]["count"], 2)
+        self.assertEqual(per_type["test_stats"]["push"]["count"], 2)
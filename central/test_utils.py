@@ -0,0 +1,173 @@
+from . import utils
+
+import io
+import os
+import pickle
+import tempfile
+import time
+import unittest
+
+
+class TestObjectLike(unittest.TestCase):
+    def test_nested(self):
+        raw = {
+            "repository": {"owner": {"login": "dolphin-emu"}, "name": "dolphin"},
+            "commits": [{"id": "abc", "added": ["a"]}, {"id": "def", "added": []}],
+            "count": 2,
+        }
+        obj = utils.ObjectLike(raw)
+        self.assertEqual(obj.repository.owner.login, "dolphin-emu")
+        self.assertEqual(obj["repository"]["name"], "dolphin")
+        self.assertEqual(obj.count, 2)
+        self.assertIsNone(obj.missing)
+        self.assertEqual([c.id for c in obj.commits], ["abc", "def"])
+        self.assertEqual(len(obj.commits[0].added), 1)
+        self.assertEqual(obj.commits[-1].id, "def")
+        with self.assertRaises(KeyError):
+            obj["missing"]
+
+    def test_memoized(self):
+        raw = {"a": {"b": {"c": 1}}, "l": [{"x": 1}]}
+        obj = utils.ObjectLike(raw)
+        self.assertIs(obj.a, obj.a)
+        self.assertIs(obj.a.b, obj.a.b)
+        self.assertIs(obj.l, obj.l)
+        self.assertIs(obj.l[0], obj.l[-1])
+        self.assertIs(next(iter(obj.l)), obj.l[0])
+
+        # Wrappers are views: replacing the underlying value is picked up.
+        raw["a"] = {"b": {"c": 2}}
+        self.assertEqual(obj.a.b.c, 2)
+
+    def test_list_like(self):
+        obj = utils.ObjectLike({"l1": ["a", "b"], "l2": ["c"]})
+        self.assertEqual(obj.l1 + obj.l2, ["a", "b", "c"])
+        self.assertEqual([] + obj.l1, ["a", "b"])
+        self.assertEqual((obj.missing or []) + obj.l2, ["c"])
+        self.assertIn("a", obj.l1)
+        self.assertEqual(obj.l1, ["a", "b"])
+        self.assertEqual(obj.l1[1:], ["b"])
+
+    def test_pickle(self):
+        obj = utils.ObjectLike({"a": {"b": [{"c": 1}]}})
+        restored = pickle.loads(pickle.dumps(obj))
+        self.assertEqual(restored.a.b[0].c, 1)
+
+
+class TestRecentlySeen(unittest.TestCase):
+    def test_add(self):
+        seen = utils.RecentlySeen(maxsize=2)
+        self.assertTrue(seen.add("a"))
+        self.assertFalse(seen.add("a"))
+        self.assertTrue(seen.add("b"))
+        self.assertTrue(seen.add("c"))
+        # "a" was evicted to stay within maxsize.
+        self.assertTrue(seen.add("a"))
+
+    def test_ttl(self):
+        seen = utils.RecentlySeen(ttl=0)
+        self.assertTrue(seen.add("a"))
+        self.assertTrue(seen.add("a"))
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "seen")
+            seen = utils.RecentlySeen(maxsize=2, path=path)
+            for key in ("a", "b", "c", "d", "e"):
+                seen.add(key)
+
+            seen = utils.RecentlySeen(maxsize=2, path=path)
+            self.assertFalse(seen.add("e"))
+            self.assertFalse(seen.add("d"))
+            self.assertTrue(seen.add("a"))
+
+    def test_torn_line(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "seen")
+            with open(path, "w") as fp:
+                fp.write("%f a\n" % time.time())
+                # A crash while writing left a partial line, which the next
+                # write got appended to.
+                fp.write("%.2f" % time.time())
+                fp.write("%f b\n" % time.time())
+
+            seen = utils.RecentlySeen(path=path)
+            self.assertIn("a", seen)
+            self.assertTrue(seen.add("c"))
+
+
+class TestPersistentMap(unittest.TestCase):
+    def test_set(self):
+        values = utils.PersistentMap(maxsize=2)
+        values.set("a", 1)
+        values.set("b", [2])
+        self.assertEqual((values.get("a"), values.get("b")), (1, [2]))
+        values.set("a", None)
+        self.assertIsNone(values.get("a"))
+        values.set("c", 3)
+        values.set("d", 4)
+        # "b" was evicted to stay within maxsize.
+        self.assertEqual(values.get("b", "missing"), "missing")
+
+    def test_persisted(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "values")
+            values = utils.PersistentMap(maxsize=2, path=path)
+            for i, key in enumerate(("a", "b", "c", "d", "e")):
+                values.set(key, i)
+            values.set("d", None)
+            with open(path, "a") as fp:
+                fp.write('["f", ')
+
+            values = utils.PersistentMap(maxsize=2, path=path)
+            self.assertEqual(values.values, {"e": 4})
+
+
+class TestIterJsonValues(unittest.TestCase):
+    def decode(self, data, **kwargs):
+        return list(utils.iter_json_values(io.BytesIO(data), **kwargs))
+
+    def test_array(self):
+        data = b' [ {"a": 1}, [2, 3], "x\\u00e9", 12345 , null ] \n'
+        for chunk_size in (1, 2, 7, 1024):
+            self.assertEqual(
+                self.decode(data, chunk_size=chunk_size),
+                [{"a": 1}, [2, 3], "xé", 12345, None],
+            )
+
+    def test_single_value(self):
+        self.assertEqual(self.decode(b'{"a": [1]}', chunk_size=3), [{"a": [1]}])
+        self.assertEqual(self.decode(b"42", chunk_size=1), [42])
+        self.assertEqual(self.decode(b"[]"), [])
+
+    def test_number_split_across_chunks(self):
+        for number in ("12345.5", "1e5", "-1.5E-3", "12345"):
+            for split in range(1, len(number)):
+                data = ("[" + " " * (16 - split - 1) + number + "]").encode()
+                self.assertEqual(
+                    self.decode(data, chunk_size=16), [float(number)], msg=data
+                )
+        data = '[{"pad": "' + "x" * 65516 + '"}, 12345.5]'
+        self.assertEqual(self.decode(data.encode())[1], 12345.5)
+
+    def test_utf8_split_across_chunks(self):
+        data = '["é€"]'.encode("utf-8")
+        self.assertEqual(self.decode(data, chunk_size=1), ["é€"])
+
+    def test_invalid(self):
+        for data in (b"", b"[1, 2", b"[1 2]", b"[1,]", b"{} {}", b'{"a": '):
+            with self.assertRaises(ValueError, msg=data):
+                self.decode(data, chunk_size=2)
+
+    def test_incremental(self):
+        fp = io.BytesIO(b'[{"a": 1}, ' + b" " * 100000 + b'{"b": 2}]')
+        values = utils.iter_json_values(fp, chunk_size=16)
+        self.assertEqual(next(values), {"a": 1})
+        self.assertLess(fp.tell(), 1000)
+        self.assertEqual(list(values), [{"b": 2}])
+
+    def test_max_size(self):
+        data = b'[{"a": 1}, "' + b"x" * 1000 + b'"]'
+        with self.assertRaises(ValueError):
+            self.decode(data, max_size=100, chunk_size=16)
+        self.assertEqual(len(self.decode(data, max_size=2000, chunk_size=16)), 2)
@@ -0,0 +1,205 @@
+from . import config, events, utils, webserver
+
+import bottle
+import hashlib
+import hmac
+import io
+import json
+import unittest
+
+SECRET = b"secret"
+
+
+class TestGHHook(unittest.TestCase):
+    def setUp(self):
+        config.load(io.StringIO("github:\n    hook_hmac_secret: secret\n"))
+        self.dispatched = []
+        self.dispatcher = events.dispatcher
+        events.dispatcher = events.Dispatcher()
+        events.dispatcher.dispatch = lambda source, evt: self.dispatched.append(evt)
+
+    def tearDown(self):
+        events.dispatcher = self.dispatcher
+
+    def request(self, payload, sha256=None, sha1=None, delivery=None):
+        env = {
+            "REQUEST_METHOD": "POST",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(payload)),
+            "HTTP_X_GITHUB_EVENT": "ping",
+            "wsgi.input": io.BytesIO(payload),
+        }
+        if sha256 is not None:
+            env["HTTP_X_HUB_SIGNATURE_256"] = sha256
+        if sha1 is not None:
+            env["HTTP_X_HUB_SIGNATURE"] = sha1
+        if delivery is not None:
+            env["HTTP_X_GITHUB_DELIVERY"] = delivery
+        bottle.request.bind(env)
+        return webserver.gh_hook()
+
+    def sign(self, payload, digest):
+        return "%s=%s" % (digest, hmac.new(SECRET, payload, digest).hexdigest())
+
+    def test_valid_signatures(self):
+        payload = b'{"zen": "hi"}'
+        self.request(payload, sha256=self.sign(payload, "sha256"))
+        self.request(payload, sha1=self.sign(payload, "sha1"))
+        self.request(
+            payload,
+            sha256=self.sign(payload, "sha256"),
+            sha1=self.sign(payload, "sha1"),
+        )
+        self.assertEqual(len(self.dispatched), 3)
+        self.assertEqual(self.dispatched[0].raw.zen, "hi")
+
+    def test_invalid_signatures(self):
+        payload = b'{"zen": "hi"}'
+        for sha256, sha1 in (
+            (None, None),
+            (self.sign(b"{}", "sha256"), None),
+            (self.sign(payload, "sha256"), self.sign(b"{}", "sha1")),
+            ("sha256=\xe2\x82\xac", None),
+        ):
+            with self.assertRaises(bottle.HTTPError) as cm:
+                self.request(payload, sha256=sha256, sha1=sha1)
+            self.assertEqual(cm.exception.status_code, 403)
+        self.assertEqual(self.dispatched, [])
+
+    def test_redelivery(self):
+        recent = webserver._RECENT_DELIVERIES
+        webserver._RECENT_DELIVERIES = {"github": utils.RecentlySeen()}
+        self.addCleanup(setattr, webserver, "_RECENT_DELIVERIES", recent)
+
+        def fail(source, evt):
+            raise RuntimeError("fail")
+
+        payload = b'{"zen": "hi"}'
+        sha256 = self.sign(payload, "sha256")
+        dispatch, events.dispatcher.dispatch = events.dispatcher.dispatch, fail
+        with self.assertRaises(RuntimeError):
+            self.request(payload, sha256=sha256, delivery="1")
+        events.dispatcher.dispatch = dispatch
+
+        # Deliveries which failed are handled again when redelivered.
+        self.request(payload, sha256=sha256, delivery="1")
+        self.request(payload, sha256=sha256, delivery="1")
+        self.assertEqual(len(self.dispatched), 1)
+
+    def test_wrong_algorithm(self):
+        with self.assertRaises(bottle.HTTPError) as cm:
+            self.request(b"{}", sha1="md5=abc")
+        self.assertEqual(cm.exception.status_code, 500)
+
+
+class TestLargeHooks(unittest.TestCase):
+    def setUp(self):
+        self.dispatched = []
+        self.dispatcher = events.dispatcher
+        events.dispatcher = events.Dispatcher()
+        events.dispatcher.dispatch = lambda source, evt: self.dispatched.append(evt)
+
+    def tearDown(self):
+        events.dispatcher = self.dispatcher
+
+    def request(self, payload):
+        bottle.request.bind(
+            {
+                "REQUEST_METHOD": "POST",
+                "CONTENT_TYPE": "application/json",
+                "CONTENT_LENGTH": str(len(payload)),
+                "wsgi.input": io.BytesIO(payload),
+            }
+        )
+
+    def test_larger_than_memfile(self):
+        padding = "x" * (2 * bottle.BaseRequest.MEMFILE_MAX)
+        self.request(json.dumps({"padding": padding}).encode())
+        webserver.buildbot_hook()
+        self.request(
+            json.dumps({"payload": {"action": "opened", "padding": padding}}).encode()
+        )
+        webserver.redmine_hook()
+        self.assertEqual(len(self.dispatched), 2)
+        self.assertEqual(self.dispatched[1].rm_type, "opened")
+
+    def test_invalid_redmine(self):
+        for payload in (b"{", b"[]", b'{"other": 1}'):
+            self.request(payload)
+            with self.assertRaises(bottle.HTTPError) as cm:
+                webserver.redmine_hook()
+            self.assertEqual(cm.exception.status_code, 400)
+
+
+class TestStatusPage(unittest.TestCase):
+    def setUp(self):
+        self.original = webserver.event_logger
+        webserver.event_logger = webserver.EventLogger()
+
+    def tearDown(self):
+        webserver.event_logger = self.original
+
+    def get(self, if_none_match=None):
+        env = {"REQUEST_METHOD": "GET", "PATH_INFO": "/"}
+        if if_none_match is not None:
+            env["HTTP_IF_NONE_MATCH"] = if_none_match
+        bottle.request.bind(env)
+        bottle.response.bind()
+        return webserver.status()
+
+    def test_render(self):
+        logger = webserver.event_logger
+        logger.push_event(events.Notification("<hello>"))
+        logger.push_event(events.Notification("x" * 10000))
+        logger.push_event(events.RawRedmineHook("opened", {"secret": "data"}))
+        page = self.get()
+        self.assertIn("&lt;hello&gt;", page)
+        self.assertNotIn("x" * logger.MAX_EVENT_LENGTH, page)
+        self.assertNotIn("secret", page)
+        self.assertIn("Recent 'notification' events", page)
+        self.assertIs(logger.status_page(), page)
+
+    def test_etag(self):
+        logger = webserver.event_logger
+        logger.push_event(events.Notification("hello"))
+        self.get()
+        etag = bottle.response.get_header("ETag")
+        self.assertEqual(self.get(etag), "")
+        self.assertEqual(bottle.response.status_code, 304)
+        self.assertEqual(self.get('"other", W/' + etag), "")
+        self.assertEqual(bottle.response.status_code, 304)
+
+        logger.push_event(events.Notification("world"))
+        self.assertIn("world", self.get(etag))
+        self.assertEqual(bottle.response.status_code, 200)
+        self.assertNotEqual(bottle.response.get_header("ETag"), etag)
+
+
+class TestEventsAPI(unittest.TestCase):
+    def setUp(self):
+        self.original = webserver.event_logger
+        webserver.event_logger = webserver.EventLogger()
+
+    def tearDown(self):
+        webserver.event_logger = self.original
+
+    def get(self, query):
+        bottle.request.bind({"REQUEST_METHOD": "GET", "QUERY_STRING": query})
+        bottle.response.bind()
+        return json.loads(webserver.api_events())
+
+    def test_query(self):
+        for pr in (1, 2, 1):
+            webserver.event_logger.push_event(
+                events.BuildStatus("o/r", "abc", "abc", "lint", pr, True, False, "", "")
+            )
+        result = self.get("pr=1&limit=1")
+        self.assertEqual([e["id"] for e in result["events"]], [1])
+        result = self.get("pr=1&since=%d" % result["next"])
+        self.assertEqual([e["id"] for e in result["events"]], [3])
+        result = self.get("pr=1&since=%d" % result["next"])
+        self.assertEqual(result, {"events": [], "next": 3})
+
+    def test_invalid(self):
+        with self.assertRaises(bottle.HTTPError):
+            self.get("pr=abc")
@@ -3,6 +3,9 @@
 from Crypto.Cipher import AES
 
 import base64
+import codecs
+import collections
+import collections.abc
 import json
 import hashlib
 import logging
@@ -48,25 +51,58 @@ class DaemonThread(threading.Thread):
 
 
 class ObjectLike:
-    """Transforms a dict-like structure into an object-like structure."""
+    """Transforms a dict-like structure into an object-like structure.
+
+    Nested dicts and lists are wrapped lazily when accessed. Wrappers are
+    memoized per key, so chained accesses like raw.repository.owner.login only
+    allocate the first time. The underlying structure is never copied.
+    """
+
+    __slots__ = ("dictlike", "_wrappers")
 
     def __init__(self, dictlike):
         self.reset(dictlike)
 
     def reset(self, dictlike):
+        if isinstance(dictlike, ObjectLike):
+            dictlike = dictlike.dictlike
         self.dictlike = dictlike
+        self._wrappers = None
+
+    def _wrap(self, name, val):
+        wrappers = self._wrappers
+        if wrappers is None:
+            wrappers = self._wrappers = {}
+        else:
+            wrapper = wrappers.get(name)
+            # The underlying value may have been replaced since it was wrapped.
+            if wrapper is not None and wrapper.wrapped() is val:
+                return wrapper
+        wrapper = ObjectLike(val) if isinstance(val, dict) else ListLike(val)
+        wrappers[name] = wrapper
+        return wrapper
+
+    def wrapped(self):
+        return self.dictlike
 
     def items(self):
         for k, v in self.dictlike.items():
-            if isinstance(v, dict):
-                yield (k, ObjectLike(v))
+            if isinstance(v, (dict, list)):
+                yield (k, self._wrap(k, v))
             else:
                 yield (k, v)
 
     def __getattr__(self, name):
         val = self.dictlike.get(name)
-        if isinstance(val, dict):
-            return ObjectLike(val)
+        if isinstance(val, (dict, list)):
+            return self._wrap(name, val)
+        else:
+            return val
+
+    def __getitem__(self, name):
+        val = self.dictlike[name]
+        if isinstance(val, (dict, list)):
+            return self._wrap(name, val)
         else:
             return val
 
@@ -79,6 +115,300 @@ class ObjectLike:
     def __repr__(self):
         return repr(self.dictlike)
 
+    def __reduce__(self):
+        return (ObjectLike, (self.dictlike,))
+
+
+class ListLike(collections.abc.Sequence):
+    """Read-only view of a list, wrapping its dict and list items the same way
+    ObjectLike does, without copying the list."""
+
+    __slots__ = ("listlike", "_wrappers")
+
+    def __init__(self, listlike):
+        self.listlike = listlike
+        self._wrappers = None
+
+    def wrapped(self):
+        return self.listlike
+
+    def __len__(self):
+        return len(self.listlike)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.listlike)))]
+        val = self.listlike[index]
+        if not isinstance(val, (dict, list)):
+            return val
+        if index < 0:
+            index += len(self.listlike)
+        wrappers = self._wrappers
+        if wrappers is None:
+            wrappers = self._wrappers = {}
+        else:
+            wrapper = wrappers.get(index)
+            if wrapper is not None and wrapper.wrapped() is val:
+                return wrapper
+        wrapper = ObjectLike(val) if isinstance(val, dict) else ListLike(val)
+        wrappers[index] = wrapper
+        return wrapper
+
+    def __iter__(self):
+        for i in range(len(self.listlike)):
+            yield self[i]
+
+    def __contains__(self, value):
+        if isinstance(value, (ObjectLike, ListLike)):
+            value = value.wrapped()
+        return value in self.listlike
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        if isinstance(other, ListLike):
+            other = other.listlike
+        return self.listlike == other
+
+    __hash__ = None
+
+    def __str__(self):
+        return str(self.listlike)
+
+    def __repr__(self):
+        return repr(self.listlike)
+
+    def __reduce__(self):
+        return (ListLike, (self.listlike,))
+
+
+class RecentlySeen:
+    """Bounded set of recently seen keys, which expire after ttl seconds.
+
+    If a path is given, keys are also appended to that file and reloaded from
+    it on creation, so that they are remembered across restarts.
+    """
+
+    def __init__(self, maxsize=10000, ttl=24 * 3600, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.keys = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.fp = None
+        self.lines = 0
+        if path is not None:
+            self._load()
+            self._compact()
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                for line in fp:
+                    ts, _, key = line.rstrip("\n").partition(" ")
+                    try:
+                        ts = float(ts)
+                    except ValueError:
+                        continue  # Truncated by a crash while writing.
+                    self.keys[key] = ts
+                    self.keys.move_to_end(key)
+        except FileNotFoundError:
+            pass
+        self._expire(time.time())
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            for key, ts in self.keys.items():
+                fp.write("%f %s\n" % (ts, key))
+        os.replace(tmp_path, self.path)
+        if self.fp is not None:
+            self.fp.close()
+        self.fp = open(self.path, "a")
+        self.lines = len(self.keys)
+
+    def _expire(self, now):
+        while self.keys:
+            key, ts = next(iter(self.keys.items()))
+            if ts > now - self.ttl and len(self.keys) <= self.maxsize:
+                break
+            del self.keys[key]
+
+    def __contains__(self, key):
+        with self.lock:
+            self._expire(time.time())
+            return key in self.keys
+
+    def add(self, key):
+        """Adds a key, returning False if it was already seen recently."""
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            if key in self.keys:
+                return False
+            self.keys[key] = now
+            if len(self.keys) > self.maxsize:
+                self.keys.popitem(last=False)
+            if self.fp is not None:
+                self.fp.write("%f %s\n" % (now, key))
+                self.fp.flush()
+                self.lines += 1
+                if self.lines > 2 * self.maxsize:
+                    self._compact()
+            return True
+
+
+class PersistentMap:
+    """Bounded mapping of string keys to JSON values, from which the least
+    recently set keys are evicted.
+
+    If a path is given, changes are also appended to that file and replayed
+    from it on creation, so that they are remembered across restarts.
+    """
+
+    def __init__(self, maxsize=10000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.values = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.fp = None
+        self.lines = 0
+        if path is not None:
+            self._load()
+            self._compact()
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                for line in fp:
+                    try:
+                        key, value = json.loads(line)
+                    except ValueError:
+                        continue  # Truncated by a crash while writing.
+                    self._set(key, value)
+        except FileNotFoundError:
+            pass
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            for item in self.values.items():
+                fp.write(json.dumps(item) + "\n")
+        os.replace(tmp_path, self.path)
+        if self.fp is not None:
+            self.fp.close()
+        self.fp = open(self.path, "a")
+        self.lines = len(self.values)
+
+    def _set(self, key, value):
+        if value is None:
+            self.values.pop(key, None)
+            return
+        self.values[key] = value
+        self.values.move_to_end(key)
+        if len(self.values) > self.maxsize:
+            self.values.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self.lock:
+            return self.values.get(key, default)
+
+    def set(self, key, value):
+        """Sets the value of a key, or removes it if value is None."""
+        with self.lock:
+            self._set(key, value)
+            if self.fp is not None:
+                self.fp.write(json.dumps([key, value]) + "\n")
+                self.fp.flush()
+                self.lines += 1
+                if self.lines > 2 * self.maxsize:
+                    self._compact()
+
+
+def iter_json_values(fp, max_size=1024 * 1024, chunk_size=64 * 1024):
+    """Decodes a JSON document from a binary file object. Yields the elements
+    of the document one by one if it is an array, otherwise the document
+    itself.
+
+    Elements are decoded as they are read, so only one is held in memory at a
+    time. Raises ValueError on invalid JSON, or if an element is larger than
+    max_size characters.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def fill(size):
+        nonlocal buf, pos, eof
+        data = fp.read(size)
+        if not data:
+            eof = True
+        buf = buf[pos:] + utf8.decode(data, final=eof)
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf) or eof:
+                return
+            fill(chunk_size)
+
+    def decode_value():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # Numbers are decoded up to the first character which cannot
+                # be part of them, which might not be the end of the number if
+                # it is cut by the end of the buffer (e.g. "12345." then "5").
+                if (
+                    eof
+                    or not isinstance(value, (int, float))
+                    or (end < len(buf) and buf[end] in " \t\r\n,]}")
+                ):
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            if len(buf) - pos > max_size:
+                raise ValueError("JSON value larger than %d characters" % max_size)
+            # Grow geometrically to avoid decoding large values quadratically.
+            fill(max(chunk_size, len(buf) - pos))
+
+    skip_whitespace()
+    if buf.startswith("[", pos):
+        pos += 1
+        skip_whitespace()
+        if buf.startswith("]", pos):
+            pos += 1
+        else:
+            while True:
+                yield decode_value()
+                skip_whitespace()
+                if buf.startswith(",", pos):
+                    pos += 1
+                    skip_whitespace()
+                elif buf.startswith("]", pos):
+                    pos += 1
+                    break
+                else:
+                    raise ValueError("Expected ',' or ']' in JSON array")
+    else:
+        yield decode_value()
+
+    skip_whitespace()
+    if pos < len(buf):
+        raise ValueError("Extra data after JSON document")
+
 
 def spawn_periodic_task(interval, f, *args, **kwargs):
     def wrapper():
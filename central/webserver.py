@@ -1,7 +1,7 @@
 """Web server module that received events from WebHooks and user interactions
 and shows a list of recent events."""
 
-from . import events, utils
+from . import eventlog, events, httpserver, sse, stats, utils
 from .config import cfg
 
 import base64
@@ -18,101 +18,338 @@ import logging
 import os
 import os.path
 import requests
+import time
 import urllib.parse
 
-# Buildbot sometimes batches events and gets rejected by the small default
-# bottle size. Increase it.
-bottle.BaseRequest.MEMFILE_MAX = 64 * 1024 * 1024  # 32MB
+# Request bodies larger than this are spooled to a temporary file instead of
+# being buffered in memory.
+bottle.BaseRequest.MEMFILE_MAX = 1024 * 1024
+# Largest JSON value decoded from a Buildbot or Redmine hook body: the limit on
+# whole request bodies before they were spooled.
+_MAX_HOOK_VALUE = 64 * 1024 * 1024
 
 
 class EventLogger(events.EventTarget):
+    """Keeps the recent events shown on the status page.
+
+    Events are rendered to (truncated) HTML once, when they arrive, and the
+    page is only rebuilt from these fragments after it changed.
+    """
+
+    # Longer event representations get truncated on the status page.
+    MAX_EVENT_LENGTH = 2000
+    HIDDEN_TYPES = eventlog.HIDDEN_TYPES
+
     def __init__(self):
         self.events = collections.deque(maxlen=25)
         self.per_type = collections.defaultdict(lambda: collections.deque(maxlen=25))
+        # Counts the received events, identifying the status page contents.
+        # Prefixed with the start time to stay unique across restarts.
+        self.epoch = "%x" % time.time_ns()
+        self.version = 0
+        self.page = (None, "")
+        # Longer history, served by /api/events. Sized in start().
+        self.history = eventlog.EventLog()
 
     def accept_event(self, evt):
         return True  # Log everything.
 
     def push_event(self, evt):
         ts = datetime.datetime.now()
-        self.events.append((ts, evt))
-        self.per_type[evt.type].append((ts, evt))
+        fragment = None
+        if evt.type not in self.HIDDEN_TYPES:
+            self.history.add(evt, ts)
+            text = "%s\t%s" % (ts.isoformat(), evt)
+            if len(text) > self.MAX_EVENT_LENGTH:
+                text = text[: self.MAX_EVENT_LENGTH] + "..."
+            fragment = html.escape(text + "\n", quote=False)
+        entry = (ts, evt, fragment)
+        self.events.append(entry)
+        self.per_type[evt.type].append(entry)
+        self.version += 1
+
+    def etag(self):
+        return '"%s-%d"' % (self.epoch, self.version)
+
+    def status_page(self):
+        """Returns the status page HTML, rendering it if events arrived since
+        it was last rendered."""
+        version = self.version
+        rendered_version, page = self.page
+        if rendered_version != version:
+            page = self.render()
+            self.page = (version, page)
+        return page
+
+    def render(self):
+        out = io.StringIO()
+        out.write(
+            '<h2 style="text-align: center; background: #0ff">Status for Dolphin Central</h2>'
+        )
+
+        def display_recent_events(l):
+            out.write("<pre>")
+            for _, _, fragment in reversed(l):
+                if fragment is not None:
+                    out.write(fragment)
+            out.write("</pre>")
+
+        out.write("<h3>Recent events</h3>")
+        display_recent_events(list(self.events))
+        for type, events in sorted(self.per_type.items()):
+            if type in self.HIDDEN_TYPES:
+                continue
+            out.write("<h3>Recent %r events</h3>" % type)
+            display_recent_events(list(events))
+
+        return out.getvalue()
 
 
 event_logger = EventLogger()
+event_stream = sse.EventStream()
+
+# Recently received hook deliveries, per source. Set up in start().
+_RECENT_DELIVERIES = {}
+
+
+def is_duplicate(source, key):
+    """Returns True if a hook delivery was already handled recently."""
+    recent = _RECENT_DELIVERIES.get(source)
+    return recent is not None and key in recent
+
+
+def mark_handled(source, key):
+    """Records a hook delivery once dispatched, so that redeliveries of
+    deliveries which failed are not dropped."""
+    recent = _RECENT_DELIVERIES.get(source)
+    if recent is not None:
+        recent.add(key)
+
+
+def body_digest():
+    """Hashes the request body, for hooks which have no delivery ID."""
+    digest = hashlib.sha256()
+    body = bottle.request.body
+    for chunk in iter(lambda: body.read(65536), b""):
+        digest.update(chunk)
+    body.seek(0)
+    return digest.hexdigest()
+
+
+@bottle.route("/api/events")
+def api_events():
+    """Returns the recent events matching the type, repo, pr and sha query
+    parameters, oldest first. Results start after the since event id, and the
+    response includes the cursor to pass as since to get the next ones."""
+    query = bottle.request.query
+    try:
+        since = int(query.since or 0)
+        limit = max(1, min(int(query.limit or 100), 1000))
+        pr = int(query.pr) if query.pr else None
+    except ValueError:
+        raise bottle.HTTPError(400, "since, limit and pr must be integers")
+
+    results = event_logger.history.query(
+        since,
+        limit,
+        type=query.type or None,
+        repo=query.repo or None,
+        pr=pr,
+        sha=query.sha or None,
+    )
+    cursor = results[-1][0] if results else since
+    bottle.response.content_type = "application/json"
+    # The events are stored serialized already.
+    return '{"events": [%s], "next": %d}' % (
+        ", ".join(data for _, data in results),
+        cursor,
+    )
+
+
+@bottle.route("/events/stream")
+def events_stream():
+    """Server-Sent Events stream of the dispatched events, optionally filtered
+    by comma separated lists of types and repos."""
+    query = bottle.request.query
+    types = frozenset(filter(None, ",".join(query.getall("type")).split(",")))
+    repos = frozenset(filter(None, ",".join(query.getall("repo")).split(",")))
+
+    detach = bottle.request.environ.get("central.detach")
+    if detach is not None:
+        event_stream.add_socket(detach(), types, repos)
+        return ""
+
+    bottle.response.content_type = "text/event-stream"
+    bottle.response.set_header("Cache-Control", "no-cache")
+    bottle.response.set_header("X-Accel-Buffering", "no")
+    return event_stream.iter_stream(types, repos)
+
+
+def not_modified(etag):
+    """Sets the response ETag, and returns True if the client has the current
+    version already (in which case the response is a 304)."""
+    bottle.response.set_header("ETag", etag)
+    if_none_match = bottle.request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == etag or candidate == "*":
+            bottle.response.status = 304
+            return True
+    return False
 
 
 @bottle.route("/")
 def status():
-    out = io.StringIO()
-    out.write(
-        '<h2 style="text-align: center; background: #0ff">Status for Dolphin Central</h2>'
+    # Clients must revalidate, which is cheap when nothing changed.
+    bottle.response.set_header("Cache-Control", "no-cache")
+    if not_modified(event_logger.etag()):
+        return ""
+    return event_logger.status_page()
+
+
+@bottle.route("/api/stats")
+def api_stats():
+    bottle.response.content_type = "application/json"
+    return json.dumps(
+        {
+            "targets": events.dispatcher.statistics(),
+            "queues": stats.queue_depths(),
+            "components": stats.component_stats(),
+        }
     )
 
-    def display_recent_events(l):
-        out.write("<pre>")
-        for ts, e in reversed(l):
-            if e.type == "raw_redmine_hook":
-                continue
-            out.write(html.escape("%s\t%s\n" % (ts.isoformat(), e), quote=False))
-        out.write("</pre>")
 
-    out.write("<h3>Recent events</h3>")
-    display_recent_events(event_logger.events)
-    for type, events in sorted(event_logger.per_type.items()):
-        if type == "raw_redmine_hook":
-            continue
-        out.write("<h3>Recent %r events</h3>" % type)
-        display_recent_events(events)
+def read_body(*consumers, max_size=None):
+    """Reads the whole request body in one pass, passing every chunk to the
+    consumers (e.g. hash updates) as it is read. Returns a bytearray.
+
+    Reads straight from the WSGI input unless bottle already buffered the
+    body, to avoid copying it first.
+    """
+    environ = bottle.request.environ
+    chunked = "chunked" in environ.get("HTTP_TRANSFER_ENCODING", "").lower()
+    if "bottle.request.body" in environ or chunked:
+        stream, remaining = bottle.request.body, None
+    else:
+        stream, remaining = environ["wsgi.input"], max(bottle.request.content_length, 0)
+        if max_size is not None and remaining > max_size:
+            raise bottle.HTTPError(413, "Request body too large")
+
+    body = bytearray()
+    while remaining is None or remaining > 0:
+        chunk = stream.read(65536 if remaining is None else min(65536, remaining))
+        if not chunk:
+            break
+        if remaining is not None:
+            remaining -= len(chunk)
+        for consume in consumers:
+            consume(chunk)
+        body += chunk
+        if max_size is not None and len(body) > max_size:
+            raise bottle.HTTPError(413, "Request body too large")
+    return body
+
 
-    return out.getvalue()
+# Signature headers sent by GitHub: (header, value prefix, digest).
+_GH_SIGNATURES = (
+    ("X-Hub-Signature-256", "sha256=", "sha256"),
+    ("X-Hub-Signature", "sha1=", "sha1"),
+)
+# GitHub caps webhook payloads to 25MB.
+_GH_MAX_PAYLOAD = 25 * 1024 * 1024
 
 
 @bottle.route("/gh/hook/", method="POST")
 def gh_hook():
-    if "X-Hub-Signature" not in bottle.request.headers:
+    secret = cfg.github.hook_hmac_secret.encode("ascii")
+    signatures = []
+    for header, prefix, digest in _GH_SIGNATURES:
+        received_sig = bottle.request.headers.get(header)
+        if received_sig is None:
+            continue
+        if not received_sig.startswith(prefix):
+            logging.error(
+                "%s not HMAC-%s (%r)" % (header, digest.upper(), received_sig)
+            )
+            raise bottle.HTTPError(500, "%s not HMAC-%s" % (header, digest.upper()))
+        signatures.append((received_sig[len(prefix) :], hmac.new(secret, None, digest)))
+    if not signatures:
         logging.error("Unsigned POST request to webhook URL.")
-        raise bottle.HTTPError(403, "Request not signed (no X-Hub-Signature)")
-    payload = bottle.request.body.read()
-    received_sig = bottle.request.headers["X-Hub-Signature"]
-    if not received_sig.startswith("sha1="):
-        logging.error("X-Hub-Signature not HMAC-SHA1 (%r)" % received_sig)
-        raise bottle.HTTPError(500, "X-Hub-Signature not HMAC-SHA1")
-    received_sig = received_sig.split("=", 1)[1]
-    computed_sig = hmac.new(
-        cfg.github.hook_hmac_secret.encode("ascii"), payload, hashlib.sha1
-    ).hexdigest()
-    if received_sig != computed_sig:
-        logging.error("Received signature %r does not match" % received_sig)
-        raise bottle.HTTPError(403, "Signature mismatch")
+        raise bottle.HTTPError(403, "Request not signed (no X-Hub-Signature-256)")
+
+    # Every signature is computed while the body is read, and the JSON is
+    # decoded from the same buffer once verified.
+    payload = read_body(
+        *(mac.update for _, mac in signatures), max_size=_GH_MAX_PAYLOAD
+    )
+    for received_sig, mac in signatures:
+        if not hmac.compare_digest(
+            received_sig.encode("utf-8"), mac.hexdigest().encode("ascii")
+        ):
+            logging.error("Received signature %r does not match" % received_sig)
+            raise bottle.HTTPError(403, "Signature mismatch")
+
+    # GitHub redelivers webhooks which timed out, with the same delivery ID.
+    delivery = bottle.request.headers.get("X-GitHub-Delivery")
+    if delivery is not None and is_duplicate("github", delivery):
+        logging.info("Dropping duplicate GitHub delivery %s", delivery)
+        return "OK"
 
     evt_type = bottle.request.headers["X-Github-Event"]
-    evt = events.RawGHHook(evt_type, bottle.request.json)
+    evt = events.RawGHHook(evt_type, json.loads(payload))
     events.dispatcher.dispatch("webserver", evt)
+    if delivery is not None:
+        mark_handled("github", delivery)
 
     return "OK"
 
 
 @bottle.route("/buildbot", method="POST")
 def buildbot_hook():
-    packet = bottle.request.json
-    if not packet:
+    digest = body_digest()
+    if is_duplicate("buildbot", digest):
+        logging.info("Dropping duplicate Buildbot hook")
+        return "OK"
+
+    # Buildbot batches packets in a JSON array, which can be large: dispatch
+    # them as they get decoded rather than parsing the whole body at once.
+    dispatched = 0
+    try:
+        for packet in utils.iter_json_values(bottle.request.body, _MAX_HOOK_VALUE):
+            if packet:
+                events.dispatcher.dispatch("webserver", events.RawBBHook(packet))
+                dispatched += 1
+    except ValueError as e:
+        logging.error("Invalid Buildbot hook payload: %s", e)
+        raise bottle.HTTPError(400, "Invalid payload")
+    if not dispatched:
         raise bottle.HTTPError(400, "Could not find any payload")
-    evt = events.RawBBHook(packet)
-    events.dispatcher.dispatch("webserver", evt)
+    mark_handled("buildbot", digest)
 
     return "OK"
 
 
 @bottle.route("/redmine/", method="POST")
 def redmine_hook():
-    packet = bottle.request.json
-    if "payload" not in packet:
+    digest = body_digest()
+    if is_duplicate("redmine", digest):
+        logging.info("Dropping duplicate Redmine hook")
+        return "OK"
+
+    # Not bottle.request.json, which rejects bodies larger than MEMFILE_MAX.
+    try:
+        packet = json.loads(read_body(max_size=_MAX_HOOK_VALUE))
+    except ValueError:
+        raise bottle.HTTPError(400, "Invalid payload")
+    if not isinstance(packet, dict) or "payload" not in packet:
         raise bottle.HTTPError(400, "Could not find payload object")
     packet = packet["payload"]
 
     evt = events.RawRedmineHook(packet["action"], packet)
     events.dispatcher.dispatch("webserver", evt)
+    mark_handled("redmine", digest)
 
     return "OK"
 
@@ -121,9 +358,45 @@ def start():
     """Starts the web server."""
     port = cfg.web.port
 
+    history = cfg.web.history or utils.ObjectLike({})
+    event_logger.history = eventlog.EventLog(
+        history.max_events or 100000, history.max_bytes or 64 * 1024 * 1024
+    )
+
     events.dispatcher.register_target(event_logger)
 
-    logging.info("Starting web server: port=%d" % port)
+    stream = cfg.web.stream or utils.ObjectLike({})
+    event_stream.max_buffer = stream.max_buffer or 256 * 1024
+    event_stream.heartbeat = stream.heartbeat or 15
+    event_stream.start()
+    events.dispatcher.register_target(event_stream)
+
+    dedup = cfg.web.dedup or utils.ObjectLike({})
+    for source in ("github", "buildbot", "redmine"):
+        path = None
+        if dedup.path:
+            os.makedirs(dedup.path, exist_ok=True)
+            path = os.path.join(dedup.path, source)
+        _RECENT_DELIVERIES[source] = utils.RecentlySeen(
+            dedup.size or 10000, dedup.ttl or 24 * 3600, path
+        )
+
+    # "threadpool" is our own server, other names are bottle server adapters
+    # (e.g. "wsgiref", "waitress", "cheroot" or "aiohttp"), which get
+    # server_options as keyword arguments.
+    server = cfg.web.server or "threadpool"
+    logging.info("Starting web server: port=%d server=%s" % (port, server))
+    options = {}
+    if server == "threadpool":
+        server = httpserver.ThreadPoolServer(
+            host=cfg.web.bind,
+            port=port,
+            workers=cfg.web.workers or 16,
+            keep_alive=cfg.web.keep_alive or 5,
+        )
+    elif cfg.web.server_options:
+        options = dict(cfg.web.server_options.wrapped())
     utils.DaemonThread(
-        target=bottle.run, kwargs={"host": cfg.web.bind, "port": cfg.web.port}
+        target=bottle.run,
+        kwargs={"server": server, "host": cfg.web.bind, "port": port, **options},
     ).start()
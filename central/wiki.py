@@ -1,7 +1,7 @@
 """Updates Dolphin's Wiki on various conditions, to e.g. keep the latest dev
 build version up to date."""
 
-from . import events, utils
+from . import events, stats, utils
 from .config import cfg
 
 import logging
@@ -18,9 +18,12 @@ class WikiUpdater:
         self.latest_dev_page = settings.latest_dev_page
 
         self.queue = queue.Queue()
+        stats.watch_queue("wiki.WikiUpdater", self.queue)
 
-    def handle_version(self, evt):
-        self.queue.put(evt)
+    def handle_version(self, evt, ack):
+        """Queues a new version event. ack is called once it has been
+        handled."""
+        self.queue.put((evt, ack))
 
     def run(self):
         site = mwclient.Site(self.host, path=self.path)
@@ -29,13 +32,15 @@ class WikiUpdater:
         logging.info("Logged in to wiki %s (username %s)", self.host, self.username)
 
         while True:
-            evt = self.queue.get()
-
-            if evt.branch != "master":
-                continue
-
-            page = site.pages[self.latest_dev_page]
-            page.edit(evt.shortrev, "Automatic update of the current git revision")
+            evt, ack = self.queue.get()
+            try:
+                if evt.branch == "master":
+                    page = site.pages[self.latest_dev_page]
+                    page.edit(
+                        evt.shortrev, "Automatic update of the current git revision"
+                    )
+            finally:
+                ack()
 
 
 class NewDevVersionListener(events.EventTarget):
@@ -43,11 +48,8 @@ class NewDevVersionListener(events.EventTarget):
         super().__init__()
         self.updater = updater
 
-    def accept_event(self, evt):
-        return evt.type == events.NewDevVersion.TYPE
-
     def push_event(self, evt):
-        self.updater.handle_version(evt)
+        self.updater.handle_version(evt, events.dispatcher.defer_ack(evt))
 
 
 def start():
@@ -58,4 +60,6 @@ def start():
     updater = WikiUpdater(cfg.wiki)
     utils.DaemonThread(target=updater.run).start()
 
-    events.dispatcher.register_target(NewDevVersionListener(updater))
+    events.dispatcher.register_target(
+        NewDevVersionListener(updater), [events.NewDevVersion.TYPE]
+    )